@@ -0,0 +1,6 @@
+"""
+Module benchmarks.
+Contains scripts measuring the performance of the network algorithms on the real data.
+Each script is run from the repository root, e.g.
+    python -m benchmarks.route_aware
+"""
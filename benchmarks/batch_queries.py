@@ -0,0 +1,58 @@
+"""
+Benchmark of the batch queries answered by a pool of worker processes over shared memory.
+Reports the throughput of a batch of random queries for an increasing number of worker processes, against
+the same batch answered in this process, and checks that the paths agree.
+    python -m benchmarks.batch_queries [--queries 2000] [--processes 1 2 4] [--engine ch]
+"""
+import argparse
+import math
+import os
+import random
+import time
+
+from network.bus import BusNetwork
+from network.shortest_paths import NetworkBidirectionalDijkstra, NetworkSpatialAStar
+from network.shortest_paths.contraction_hierarchies import NetworkContractionHierarchiesLazyED, NetworkHubLabels
+
+ENGINES = {
+    'bidirectional':    NetworkBidirectionalDijkstra.from_net,
+    'a_star':           NetworkSpatialAStar.from_net,
+    'ch':               NetworkContractionHierarchiesLazyED.from_net,
+    'hub_labels':       lambda net: NetworkHubLabels.from_hierarchy(NetworkContractionHierarchiesLazyED.from_net(net)),
+}
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--queries', type=int, default=2000)
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--engine', choices=list(ENGINES), default='ch')
+    parser.add_argument('--chunk-size', type=int, default=256)
+    parser.add_argument('--seed', type=int, default=162)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    net = BusNetwork.from_ndjsons()
+    engine = ENGINES[args.engine](net)
+    nodes = list(net.nodes)
+    queries = [(random.choice(nodes), random.choice(nodes)) for _ in range(args.queries)]
+    print('{} queries, {} engine, {} CPUs'.format(args.queries, args.engine, os.cpu_count()))
+
+    start = time.perf_counter()
+    expected = list(engine.batch_paths(queries, processes=1))
+    base_time = time.perf_counter() - start
+    print('  in process: {:.2f}s ({:.0f} queries/s)'.format(base_time, args.queries / base_time))
+
+    for processes in args.processes:
+        if processes == 1:
+            continue
+        start = time.perf_counter()
+        results = list(engine.batch_paths(queries, processes=processes, chunk_size=args.chunk_size))
+        batch_time = time.perf_counter() - start
+        mismatches = sum(
+            not (dist == dist_ref or math.isclose(dist, dist_ref, rel_tol=1e-12))
+            or [connector.ends for connector in path] != [connector.ends for connector in path_ref]
+            for (dist, path), (dist_ref, path_ref) in zip(results, expected)
+        )
+        print('  {} processes: {:.2f}s ({:.0f} queries/s, speedup {:.2f}); {} mismatching paths'.format(
+            processes, batch_time, args.queries / batch_time, base_time / batch_time, mismatches
+        ))
@@ -0,0 +1,44 @@
+"""
+Benchmark of the many-to-many distance matrices of a contraction hierarchy.
+Reports the time of a matrix between random sources and targets against the time of one query per pair
+(estimated on a sample), and checks that the shortest path lengths agree.
+    python -m benchmarks.ch_matrix [--sources 1000] [--targets 1000] [--processes N]
+"""
+import argparse
+import math
+import random
+import time
+
+from network.bus import BusNetwork
+from network.shortest_paths.contraction_hierarchies import NetworkContractionHierarchiesLazyED
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sources', type=int, default=1000)
+    parser.add_argument('--targets', type=int, default=1000)
+    parser.add_argument('--processes', type=int, default=None)
+    parser.add_argument('--samples', type=int, default=2000)
+    parser.add_argument('--seed', type=int, default=162)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    net = BusNetwork.from_ndjsons()
+    ch = NetworkContractionHierarchiesLazyED.from_net(net)
+    nodes = list(net.nodes)
+    sources = [random.choice(nodes) for _ in range(args.sources)]
+    targets = [random.choice(nodes) for _ in range(args.targets)]
+
+    start = time.perf_counter()
+    matrix = ch.matrix(sources, targets, processes=args.processes)
+    matrix_time = time.perf_counter() - start
+
+    pairs = [(random.randrange(args.sources), random.randrange(args.targets)) for _ in range(args.samples)]
+    start = time.perf_counter()
+    dists = [ch.dist(sources[i], targets[j]) for i, j in pairs]
+    pair_time = (time.perf_counter() - start) / args.samples * args.sources * args.targets
+    mismatches = sum(
+        not (dist == matrix[i, j] or math.isclose(dist, matrix[i, j], rel_tol=1e-12))
+        for (i, j), dist in zip(pairs, dists)
+    )
+    print('{}x{} matrix: {:.2f}s (one query per pair: {:.1f}s, estimated); {} mismatching lengths in {} samples'
+          .format(args.sources, args.targets, matrix_time, pair_time, mismatches, args.samples))
@@ -0,0 +1,58 @@
+"""
+Benchmark of the node ordering heuristics of the contraction hierarchies.
+Reports, for every heuristic, the build time, the number of shortcuts and the search space of the queries
+(settled nodes per query, on average and at worst).
+    python -m benchmarks.ch_ordering [--queries 1000] [--local-steps N] [--hop-limit N] [--update-every-after 100]
+"""
+import argparse
+import random
+import time
+
+from network.bus import BusNetwork
+from network.shortest_paths.contraction_hierarchies import \
+    NetworkContractionHierarchiesRandom, \
+    NetworkContractionHierarchiesPeriodicED, \
+    NetworkContractionHierarchiesLazyED, \
+    NetworkContractionHierarchiesNeighbourED, \
+    NetworkContractionHierarchiesNestedDissection
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--queries', type=int, default=1000)
+    parser.add_argument('--local-steps', type=int, default=None)
+    parser.add_argument('--hop-limit', type=int, default=None)
+    parser.add_argument('--update-every-after', type=int, default=100)
+    parser.add_argument('--seed', type=int, default=162)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    net = BusNetwork.from_ndjsons()
+    nodes = list(net.nodes)
+    queries = [tuple(random.sample(nodes, 2)) for _ in range(args.queries)]
+
+    heuristics = {
+        'random':       (NetworkContractionHierarchiesRandom, {}),
+        'periodic ED':  (NetworkContractionHierarchiesPeriodicED, {'update_every_after': args.update_every_after}),
+        'lazy ED':      (NetworkContractionHierarchiesLazyED, {}),
+        'neighbour':    (NetworkContractionHierarchiesNeighbourED, {}),
+        'nested diss.': (NetworkContractionHierarchiesNestedDissection, {}),
+    }
+
+    rows = []
+    for name, (ch_type, kwargs) in heuristics.items():
+        start = time.perf_counter()
+        ch = ch_type.from_net(net, local_steps=args.local_steps, hop_limit=args.hop_limit, **kwargs)
+        build_time = time.perf_counter() - start
+
+        settled = []
+        start = time.perf_counter()
+        for src, dest in queries:
+            ch.dist(src, dest)
+            settled.append(ch.settled)
+        query_time = (time.perf_counter() - start) * 1000 / len(queries)
+        rows.append((name, build_time, ch.no_shortcuts, sum(settled) / len(settled), max(settled), query_time))
+
+    print('{:<12} {:>10} {:>10} {:>14} {:>12} {:>10}'.format(
+        'heuristic', 'build (s)', 'shortcuts', 'settled (avg)', 'settled (max)', 'query (ms)'))
+    for row in rows:
+        print('{:<12} {:>10.1f} {:>10} {:>14.1f} {:>12} {:>10.3f}'.format(*row))
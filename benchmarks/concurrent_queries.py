@@ -0,0 +1,101 @@
+"""
+Stress test of the query engines shared between threads.
+Every engine answers the same queries serially, then from a thread pool sharing the engine; each query
+reports its length, its path (as connector ids) and the size of its search space, read in the querying thread
+right after the query. Reports the number of concurrent results differing from the serial ones.
+    python -m benchmarks.concurrent_queries [--queries 300] [--threads 8] [--rounds 3]
+"""
+import argparse
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from network.bus import BusNetwork
+from network.shortest_paths import \
+    NetworkDijkstra, \
+    NetworkDijkstraSingleDestination, \
+    NetworkDijkstraOneToMany, \
+    NetworkBidirectionalDijkstra, \
+    NetworkSpatialAStar, \
+    NetworkRouteAwareDijkstra, \
+    NetworkTimeDependentBidirectionalDijkstra
+from network.shortest_paths.contraction_hierarchies import NetworkContractionHierarchiesLazyED, NetworkHubLabels
+
+def path_query(engine):
+    """
+    Returns a query running engine.path(src, dest).
+    """
+    def run(src, dest):
+        dist, path = engine.path(src, dest)
+        return dist, tuple(id(connector) for connector in path), len(engine.search_space)
+    return run
+
+def dijkstra_query(engine, net):
+    """
+    Returns a query running engine.from_src(net, src), then reading the distance and the path to dest.
+    """
+    def run(src, dest):
+        engine.from_src(net, src)
+        path = engine.path_to(dest)
+        return engine.dists.get(dest), tuple(id(connector) for connector in path), len(engine.search_space)
+    return run
+
+def one_to_many_query(engine, targets):
+    """
+    Returns a query running engine.to_many(src, targets + [dest]), then reading the path to dest.
+    """
+    def run(src, dest):
+        dists = engine.to_many(src, targets + [dest])
+        return tuple(dists.tolist()), tuple(id(connector) for connector in engine.path_to(dest))
+    return run
+
+def ch_query(ch):
+    """
+    Returns a query running ch.path(src, dest), then reading the number of settled nodes.
+    """
+    def run(src, dest):
+        dist, path = ch.path(src, dest)
+        return dist, tuple(id(connector) for connector in path), ch.settled
+    return run
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--queries', type=int, default=300)
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--seed', type=int, default=162)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    net = BusNetwork.from_ndjsons()
+    nodes = list(net.nodes)
+    queries = [tuple(random.sample(nodes, 2)) for _ in range(args.queries)]
+    ch = NetworkContractionHierarchiesLazyED.from_net(net, unpack_cache_size=256)
+    labels = NetworkHubLabels.from_hierarchy(ch)
+
+    engines = {
+        'Dijkstra':             dijkstra_query(NetworkDijkstra(), net),
+        'single destination':   path_query(NetworkDijkstraSingleDestination.from_net(net)),
+        'one-to-many':          one_to_many_query(NetworkDijkstraOneToMany.from_net(net), random.sample(nodes, 20)),
+        'bidirectional':        path_query(NetworkBidirectionalDijkstra.from_net(net)),
+        'A*':                   path_query(NetworkSpatialAStar.from_net(net)),
+        'route-aware':          path_query(NetworkRouteAwareDijkstra.from_net(net, transfer_penalty=5.0)),
+        'time-dependent':       path_query(NetworkTimeDependentBidirectionalDijkstra.from_net(net)),
+        'CH':                   ch_query(ch),
+        'hub labels':           labels.dist,
+    }
+
+    print('{:<20} {:>12} {:>14} {:>12}'.format('engine', 'serial (s)', 'threads (s)', 'mismatches'))
+    for name, run in engines.items():
+        start = time.perf_counter()
+        serial = [run(src, dest) for src, dest in queries]
+        serial_time = time.perf_counter() - start
+
+        mismatches = 0
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as pool:
+            for _ in range(args.rounds):
+                results = list(pool.map(lambda query: run(*query), queries))
+                mismatches += sum(result != expected for result, expected in zip(results, serial))
+        threads_time = (time.perf_counter() - start) / args.rounds
+        print('{:<20} {:>12.2f} {:>14.2f} {:>12}'.format(name, serial_time, threads_time, mismatches))
@@ -0,0 +1,48 @@
+"""
+Benchmark of the hub labels against the contraction hierarchy they are computed from.
+Reports the label sizes, the memory used and the build time, the average query time of both (labels in memory
+and memory-mapped), and checks that the shortest path lengths agree.
+    python -m benchmarks.hub_labels [--queries 10000] [--directory hub_labels]
+"""
+import argparse
+import math
+import random
+import time
+
+from network.bus import BusNetwork
+from network.shortest_paths.contraction_hierarchies import NetworkContractionHierarchiesLazyED, NetworkHubLabels
+
+def timed(queries, run):
+    """
+    Returns the results of run(src, dest) over the queries and the average query time, in microseconds.
+    """
+    start = time.perf_counter()
+    results = [run(src, dest) for src, dest in queries]
+    return results, (time.perf_counter() - start) * 10 ** 6 / len(queries)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--queries', type=int, default=10000)
+    parser.add_argument('--directory', type=str, default='hub_labels')
+    parser.add_argument('--seed', type=int, default=162)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    net = BusNetwork.from_ndjsons()
+    ch = NetworkContractionHierarchiesLazyED.from_net(net)
+    labels = NetworkHubLabels.from_hierarchy(ch)
+    print(labels.report())
+    labels.save(args.directory)
+    mapped = NetworkHubLabels.load(args.directory, ch)
+
+    nodes = list(net.nodes)
+    queries = [tuple(random.sample(nodes, 2)) for _ in range(args.queries)]
+    results_ch, time_ch = timed(queries, ch.dist)
+    results_labels, time_labels = timed(queries, labels.dist)
+    results_mapped, time_mapped = timed(queries, mapped.dist)
+    mismatches = sum(
+        not (math.isclose(dist_ch, dist_labels, rel_tol=1e-12) and dist_labels == dist_mapped)
+        for dist_ch, dist_labels, dist_mapped in zip(results_ch, results_labels, results_mapped)
+    )
+    print('Average query time: {:.1f}us (hierarchy) -> {:.1f}us (labels), {:.1f}us (memory-mapped labels); '
+          '{} mismatching lengths'.format(time_ch, time_labels, time_mapped, mismatches))
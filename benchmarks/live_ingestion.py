@@ -0,0 +1,103 @@
+"""
+Benchmark of the live travel-time ingestion throughput.
+Synthetic vehicles drive along every bus variant at random speeds and report their (noisy) positions;
+the records are written to a newline-delimited JSON file, then replayed into NetworkLiveTravelTimes.
+    python -m benchmarks.live_ingestion [--vehicles 20] [--interval 15]
+"""
+import argparse
+import json
+import math
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+
+from network.bus import BusNetwork
+from network.live import NetworkLiveTravelTimes, NetworkPositionRecord, records_from_file
+
+def route_polylines(net: BusNetwork) -> dict:
+    """
+    Returns, for every variant, the concatenated real paths of its connectors in travelling order.
+    """
+    connectors_of = defaultdict(dict)
+    for connectors in net.adjs.values():
+        for connector in connectors:
+            connectors_of[connector.route_ids].setdefault(connector.src, connector)
+
+    polylines = {}
+    for route_ids, by_src in connectors_of.items():
+        dests = {connector.dest for connector in by_src.values()}
+        node = next((src for src in by_src if src not in dests), next(iter(by_src)))
+        polyline, seen = [], set()
+        while node in by_src and node not in seen:
+            seen.add(node)
+            polyline.extend(by_src[node].real_path)
+            node = by_src[node].dest
+        polylines[route_ids] = polyline
+    return polylines
+
+def drive(route_ids, polyline, vehicle: str, interval: float, noise: float):
+    """
+    Yields the position records of one vehicle driving along a polyline.
+    """
+    timestamp, speed = random.uniform(0, 3600), random.uniform(3, 12)
+    travelled, target = 0.0, 0.0
+    for (x1, y1), (x2, y2) in zip(polyline, polyline[1:]):
+        length = math.dist((x1, y1), (x2, y2))
+        while target <= travelled + length and length > 0:
+            t = (target - travelled) / length
+            yield NetworkPositionRecord(
+                route_ids = route_ids, timestamp = timestamp, vehicle = vehicle, position = (
+                    x1 + t * (x2 - x1) + random.gauss(0, noise), y1 + t * (y2 - y1) + random.gauss(0, noise)
+                )
+            )
+            timestamp += interval
+            target += speed * interval
+        travelled += length
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--vehicles', type=int, default=5, help='vehicles per variant')
+    parser.add_argument('--interval', type=float, default=15.0, help='seconds between two reports')
+    parser.add_argument('--noise', type=float, default=5.0, help='GPS noise, in metres')
+    parser.add_argument('--seed', type=int, default=162)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    net = BusNetwork.from_ndjsons()
+
+    start = time.perf_counter()
+    live = NetworkLiveTravelTimes(net)
+    print('Index built in {:.2f} s'.format(time.perf_counter() - start))
+
+    records = [
+        record
+        for route_ids, polyline in route_polylines(net).items()
+        for vehicle in range(args.vehicles)
+        for record in drive(route_ids, polyline, '{}-{}-{}'.format(*route_ids, vehicle), args.interval, args.noise)
+    ]
+    records.sort(key=lambda record: record.timestamp)
+
+    with tempfile.TemporaryDirectory() as directory:
+        file = os.path.join(directory, 'records.json')
+        with open(file, 'w', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record.to_dict()) + '\n')
+
+        start = time.perf_counter()
+        count = live.ingest_many(records)
+        elapsed = time.perf_counter() - start
+        print('In memory: {} records in {:.2f} s, {:.0f} records/s'.format(count, elapsed, count / elapsed))
+
+        live.reset_trackers()
+        start = time.perf_counter()
+        count = live.ingest_many(records_from_file(file), publish_every=10000)
+        elapsed = time.perf_counter() - start
+        print('From file: {} records in {:.2f} s, {:.0f} records/s (publishing every 10000)'.format(
+            count, elapsed, count / elapsed))
+
+    start = time.perf_counter()
+    snapshot = live.publish()
+    print('Snapshot v{} published in {:.2f} ms'.format(snapshot.version, (time.perf_counter() - start) * 1000))
+    print('Stats: {}'.format(live.stats))
@@ -0,0 +1,58 @@
+"""
+Benchmark of the HMM map-matcher on synthetic GPS traces.
+Reports the matching throughput (points per second), sequentially and over worker processes,
+and the peak memory of a sequential replay.
+    python -m benchmarks.map_matching [--traces 200] [--processes 4]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from network.bus import BusNetwork
+from network.map_matching import NetworkMapMatcher
+from benchmarks.live_ingestion import route_polylines, drive
+
+def synthetic_traces(net: BusNetwork, count: int, interval: float, noise: float):
+    """
+    Yields (trace id, trace) pairs of vehicles driving along random variants.
+    """
+    polylines = route_polylines(net)
+    routes = sorted(polylines)
+    for trace_id in range(count):
+        route_ids = random.choice(routes)
+        records = drive(route_ids, polylines[route_ids], str(trace_id), interval, noise)
+        yield trace_id, [(record.timestamp, record.position) for record in records]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--traces', type=int, default=200)
+    parser.add_argument('--interval', type=float, default=15.0)
+    parser.add_argument('--noise', type=float, default=5.0)
+    parser.add_argument('--processes', type=int, default=4)
+    parser.add_argument('--seed', type=int, default=162)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    net = BusNetwork.from_ndjsons()
+    matcher = NetworkMapMatcher(net)
+    traces = list(synthetic_traces(net, args.traces, args.interval, args.noise))
+    points = sum(len(trace) for _, trace in traces)
+
+    start = time.perf_counter()
+    edges = sum(len(matcher.match(trace)) for _, trace in traces)
+    elapsed = time.perf_counter() - start
+    print('Sequential: {} points, {} matched edges, {:.0f} points/s'.format(points, edges, points / elapsed))
+
+    tracemalloc.start()
+    for _, trace in traces:
+        matcher.match(trace)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print('Sequential replay peak memory: {:.1f} MiB'.format(peak / 2 ** 20))
+
+    start = time.perf_counter()
+    edges = sum(len(matched) for _, matched in matcher.match_many(traces, processes=args.processes))
+    elapsed = time.perf_counter() - start
+    print('{} processes: {} matched edges, {:.0f} points/s (worker start-up included)'.format(
+        args.processes, edges, points / elapsed))
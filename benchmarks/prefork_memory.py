@@ -0,0 +1,54 @@
+"""
+Memory of pre-fork serving.
+Loads the snapshot once, forks the workers (see ServerPrefork), drives them with concurrent clients, then
+reports the resident (RSS), proportional (PSS) and unique (USS) memory of the master and of every worker.
+N servers loading the snapshot each would hold about N times the RSS of the master; pre-forked workers only
+add their USS. Run with --no-freeze to compare with plain forking (no compaction, no gc.freeze()).
+    python -m benchmarks.prefork_memory [--workers 4] [--requests 4000] [--endpoint mixed] [--no-freeze]
+"""
+import argparse
+import asyncio
+import random
+
+from benchmarks.server_load import make_targets, percentile, run, wait_ready
+from server import ServerPrefork, process_memory
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--snapshot', default='snapshot.pkl')
+    parser.add_argument('--port', type=int, default=8766)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--requests', type=int, default=4000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--endpoint', choices=['path', 'distance', 'nearest', 'search', 'mixed'], default='mixed')
+    parser.add_argument('--no-freeze', action='store_true')
+    parser.add_argument('--seed', type=int, default=162)
+    args = parser.parse_args()
+
+    prefork = ServerPrefork.load(args.snapshot, args.workers, freeze=not args.no_freeze)
+    master = process_memory()
+    random.seed(args.seed)
+    # pylint: disable=protected-access
+    all_targets = make_targets(args.endpoint, list(prefork._server._snapshot.net.nodes.values()), args.requests)
+
+    prefork.start('127.0.0.1', args.port)
+    try:
+        asyncio.run(wait_ready('127.0.0.1', args.port, timeout=60))
+        all_latencies, no_failures, total_time = asyncio.run(
+            run('127.0.0.1', args.port, all_targets, args.concurrency)
+        )
+        print('{} {} requests, {} workers{}: {:.0f} requests/s, p50 {:.1f} ms, p99 {:.1f} ms, {} failed'.format(
+            args.requests, args.endpoint, args.workers, ' (not frozen)' if args.no_freeze else '',
+            args.requests / total_time, 1000 * percentile(all_latencies, 50), 1000 * percentile(all_latencies, 99),
+            no_failures
+        ))
+        print(prefork.report())
+        memory = [item for pid, item in prefork.memory().items() if pid in prefork.pids and item is not None]
+        if master is not None and memory:
+            print('{} independent servers: ~{:.1f} MiB; pre-forked: {:.1f} MiB (master) + {:.1f} MiB '
+                  '(workers uss)'.format(
+                args.workers, args.workers * master['rss'] / 2 ** 20, master['rss'] / 2 ** 20,
+                sum(item['uss'] for item in memory) / 2 ** 20
+            ))
+    finally:
+        prefork.stop()
@@ -0,0 +1,67 @@
+"""
+Benchmark of the query graph (parallel-edge deduplication and chain compression) against the bus network.
+Reports the sizes of both graphs, the search space of bidirectional Dijkstra between nodes kept by the query
+graph, the average query time between any nodes, and checks that the shortest path lengths agree.
+    python -m benchmarks.query_graph [--queries 500]
+"""
+import argparse
+import math
+import random
+import time
+
+from network.bus import BusNetwork
+from network.query_graph import NetworkQueryGraph, NetworkQueryGraphSearch
+from network.shortest_paths import NetworkBidirectionalDijkstra
+
+def no_edges(net) -> int:
+    """
+    Returns the number of edges of a network.
+    """
+    return sum(len(net.adjs[node]) for node in net.nodes)
+
+def timed(queries, run):
+    """
+    Returns the results of run(src, dest) over the queries and the average query time, in milliseconds.
+    """
+    start = time.perf_counter()
+    results = [run(src, dest) for src, dest in queries]
+    return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--seed', type=int, default=162)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    net = BusNetwork.from_ndjsons()
+    start = time.perf_counter()
+    graph = NetworkQueryGraph.from_net(net)
+    print('Query graph built in {:.3f}s: {} -> {} nodes, {} -> {} edges ({} parallel edges, {} chains)'.format(
+        time.perf_counter() - start, len(net), len(graph), no_edges(net), no_edges(graph),
+        graph.no_parallel_edges, len(graph.chains)))
+
+    engine = NetworkBidirectionalDijkstra.from_net(net)
+    search = NetworkQueryGraphSearch.from_net(graph, NetworkBidirectionalDijkstra)
+
+    kept = list(graph.nodes)
+    sizes_net, sizes_graph = [], []
+    for _ in range(args.queries):
+        src, dest = random.sample(kept, 2)
+        engine.path(src, dest)
+        sizes_net.append(len(engine.search_space))
+        search.engine.path(src, dest)
+        sizes_graph.append(len(search.engine.search_space))
+    print('Search space between kept nodes: {:.0f} -> {:.0f} nodes on average'.format(
+        sum(sizes_net) / args.queries, sum(sizes_graph) / args.queries))
+
+    nodes = list(net.nodes)
+    queries = [tuple(random.sample(nodes, 2)) for _ in range(args.queries)]
+    results_net, time_net = timed(queries, engine.path)
+    results_graph, time_graph = timed(queries, search.path)
+    mismatches = sum(
+        not math.isclose(dist_net, dist_graph, rel_tol=1e-12)
+        for (dist_net, _), (dist_graph, _) in zip(results_net, results_graph)
+    )
+    print('Average query time between any nodes: {:.2f}ms -> {:.2f}ms; {} mismatching lengths'.format(
+        time_net, time_graph, mismatches))
@@ -0,0 +1,78 @@
+"""
+Result cache of shortest path queries.
+Replays a skewed workload (stop pairs drawn from a Zipf distribution over a set of distinct pairs, as chat
+sessions and API clients repeat popular pairs) against a contraction hierarchy, uncached then behind a
+NetworkCachedEngine, and reports the time per query and the hit rate. With --store, a second cache sharing the
+same SQLite file replays the workload, as another worker process would.
+    python -m benchmarks.result_cache [--queries 20000] [--pairs 2000] [--zipf 1.1] [--cache-size 100000]
+                                      [--ttl SECONDS] [--store cache.sqlite] [--paths]
+"""
+import argparse
+import math
+import os
+import random
+import time
+
+from network.shortest_paths.cache import NetworkCachedEngine, NetworkResultCache, NetworkResultStore
+from server import ServerSnapshot
+
+def zipf_workload(ids: list[int], no_pairs: int, no_queries: int, s: float) -> list[tuple[int, int]]:
+    """
+    Returns queries drawn from no_pairs distinct pairs, the k-th most popular with weight 1 / k^s.
+    """
+    pairs = [tuple(random.sample(ids, 2)) for _ in range(no_pairs)]
+    weights = [1 / (k + 1) ** s for k in range(no_pairs)]
+    return random.choices(pairs, weights, k=no_queries)
+
+def replay(engine, queries: list[tuple[int, int]], paths: bool) -> tuple[float, list]:
+    """
+    Answers the queries, then returns the total time and the lengths.
+    """
+    query = engine.path if paths else engine.dist
+    start = time.perf_counter()
+    results = [query(src, dest) for src, dest in queries]
+    return time.perf_counter() - start, [result[0] if paths else result for result in results]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--snapshot', default='snapshot.pkl')
+    parser.add_argument('--queries', type=int, default=20000)
+    parser.add_argument('--pairs', type=int, default=2000)
+    parser.add_argument('--zipf', type=float, default=1.1)
+    parser.add_argument('--cache-size', type=int, default=100_000)
+    parser.add_argument('--ttl', type=float, default=None)
+    parser.add_argument('--store', default=None)
+    parser.add_argument('--paths', action='store_true')
+    parser.add_argument('--seed', type=int, default=162)
+    args = parser.parse_args()
+
+    snapshot = ServerSnapshot.load_or_build(args.snapshot)
+    random.seed(args.seed)
+    all_queries = zipf_workload(list(snapshot.net.nodes), args.pairs, args.queries, args.zipf)
+    kind = 'paths' if args.paths else 'distances'
+
+    uncached_time, expected = replay(snapshot.ch, all_queries, args.paths)
+    print('uncached: {} {} in {:.2f}s, {:.1f} us/query'.format(
+        args.queries, kind, uncached_time, 1e6 * uncached_time / args.queries
+    ))
+
+    store = None
+    if args.store:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.store + suffix):
+                os.remove(args.store + suffix)
+        store = NetworkResultStore(args.store, ttl=args.ttl)
+
+    runs = [('cached', NetworkResultCache(args.cache_size, ttl=args.ttl, store=store))]
+    if store is not None:
+        runs.append(('second worker', NetworkResultCache(args.cache_size, ttl=args.ttl, store=store)))
+    for label, cache in runs:
+        cached = NetworkCachedEngine(snapshot.ch, cache, name='ch')
+        cached_time, results = replay(cached, all_queries, args.paths)
+        mismatches = sum(not math.isclose(a, b, rel_tol=1e-12) for a, b in zip(results, expected))
+        stats = cached.stats
+        print('{}: {:.2f}s, {:.1f} us/query ({:.1f}x), hit rate {:.1%} ({} from the store), '
+              '{} entries, {:.1f} MiB, {} mismatches'.format(
+            label, cached_time, 1e6 * cached_time / args.queries, uncached_time / cached_time, stats['hit_rate'],
+            stats['store_hits'], stats['entries'], stats['bytes'] / 2 ** 20, mismatches
+        ))
@@ -0,0 +1,64 @@
+"""
+Benchmark of the implicit route-aware expansion against its naive materialisation.
+Reports the memory used by each representation and the average query time.
+    python -m benchmarks.route_aware [--queries 200] [--transfer-penalty 5] [--boarding-cost 2]
+"""
+import argparse
+import random
+import time
+import tracemalloc
+
+from network.bus import BusNetwork
+from network.shortest_paths import NetworkDijkstraSingleDestination
+from network.shortest_paths.route_aware import NetworkRouteAwareDijkstra, NetworkRouteAwareSpatialAStar
+
+def traced(build):
+    """
+    Returns the result of build() and the memory allocated while running it, in bytes.
+    """
+    tracemalloc.start()
+    result = build()
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, size
+
+def timed(queries, run):
+    """
+    Returns the results of run(src, dest) over the queries and the average query time, in milliseconds.
+    """
+    start = time.perf_counter()
+    results = [run(src, dest) for src, dest in queries]
+    return results, (time.perf_counter() - start) * 1000 / len(queries)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--transfer-penalty', type=float, default=5.0)
+    parser.add_argument('--boarding-cost', type=float, default=2.0)
+    parser.add_argument('--seed', type=int, default=162)
+    args = parser.parse_args()
+
+    net = BusNetwork.from_ndjsons()
+    random.seed(args.seed)
+    nodes = list(net.nodes)
+    queries = [(random.choice(nodes), random.choice(nodes)) for _ in range(args.queries)]
+    costs = {'transfer_penalty': args.transfer_penalty, 'boarding_cost': args.boarding_cost}
+
+    net.csr()
+    dijkstra, implicit_size = traced(lambda: NetworkRouteAwareDijkstra.from_net(net, **costs))
+    a_star = NetworkRouteAwareSpatialAStar.from_net(net, **costs)
+    (expanded, start_of, sink_of), expanded_size = traced(dijkstra.materialise)
+    naive = NetworkDijkstraSingleDestination.from_net(expanded)
+
+    implicit_results, implicit_ms = timed(queries, dijkstra.path)
+    a_star_results, a_star_ms = timed(queries, a_star.path)
+    naive_results, naive_ms = timed(queries, lambda src, dest: naive.path(start_of(src), sink_of(dest)))
+
+    for (d1, _), (d2, _), (d3, _) in zip(implicit_results, a_star_results, naive_results):
+        assert abs(d1 - d2) < 1e-6 and abs(d1 - d3) < 1e-6, (d1, d2, d3)
+
+    print('Stops: {}, connectors: {}, routes: {}'.format(len(net), net.csr().no_edges, len(dijkstra.route_ids)))
+    print('Implicit expansion:     {:10.1f} KiB, {:8.3f} ms/query (Dijkstra), {:8.3f} ms/query (A*)'.format(
+        (implicit_size + net.csr().nbytes()) / 1024, implicit_ms, a_star_ms))
+    print('Materialised expansion: {:10.1f} KiB, {:8.3f} ms/query ({} states, {} edges)'.format(
+        expanded_size / 1024, naive_ms, len(expanded), sum(expanded.degrees())))
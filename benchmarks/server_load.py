@@ -0,0 +1,155 @@
+"""
+Load generator of the bus network server.
+Concurrent clients, each on a keep-alive connection, send requests for random stop pairs (or positions,
+or search queries) as fast as they are answered. Reports the throughput, the p50/p99 latencies and the
+average micro-batch size reported by the server. Without --url, a server is started locally for the run.
+    python -m benchmarks.server_load [--url http://127.0.0.1:8080] [--requests 2000] [--concurrency 32]
+                                     [--endpoint path|distance|nearest|search|mixed] [--processes 1]
+"""
+import argparse
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+from urllib.parse import urlencode, urlsplit
+
+from server import ServerSnapshot
+
+async def request(reader: asyncio.StreamReader, writer: asyncio.StreamWriter, target: str) -> tuple[int, dict]:
+    """
+    Sends a GET request on a keep-alive connection, then returns the status and the JSON body of the response.
+    """
+    writer.write('GET {} HTTP/1.1\r\nHost: localhost\r\n\r\n'.format(target).encode('latin-1'))
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        key, _, value = line.decode('latin-1').partition(':')
+        if key.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length))
+
+def make_targets(endpoint: str, stops: list, count: int) -> list[str]:
+    """
+    Returns the targets of random requests of an endpoint.
+    """
+    def target(kind: str) -> str:
+        if kind in ('path', 'distance'):
+            src, dest = random.sample(stops, 2)
+            return '/{}?{}'.format(kind, urlencode({'src': src.stop_id, 'dest': dest.stop_id}))
+        stop = random.choice(stops)
+        if kind == 'nearest':
+            return '/nearest?' + urlencode({
+                'lat': stop.latitude + random.uniform(-0.005, 0.005),
+                'lng': stop.longtitude + random.uniform(-0.005, 0.005), 'k': 5
+            })
+        return '/stops/search?' + urlencode({'q': stop.name.split()[-1] if stop.name else ''})
+
+    kinds = ['path', 'distance', 'nearest', 'search'] if endpoint == 'mixed' else [endpoint]
+    return [target(random.choice(kinds)) for _ in range(count)]
+
+async def run(host: str, port: int, targets: list[str], concurrency: int) -> tuple[list[float], int, float]:
+    """
+    Sends the requests from concurrent clients, then returns the latencies, the number of failed requests
+    and the total time.
+    """
+    queue = list(reversed(targets))
+    latencies, failures = [], 0
+
+    async def client():
+        nonlocal failures
+        reader, writer = await asyncio.open_connection(host, port)
+        while queue:
+            target = queue.pop()
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, target)
+            latencies.append(time.perf_counter() - start)
+            failures += status != 200
+        writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    return latencies, failures, time.perf_counter() - start
+
+async def stats(host: str, port: int) -> dict:
+    """
+    Returns the health report of the server.
+    """
+    reader, writer = await asyncio.open_connection(host, port)
+    _, obj = await request(reader, writer, '/health')
+    writer.close()
+    return obj
+
+async def wait_ready(host: str, port: int, timeout: float):
+    """
+    Waits until the server accepts connections.
+    """
+    deadline = time.perf_counter() + timeout
+    while True:
+        try:
+            await stats(host, port)
+            return
+        except OSError:
+            if time.perf_counter() > deadline:
+                raise
+            await asyncio.sleep(0.5)
+
+def percentile(values: list[float], q: float) -> float:
+    """
+    Returns the q-th percentile of some values (nearest rank).
+    """
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q / 100 * len(values)))]
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default=None)
+    parser.add_argument('--snapshot', default='snapshot.pkl')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--endpoint', choices=['path', 'distance', 'nearest', 'search', 'mixed'], default='path')
+    parser.add_argument('--seed', type=int, default=162)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    snapshot = ServerSnapshot.load_or_build(args.snapshot)
+    all_targets = make_targets(args.endpoint, list(snapshot.net.nodes.values()), args.requests)
+
+    process = None
+    if args.url is None:
+        process = subprocess.Popen([
+            sys.executable, '-m', 'server', '--snapshot', args.snapshot, '--port', str(args.port),
+            '--processes', str(args.processes)
+        ])
+        url_host, url_port = '127.0.0.1', args.port
+    else:
+        url = urlsplit(args.url)
+        url_host, url_port = url.hostname, url.port or 80
+
+    try:
+        asyncio.run(wait_ready(url_host, url_port, timeout=300))
+        all_latencies, no_failures, total_time = asyncio.run(
+            run(url_host, url_port, all_targets, args.concurrency)
+        )
+        report = asyncio.run(stats(url_host, url_port))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+
+    print('{} {} requests, {} clients: {:.2f}s, {:.0f} requests/s, {} failed'.format(
+        args.requests, args.endpoint, args.concurrency, total_time, args.requests / total_time, no_failures
+    ))
+    print('latency: p50 {:.1f} ms, p99 {:.1f} ms, max {:.1f} ms'.format(
+        1000 * percentile(all_latencies, 50), 1000 * percentile(all_latencies, 99), 1000 * max(all_latencies)
+    ))
+    print('micro-batches: paths {:.1f} queries on average, distances {:.1f}'.format(
+        report['paths']['mean_batch'], report['distances']['mean_batch']
+    ))
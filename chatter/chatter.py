@@ -40,7 +40,8 @@ class Chatter:
             extra_kwargs = {
                 'prefix': PROMPT,
                 'extra_tools': [
-                    chatter.tools.distance_to_one
+                    chatter.tools.distance_to_one,
+                    chatter.tools.distance_to_many
                     # chatter.tools.distance_to_all
                 ]
             }
@@ -21,7 +21,7 @@ Locations and Distances:
     2. Use the given distance function with the node IDs.
 
 * To calculate the distance from one Stop (source) to all other Stops, use the following expression:
-    df['distance'] = df['StopId'].apply(lambda node_id: distance_to_one(src, node_id))
+    df['distance'] = distance_to_many(src, df['StopId'].tolist())
 
 
 [Notes for searching Variants]:
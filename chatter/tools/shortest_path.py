@@ -2,16 +2,19 @@
 module chatter.tools.shortest_path
 """
 
-from typing import Dict
+from typing import Dict, List
 
 from langchain.tools import tool
 from pydantic import BaseModel, Field
 
 from network.bus import BusNetwork
+from network.shortest_paths import NetworkCachedEngine, NetworkDijkstraOneToMany
 from network.shortest_paths.contraction_hierarchies import NetworkContractionHierarchiesLazyED
 
 net: BusNetwork
 ch_model: NetworkContractionHierarchiesLazyED = None
+ch_cached: NetworkCachedEngine = None
+one_to_many_model: NetworkDijkstraOneToMany = None
 
 def load_net(_net: BusNetwork):
     """
@@ -23,6 +26,11 @@ def load_net(_net: BusNetwork):
     # pylint: disable=E0001, W0603
     global ch_model
     ch_model = NetworkContractionHierarchiesLazyED.from_net(net=net)
+    # Chat sessions ask for the same stop pairs over and over.
+    global ch_cached
+    ch_cached = NetworkCachedEngine(ch_model)
+    global one_to_many_model
+    one_to_many_model = NetworkDijkstraOneToMany.from_net(net=net)
 
 # class DistanceToOneInputModel(BaseModel):
 #     """
@@ -40,4 +48,14 @@ def distance_to_one(s: int, t: int) -> float:
     * s:    ID of the source node
     * t:    ID of the destination node
     """
-    return ch_model.dist(s, t)
\ No newline at end of file
+    return ch_cached.dist(s, t)
+
+@tool
+def distance_to_many(s: int, ts: List[int]) -> List[float]:
+    """
+    Find the shortest distances between node src and several destination nodes, in the order of the destinations.
+    Arguments:
+    * s:    ID of the source node
+    * ts:   IDs of the destination nodes
+    """
+    return one_to_many_model.to_many(s, ts).tolist()
@@ -2,5 +2,20 @@
 Module network.
 Contains 
 - Generic Network class, implementing a network with basic searching methods.
+- NetworkChange class, an entry of the change log of a Network edited in place.
+- NetworkScenario class, a copy-on-write what-if overlay on a shared Network.
+- NetworkComponents class, strongly connected components and a reachability index of a Network.
+- NetworkQueryGraph class, a smaller query graph of a Network (parallel edges deduplicated, chains compressed).
+- NetworkCSR class, a compact array representation of a Network used by the search engines.
+- NetworkTravelTimeProfiles class, time-of-day travel-time profiles of the edges of a NetworkCSR.
+- NetworkLiveTravelTimes class, ingesting vehicle positions into live edge weight snapshots.
+- NetworkMapMatcher class, matching GPS traces onto the connectors of a bus network.
 """
-from network.network import Network
\ No newline at end of file
+from network.network import Network, NetworkChange
+from network.csr import NetworkCSR
+from network.components import NetworkComponents
+from network.scenario import NetworkScenario
+from network.query_graph import NetworkQueryGraph, NetworkQueryGraphSearch
+from network.profiles import NetworkTravelTimeProfiles
+from network.live import NetworkLiveTravelTimes
+from network.map_matching import NetworkMapMatcher
\ No newline at end of file
@@ -3,6 +3,8 @@ Module network.bus
 Contains 
 - BusNetwork class, an implementation of the Network class with specific inputting methods.
 - BusNetworkDijkstra class, an implementation of the NetworkDijkstra class with specific outputting methods.
+- BusNetworkBuildCache class, an on-disk cache of the connectors of each variant for delta rebuilds.
 """
 
-from network.bus.busnet import BusNetwork, BusNetworkDijkstra
\ No newline at end of file
+from network.bus.busnet import BusNetwork, BusNetworkDijkstra
+from network.bus.build_cache import BusNetworkBuildCache, BusNetworkBuildReport
@@ -0,0 +1,177 @@
+"""
+Module network.bus.build_cache
+Contains
+- BusNetworkBuildCache class, an on-disk cache of the connectors built for each variant, keyed by a content hash.
+- BusNetworkBuildReport class, the summary of what a (re)build found changed.
+"""
+from __future__ import annotations
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+
+from elements import Stop, Path, Variant
+from network.network import NetworkChange
+
+@dataclass
+class BusNetworkBuildReport:
+    """
+    Defines the outcome of a (re)build of a bus network against the previous build.
+    Arguments:
+        - added:            Variants absent from the previous build
+        - changed:          Variants whose inputs changed since the previous build
+        - removed:          Variants of the previous build absent from the inputs
+        - unchanged:        Variants whose inputs did not change
+        - rebuilt:          Variants whose connectors were built (not found in the cache)
+        - stops:            Stops added, or whose data changed (e.g. moved), in an in-place update
+        - change:           Change log entry of an in-place update, if any
+    """
+    added:      list[tuple[int, int]] = field(default_factory=list)
+    changed:    list[tuple[int, int]] = field(default_factory=list)
+    removed:    list[tuple[int, int]] = field(default_factory=list)
+    unchanged:  list[tuple[int, int]] = field(default_factory=list)
+    rebuilt:    list[tuple[int, int]] = field(default_factory=list)
+    stops:      list[int] = field(default_factory=list)
+    change:     NetworkChange = None
+
+    @classmethod
+    def from_hashes(
+        cls, hashes: dict[tuple[int, int], str], previous: dict[tuple[int, int], str]
+    ) -> 'BusNetworkBuildReport':
+        """
+        Compares the variant hashes of a build with those of a previous build.
+        """
+        report = cls()
+        for route_ids, key in hashes.items():
+            if route_ids not in previous:
+                report.added.append(route_ids)
+            elif previous[route_ids] != key:
+                report.changed.append(route_ids)
+            else:
+                report.unchanged.append(route_ids)
+        report.removed = [route_ids for route_ids in previous if route_ids not in hashes]
+        return report
+
+    def __str__(self) -> str:
+        return '{} added, {} changed, {} removed, {} unchanged; {} variants rebuilt; {} stops updated'.format(
+            len(self.added), len(self.changed), len(self.removed), len(self.unchanged), len(self.rebuilt),
+            len(self.stops)
+        )
+
+class BusNetworkBuildCache:
+    """
+    On-disk cache of the connectors of each variant, keyed by the SHA-256 hash of the variant inputs:
+    its stops (ids and coordinates) in travelling order, its path coordinates, its distance and running time,
+    and the segment-snapping method. Each entry is a JSON file of BusNetworkConnector dictionaries;
+    the manifest records the hash of every variant of the latest build.
+    """
+    _directory:     str
+    _manifest:      dict[tuple[int, int], str]
+    _last_report:   BusNetworkBuildReport | None
+
+    MANIFEST = 'manifest.json'
+
+    def __init__(self, directory: str = '.build_cache'):
+        self._directory = directory
+        self._last_report = None
+        os.makedirs(directory, exist_ok=True)
+
+        file = os.path.join(directory, self.MANIFEST)
+        self._manifest = {}
+        if os.path.exists(file):
+            with open(file, 'r', encoding='utf-8') as f:
+                self._manifest = {
+                    (int(item['RouteId']), int(item['RouteVarId'])): item['Hash'] for item in json.load(f)
+                }
+
+    @staticmethod
+    def variant_hash(variant: Variant, path: Path, stops_en_route: list[Stop], sides_set_type: str = 'spatial') -> str:
+        """
+        Returns the content hash of the inputs of a variant.
+        """
+        content = {
+            'Stops':        [(stop.stop_id, *map(float, stop.coord)) for stop in stops_en_route],
+            'Path':         [tuple(map(float, coord)) for coord in path.coords],
+            'Distance':     float(variant.distance),
+            'RunningTime':  float(variant.running_time),
+            'SidesSet':     sides_set_type
+        }
+        return hashlib.sha256(json.dumps(content).encode('utf-8')).hexdigest()
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self._directory, key + '.json')
+
+    def get(self, key: str) -> list[dict] | None:
+        """
+        Returns the cached connectors of a hash as dictionaries, or None if missing.
+        """
+        if not os.path.exists(self._file(key)):
+            return None
+        with open(self._file(key), 'r', encoding='utf-8') as f:
+            return json.load(f)
+
+    def put(self, key: str, connectors: list):
+        """
+        Stores the connectors of a hash (any objects with a to_dict method).
+        """
+        # Write then rename, so that an interrupted build never leaves a truncated entry behind.
+        tmp_file = self._file(key) + '.tmp'
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump([connector.to_dict() for connector in connectors], f)
+        os.replace(tmp_file, self._file(key))
+
+    def record_build(self, hashes: dict[tuple[int, int], str], rebuilt: list[tuple[int, int]]) -> BusNetworkBuildReport:
+        """
+        Compares a build with the previous one recorded in the manifest, then records it.
+        Returns the report, also kept as last_report.
+        """
+        self._last_report = BusNetworkBuildReport.from_hashes(hashes, self._manifest)
+        self._last_report.rebuilt = list(rebuilt)
+        self.save_manifest(hashes)
+        return self._last_report
+
+    def save_manifest(self, hashes: dict[tuple[int, int], str]):
+        """
+        Records the variant hashes of the latest build.
+        """
+        self._manifest = dict(hashes)
+        tmp_file = os.path.join(self._directory, self.MANIFEST + '.tmp')
+        with open(tmp_file, 'w', encoding='utf-8') as f:
+            json.dump([
+                {'RouteId': route_ids[0], 'RouteVarId': route_ids[1], 'Hash': key}
+                for route_ids, key in hashes.items()
+            ], f)
+        os.replace(tmp_file, os.path.join(self._directory, self.MANIFEST))
+
+    def prune(self) -> int:
+        """
+        Deletes the entries not referenced by the manifest. Returns the number of deleted entries.
+        """
+        keep = {key + '.json' for key in self._manifest.values()} | {self.MANIFEST}
+        count = 0
+        for file in os.listdir(self._directory):
+            if file.endswith('.json') and file not in keep:
+                os.remove(os.path.join(self._directory, file))
+                count += 1
+        return count
+
+    @property
+    def manifest(self) -> dict[tuple[int, int], str]:
+        """
+        Returns the variant hashes of the latest build.
+        """
+        return self._manifest
+
+    @property
+    def last_report(self) -> BusNetworkBuildReport | None:
+        """
+        Returns the report of the latest recorded build.
+        """
+        return self._last_report
+
+    @property
+    def directory(self) -> str:
+        """
+        Returns the cache directory.
+        """
+        return self._directory
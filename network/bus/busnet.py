@@ -13,9 +13,10 @@ from tqdm import tqdm
 from rtree import Index
 from helper import line_dist, proj_vector
 
-from elements import Stop, Path
+from elements import Stop, Path, Variant
 from queries import StopQuery, VariantQuery, PathQuery
-from network.network import NetworkConnector, Network
+from network.network import NetworkConnector, Network, NetworkChange
+from network.bus.build_cache import BusNetworkBuildCache, BusNetworkBuildReport
 from network.shortest_paths import NetworkDijkstra
 
 @dataclass
@@ -79,6 +80,12 @@ class BusNetwork(Network[Stop, BusNetworkConnector]):
     """
     Implementation of Network that contains information of bus Stops and Variants.
     """
+    _variant_hashes:    dict[tuple[int, int], str]
+
+    def __init__(self, nodes = None, adjs = None, adjs_rev = None) -> None:
+        super().__init__(nodes, adjs, adjs_rev)
+        self._variant_hashes = {}
+
     class SidesSet:
         """
         A set of segments (or "sides"). 
@@ -217,7 +224,10 @@ class BusNetwork(Network[Stop, BusNetworkConnector]):
             obj = json.load(f)
 
         stops = { int(stop_id): Stop.from_dict(obj[stop_id]['Data']) for stop_id in obj.keys() }
-        adjs  = { int(stop_id): [BusNetworkConnector.from_dict(connector) for connector in obj[stop_id]['Adjacent']] for stop_id in obj.keys() }
+        adjs  = {
+            int(stop_id): [BusNetworkConnector.from_dict(connector) for connector in obj[stop_id]['Adjacent']]
+            for stop_id in obj.keys()
+        }
         return cls(stops, adjs)
 
     @classmethod
@@ -266,13 +276,78 @@ class BusNetwork(Network[Stop, BusNetworkConnector]):
 
         sides_set.close()
 
+    @classmethod
+    def _read_ndjsons(
+        cls,
+        stops_json_file: str = 'stops.json', 
+        vars_json_file: str = 'vars.json', 
+        paths_json_file: str = 'paths.json'
+    ):
+        """
+        Reads the Stops, Variants and Paths, and the stop ids of every variant in travelling order.
+        """
+        stops = StopQuery.from_ndjson(stops_json_file)
+        variants = VariantQuery.from_ndjson(vars_json_file)
+        paths = PathQuery.from_ndjson(paths_json_file)
+
+        with open(stops_json_file, 'r', encoding='utf-8') as f:
+            obj = ndjson.load(f)
+            stops_id_en_routes = {
+                (int(route['RouteId']), int(route['RouteVarId'])): [stop['StopId'] for stop in route['Stops']]
+                for route in obj
+            }
+
+        return stops, variants, paths, stops_id_en_routes
+
+    @classmethod
+    def _build_variants(
+        cls, stops, variants, paths, stops_id_en_routes: dict, route_ids_list: list, hashes: dict,
+        sides_set_type: str = 'spatial', cache: BusNetworkBuildCache = None
+    ) -> tuple[dict, list]:
+        """
+        Returns the connectors of the given variants, by variant, together with the variants actually built.
+        Variants whose hash (in hashes, see _variant_hashes_of) is found in the cache are read from it instead;
+        built variants are stored in it.
+        """
+        # pylint: disable=too-many-arguments
+        connectors_of, rebuilt = {}, []
+        for route_ids in tqdm(route_ids_list):
+            variant, path = variants[route_ids], paths[route_ids]
+            stops_en_route = stops_id_en_routes[route_ids]
+
+            key = hashes[route_ids]
+            if cache is not None:
+                cached = cache.get(key)
+                if cached is not None:
+                    connectors_of[route_ids] = [BusNetworkConnector.from_dict(obj) for obj in cached]
+                    for connector in connectors_of[route_ids]:
+                        connector.real_path = [tuple(coord) for coord in connector.real_path]
+                    continue
+
+            connectors_of[route_ids] = cls._variant_connectors(stops, stops_en_route, variant, path, sides_set_type)
+            rebuilt.append(route_ids)
+            if cache is not None:
+                cache.put(key, connectors_of[route_ids])
+
+        return connectors_of, rebuilt
+
+    @staticmethod
+    def _variant_hashes_of(stops, variants, paths, stops_id_en_routes: dict, sides_set_type: str) -> dict:
+        return {
+            route_ids: BusNetworkBuildCache.variant_hash(
+                variants[route_ids], paths[route_ids], [stops[stop_id] for stop_id in stops_en_route], sides_set_type
+            )
+            for route_ids, stops_en_route in stops_id_en_routes.items()
+        }
+
     @classmethod
     def from_ndjsons(
         cls,
         stops_json_file: str = 'stops.json', 
         vars_json_file: str = 'vars.json', 
         paths_json_file: str = 'paths.json',
-        sides_set_type: str = 'spatial'
+        sides_set_type: str = 'spatial',
+        cache: BusNetworkBuildCache = None
     ):
         """
         Input the network from 3 JSON files describing a list of Stops, Variants and Paths.
@@ -285,48 +360,168 @@ class BusNetwork(Network[Stop, BusNetworkConnector]):
                     Construct the graph using the Graph construction algorithm I algorithm (naive).
                 + If sides_set_type = 'spatial': 
                     Construct the graph using the Graph construction algorithm II algorithm (advanced using R-Tree).
+            - cache: build cache; only the variants whose inputs are not found in it are built.
+              The comparison with the previous build is then available as cache.last_report.
         """
-        stops = StopQuery.from_ndjson(stops_json_file)
-        variants = VariantQuery.from_ndjson(vars_json_file)
-        paths = PathQuery.from_ndjson(paths_json_file)
-
-        with open(stops_json_file, 'r', encoding='utf-8') as f:
-            obj = ndjson.load(f)
-            stops_id_en_routes = {
-                (int(route['RouteId']), int(route['RouteVarId'])): [stop['StopId'] for stop in route['Stops']]
-                for route in obj
-            }
+        # pylint: disable=too-many-arguments
+        stops, variants, paths, stops_id_en_routes = cls._read_ndjsons(stops_json_file, vars_json_file, paths_json_file)
 
         print('sides_set_type = ', sides_set_type)
 
-        net = cls(nodes=stops.to_dict(), adjs={})
+        net = cls(nodes={stop_id: stops[stop_id] for stop_id in stops.ids}, adjs={})
+        net._variant_hashes = cls._variant_hashes_of(stops, variants, paths, stops_id_en_routes, sides_set_type)
 
-        for route_ids, stops_en_route in tqdm(stops_id_en_routes.items()):
-            speed = variants[route_ids].distance / variants[route_ids].running_time
-            path = paths[route_ids]
-            sides = list(path.polysides())
-            sides_set = cls.SidesSet(sides, sides_set_type)
+        connectors_of, rebuilt = cls._build_variants(
+            stops, variants, paths, stops_id_en_routes, list(stops_id_en_routes), net._variant_hashes,
+            sides_set_type, cache
+        )
+        for connectors in connectors_of.values():
+            for connector in connectors:
+                net.add_edge(connector)
 
-            side_on_stops = [
-                (stop_id, sides_set.best_side(stops[stop_id].coord)[1])
-                for stop_id in stops_en_route  
-            ]
+        if cache is not None:
+            cache.record_build(net._variant_hashes, rebuilt)
+        return net
 
-            for ((stop1, idx1), (stop2, idx2)) in zip(side_on_stops, side_on_stops[1:]):        
-                START_PATH = tuple(proj_vector(stops[stop1].coord, sides[idx1][0], sides[idx1][1]))
-                END_PATH   = tuple(proj_vector(stops[stop2].coord, sides[idx2][0], sides[idx2][1]))
+    def update_from_ndjsons(
+        self,
+        stops_json_file: str = 'stops.json', 
+        vars_json_file: str = 'vars.json', 
+        paths_json_file: str = 'paths.json',
+        sides_set_type: str = 'spatial',
+        cache: BusNetworkBuildCache = None
+    ) -> BusNetworkBuildReport:
+        """
+        Updates the network in place from new versions of the 3 JSON files.
+        Only the variants whose inputs changed since the network was built are rebuilt (or read from the cache),
+        and all their connectors are swapped in a single edit, along with the stops added or whose data changed
+        (e.g. moved stops, whose variants are recut). Returns the report of what changed.
+        """
+        # pylint: disable=too-many-arguments
+        stops, variants, paths, stops_id_en_routes = self._read_ndjsons(
+            stops_json_file, vars_json_file, paths_json_file
+        )
+        hashes = self._variant_hashes_of(stops, variants, paths, stops_id_en_routes, sides_set_type)
+        report = BusNetworkBuildReport.from_hashes(hashes, self._variant_hashes)
 
-                length = sum(math.dist(path.coords[idx], path.coords[idx + 1]) for idx in range(idx1 + 1, idx2))
-                length += math.dist(START_PATH, path.coords[idx1])
-                length += math.dist(  END_PATH, path.coords[idx2])
+        connectors_of, report.rebuilt = self._build_variants(
+            stops, variants, paths, stops_id_en_routes, report.added + report.changed, hashes, sides_set_type, cache
+        )
+        report.stops = [
+            stop_id for stop_id in stops.ids
+            if stop_id not in self.nodes or self.nodes[stop_id].to_dict() != stops[stop_id].to_dict()
+        ]
+        # Added variants may already have connectors if the network was not built from JSON files.
+        edited = set(report.added) | set(report.changed) | set(report.removed)
+        report.change = self.edit(
+            added = [connector for connectors in connectors_of.values() for connector in connectors],
+            removed = [
+                connector
+                for connectors in self.adjs.values()
+                for connector in connectors
+                if connector.route_ids in edited
+            ],
+            nodes = {stop_id: stops[stop_id] for stop_id in report.stops}
+        )
 
-                net.add_edge(BusNetworkConnector(
-                    src = stop1, dest = stop2, route_ids = route_ids, length = length, time = length / speed,
-                    real_path = [stops[stop1].coord, START_PATH] + path.coords[idx1 + 1 : idx2] + [END_PATH, stops[stop2].coord]
-                ))
+        self._variant_hashes = hashes
+        if cache is not None:
+            cache.record_build(hashes, report.rebuilt)
+        return report
 
+    @classmethod
+    def _variant_connectors(
+        cls, stops, stops_en_route: list[int], variant: Variant, path: Path, sides_set_type: str = 'spatial'
+    ) -> list[BusNetworkConnector]:
+        """
+        Returns the connectors between consecutive stops of a variant, cut from its path.
+        Parameters:
+            - stops: mapping from a stop id to its Stop.
+            - stops_en_route: ids of the stops of the variant, in travelling order.
+        """
+        # pylint: disable=too-many-arguments
+        route_ids = variant.route_ids
+        speed = variant.distance / variant.running_time
+        sides = list(path.polysides())
+        sides_set = cls.SidesSet(sides, sides_set_type)
+
+        side_on_stops = [
+            (stop_id, sides_set.best_side(stops[stop_id].coord)[1])
+            for stop_id in stops_en_route  
+        ]
         sides_set.close()
-        return net
+
+        connectors = []
+        for ((stop1, idx1), (stop2, idx2)) in zip(side_on_stops, side_on_stops[1:]):        
+            START_PATH = tuple(proj_vector(stops[stop1].coord, sides[idx1][0], sides[idx1][1]))
+            END_PATH   = tuple(proj_vector(stops[stop2].coord, sides[idx2][0], sides[idx2][1]))
+
+            length = sum(math.dist(path.coords[idx], path.coords[idx + 1]) for idx in range(idx1 + 1, idx2))
+            length += math.dist(START_PATH, path.coords[idx1])
+            length += math.dist(  END_PATH, path.coords[idx2])
+
+            connectors.append(BusNetworkConnector(
+                src = stop1, dest = stop2, route_ids = route_ids, length = length, time = length / speed,
+                real_path = [stops[stop1].coord, START_PATH] + path.coords[idx1 + 1 : idx2]
+                          + [END_PATH, stops[stop2].coord]
+            ))
+
+        return connectors
+
+    def variant_connectors(self, route_ids: tuple[int, int]) -> list[BusNetworkConnector]:
+        """
+        Returns the connectors of a variant currently in the network.
+        """
+        route_ids = tuple(route_ids)
+        return [
+            connector
+            for connectors in self.adjs.values()
+            for connector in connectors
+            if connector.route_ids == route_ids
+        ]
+
+    def add_variant(
+        self, variant: Variant, path: Path, stops_en_route: list[Stop], sides_set_type: str = 'spatial'
+    ) -> NetworkChange:
+        """
+        Adds a new variant in place, from its Variant record (distance and running time),
+        its Path and its Stops in travelling order. Stops not yet in the network are added.
+        Returns the change log entry of the edit.
+        """
+        if self.variant_connectors(variant.route_ids):
+            raise ValueError('Variant {} is already in the network.'.format(variant.route_ids))
+        return self.replace_variant(variant, path, stops_en_route, sides_set_type)
+
+    def replace_variant(
+        self, variant: Variant, path: Path, stops_en_route: list[Stop], sides_set_type: str = 'spatial'
+    ) -> NetworkChange:
+        """
+        Replaces the stops, path and timing of a variant in place (or adds it if missing).
+        Only the connectors of this variant are rebuilt; returns the change log entry of the edit.
+        """
+        stops = {stop.stop_id: stop for stop in stops_en_route}
+        change = self.edit(
+            added = self._variant_connectors(
+                stops, [stop.stop_id for stop in stops_en_route], variant, path, sides_set_type
+            ),
+            removed = self.variant_connectors(variant.route_ids),
+            nodes = {stop_id: stop for stop_id, stop in stops.items() if stop_id not in self.nodes}
+        )
+        self._variant_hashes[variant.route_ids] = BusNetworkBuildCache.variant_hash(
+            variant, path, stops_en_route, sides_set_type
+        )
+        return change
+
+    def remove_variant(self, route_ids: tuple[int, int]) -> NetworkChange:
+        """
+        Removes the connectors of a variant in place; its stops remain in the network.
+        Returns the change log entry of the edit.
+        """
+        removed = self.variant_connectors(route_ids)
+        if not removed:
+            raise KeyError('Variant {} is not in the network.'.format(tuple(route_ids)))
+        self._variant_hashes.pop(tuple(route_ids), None)
+        return self.edit(removed=removed)
 
     def to_dict(self):
         """
@@ -367,7 +562,7 @@ class BusNetworkDijkstra(NetworkDijkstra):
             "PathTime": sum(connector.time for connector in connectors),
             "PathLength": sum(connector.length for connector in connectors),
             "Path": [connector.to_dict() for connector in connectors],
-            "Stops": [self._net.nodes[node_id].to_dict() for node_id in node_ids]
+            "Stops": [self.net.nodes[node_id].to_dict() for node_id in node_ids]
         }
 
         if file is None:
@@ -0,0 +1,210 @@
+"""
+Module network.components
+"""
+from __future__ import annotations
+import math
+
+import numpy as np
+
+from network.csr import NetworkCSR
+
+class NetworkComponents:
+    """
+    Strongly connected components (SCC) of a network, computed on its CSR by an iterative Tarjan algorithm.
+    Edges of infinite weight (removed edges of a scenario) are ignored.
+
+    Tarjan numbers the components in reverse topological order: every edge of the condensation DAG goes
+    from a component to one with a smaller id. The reachability index stores, for every component,
+    the set of components reachable from it as a Python integer used as a bitset, filled in increasing
+    id order; reachable(src, dest) then is a single bit test.
+    """
+    _csr:           NetworkCSR
+    _component:     np.ndarray
+    _sizes:         np.ndarray
+    _dag_offsets:   np.ndarray
+    _dag_heads:     np.ndarray
+    _reach:         list[int]
+
+    def __init__(self, csr: NetworkCSR):
+        self._csr = csr
+        component = self._tarjan(csr)
+        self._component = np.array(component, dtype=np.int64)
+        no_components = int(self._component.max()) + 1 if len(component) else 0
+        self._sizes = np.bincount(self._component, minlength=no_components)
+
+        # Condensation DAG, in CSR form.
+        finite = np.isfinite(csr.weights)
+        comp_tails = self._component[csr.tails[finite]]
+        comp_heads = self._component[csr.heads[finite]]
+        between = comp_tails != comp_heads
+        dag_edges = np.unique(np.stack([comp_tails[between], comp_heads[between]], axis=1), axis=0) \
+            if between.any() else np.zeros((0, 2), dtype=np.int64)
+        self._dag_heads = dag_edges[:, 1].copy()
+        self._dag_offsets = np.zeros(no_components + 1, dtype=np.int64)
+        np.cumsum(np.bincount(dag_edges[:, 0], minlength=no_components), out=self._dag_offsets[1:])
+
+        offsets, heads = self._dag_offsets.tolist(), self._dag_heads.tolist()
+        self._reach = []
+        for c in range(no_components):
+            reach = 1 << c
+            for idx in range(offsets[c], offsets[c + 1]):
+                reach |= self._reach[heads[idx]]
+            self._reach.append(reach)
+
+    @classmethod
+    def from_net(cls, net):
+        """
+        Computes the components of a network.
+        """
+        return cls(net.csr())
+
+    @staticmethod
+    def _tarjan(csr: NetworkCSR) -> list[int]:
+        # pylint: disable=too-many-locals
+        n = len(csr)
+        offsets, heads, weights = csr.offsets.tolist(), csr.heads.tolist(), csr.weights.tolist()
+        INFINITY = math.inf
+
+        index, low, on_stack = [-1] * n, [0] * n, [False] * n
+        component = [-1] * n
+        stack, counter, no_components = [], 0, 0
+
+        for root in range(n):
+            if index[root] != -1:
+                continue
+            index[root] = low[root] = counter
+            counter += 1
+            stack.append(root)
+            on_stack[root] = True
+            work = [(root, offsets[root])]
+
+            while work:
+                v, edge = work[-1]
+                while edge < offsets[v + 1]:
+                    w = heads[edge]
+                    if weights[edge] == INFINITY:
+                        edge += 1
+                        continue
+                    if index[w] == -1:
+                        work[-1] = (v, edge + 1)
+                        index[w] = low[w] = counter
+                        counter += 1
+                        stack.append(w)
+                        on_stack[w] = True
+                        work.append((w, offsets[w]))
+                        break
+                    if on_stack[w] and index[w] < low[v]:
+                        low[v] = index[w]
+                    edge += 1
+                else:
+                    work.pop()
+                    if low[v] == index[v]:
+                        while True:
+                            w = stack.pop()
+                            on_stack[w] = False
+                            component[w] = no_components
+                            if w == v:
+                                break
+                        no_components += 1
+                    if work:
+                        u = work[-1][0]
+                        if low[v] < low[u]:
+                            low[u] = low[v]
+
+        return component
+
+    def component_of(self, node: int) -> int:
+        """
+        Returns the component id of a node.
+        """
+        return int(self._component[self._csr.index[node]])
+
+    def reachable(self, src: int, dest: int) -> bool:
+        """
+        Returns if there is a path from source src to destination dest.
+        """
+        index = self._csr.index
+        return bool(self._reach[self._component[index[src]]] >> int(self._component[index[dest]]) & 1)
+
+    def members(self, component: int) -> list[int]:
+        """
+        Returns the node ids of a component.
+        """
+        return [int(node) for node in self._csr.ids[self._component == component]]
+
+    def successors(self, component: int) -> list[int]:
+        """
+        Returns the components directly reachable from a component in the condensation DAG.
+        """
+        return self._dag_heads[self._dag_offsets[component] : self._dag_offsets[component + 1]].tolist()
+
+    def __len__(self):
+        return len(self._sizes)
+
+    @property
+    def csr(self) -> NetworkCSR:
+        """
+        Returns the CSR the components were computed on.
+        """
+        return self._csr
+
+    @property
+    def sizes(self) -> np.ndarray:
+        """
+        Returns the size of every component.
+        """
+        return self._sizes
+
+    @property
+    def no_dag_edges(self) -> int:
+        """
+        Returns the number of edges of the condensation DAG.
+        """
+        return len(self._dag_heads)
+
+    def nbytes(self) -> int:
+        """
+        Returns the memory used by the component arrays and the reachability index, in bytes.
+        """
+        return self._component.nbytes + self._sizes.nbytes + self._dag_offsets.nbytes + self._dag_heads.nbytes \
+            + sum((reach.bit_length() + 7) // 8 for reach in self._reach)
+
+    def report(self, max_listed: int = 20) -> str:
+        """
+        Returns a data-quality report of the components: their sizes, the nodes outside the largest component,
+        and the source and sink components of the condensation DAG (nodes that can only be left,
+        or only be reached), listing up to max_listed small components.
+        """
+        no_components = len(self._sizes)
+        if no_components == 0:
+            return 'Empty network.'
+        largest = int(np.argmax(self._sizes))
+        has_in = np.zeros(no_components, dtype=np.bool_)
+        has_in[self._dag_heads] = True
+        has_out = self._dag_offsets[1:] > self._dag_offsets[:-1]
+
+        lines = [
+            '{} nodes in {} strongly connected components, {} edges in the condensation DAG.'.format(
+                len(self._component), no_components, self.no_dag_edges),
+            'Largest component: {} nodes ({:.1%}).'.format(
+                int(self._sizes[largest]), self._sizes[largest] / len(self._component)),
+            'Single-node components: {}.'.format(int((self._sizes == 1).sum())),
+            'Source components (never entered): {}; sink components (never left): {}.'.format(
+                int((~has_in).sum()), int((~has_out).sum())),
+        ]
+        small = [c for c in np.argsort(-self._sizes, kind='stable').tolist() if c != largest]
+        for c in small[:max_listed]:
+            kind = 'isolated' if not has_in[c] and not has_out[c] else \
+                'source' if not has_in[c] else 'sink' if not has_out[c] else 'transit'
+            lines.append('  component {} ({}, {} nodes): {}'.format(c, kind, int(self._sizes[c]), self.members(c)))
+        if len(small) > max_listed:
+            lines.append('  ... and {} more.'.format(len(small) - max_listed))
+        return '\n'.join(lines)
+
+def unreachable(net, src: int, dest: int) -> bool:
+    """
+    Returns if the components of a network prove that there is no path from source src to destination dest.
+    Networks without components() are never proven disconnected.
+    """
+    components = getattr(net, 'components', None)
+    return components is not None and not components().reachable(src, dest)
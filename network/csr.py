@@ -0,0 +1,252 @@
+"""
+Module network.csr
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Iterable
+
+import numpy as np
+
+@dataclass(frozen=True)
+class NetworkCSRView:
+    """
+    Read-only memoryviews over the arrays of a NetworkCSR.
+    Indexing a memoryview returns plain Python numbers, which is noticeably faster
+    than indexing the underlying NumPy arrays inside pure-Python search loops.
+    """
+    offsets:        memoryview
+    heads:          memoryview
+    tails:          memoryview
+    weights:        memoryview
+    offsets_rev:    memoryview
+    edges_rev:      memoryview
+
+class NetworkCSR:
+    """
+    Compressed sparse row (CSR) representation of a Network.
+
+    Nodes are relabelled with compact indices 0..n-1 and edges with compact ids 0..m-1,
+    edges being sorted by their source index. For every node index u:
+        - out-edges of u are the edge ids offsets[u] .. offsets[u + 1] - 1,
+        - in-edges of u are edges_rev[offsets_rev[u]] .. edges_rev[offsets_rev[u + 1] - 1].
+    The i-th edge goes from tails[i] to heads[i] with weight weights[i],
+    and represents the connector connectors[i] of the original network.
+    """
+    _ids:           np.ndarray
+    _index:         dict[int, int]
+    _offsets:       np.ndarray
+    _heads:         np.ndarray
+    _tails:         np.ndarray
+    _weights:       np.ndarray
+    _offsets_rev:   np.ndarray
+    _edges_rev:     np.ndarray
+    _connectors:    list | None
+    _view:          NetworkCSRView | None
+
+    def __init__(
+        self, ids: np.ndarray, offsets: np.ndarray, heads: np.ndarray, tails: np.ndarray, weights: np.ndarray,
+        offsets_rev: np.ndarray, edges_rev: np.ndarray, connectors: list = None
+    ):
+        # pylint: disable=too-many-arguments
+        self._ids = ids
+        self._index = {int(node): idx for idx, node in enumerate(ids)}
+        self._offsets = offsets
+        self._heads = heads
+        self._tails = tails
+        self._weights = weights
+        self._offsets_rev = offsets_rev
+        self._edges_rev = edges_rev
+        self._connectors = connectors
+        self._view = None
+
+    @classmethod
+    def from_edges(cls, ids: Iterable[int], edges: Iterable[tuple[int, int, float]], connectors: list = None):
+        """
+        Builds the CSR from a node id list and a list of (src, dest, weight) triples.
+        The i-th triple must describe connectors[i], if connectors are given.
+        """
+        ids = np.fromiter(ids, dtype=np.int64)
+        index = {int(node): idx for idx, node in enumerate(ids)}
+        edges = list(edges)
+
+        tails = np.fromiter((index[src] for src, _, _ in edges), dtype=np.int64, count=len(edges))
+        heads = np.fromiter((index[dest] for _, dest, _ in edges), dtype=np.int64, count=len(edges))
+        weights = np.fromiter((weight for _, _, weight in edges), dtype=np.float64, count=len(edges))
+
+        order = np.argsort(tails, kind='stable')
+        tails, heads, weights = tails[order], heads[order], weights[order]
+        if connectors is not None:
+            connectors = [connectors[i] for i in order]
+
+        offsets = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(tails, minlength=len(ids)), out=offsets[1:])
+
+        edges_rev = np.argsort(heads, kind='stable').astype(np.int64)
+        offsets_rev = np.zeros(len(ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(heads, minlength=len(ids)), out=offsets_rev[1:])
+
+        return cls(ids, offsets, heads, tails, weights, offsets_rev, edges_rev, connectors)
+
+    @classmethod
+    def from_net(cls, net):
+        """
+        Builds the CSR of a network. Edge weights are read from connector.weight.
+        """
+        ids = list(net.nodes)
+        known = set(ids)
+        connectors = []
+        for node in list(net.adjs.keys()):
+            if node not in known:
+                known.add(node)
+                ids.append(node)
+            connectors.extend(net.adjs[node])
+        for connector in connectors:
+            if connector.dest not in known:
+                known.add(connector.dest)
+                ids.append(connector.dest)
+
+        return cls.from_edges(
+            ids,
+            ((connector.src, connector.dest, connector.weight) for connector in connectors),
+            connectors
+        )
+
+    def with_weights(self, weights: np.ndarray) -> 'NetworkCSR':
+        """
+        Returns a CSR sharing the structure of this one, but with another weight array.
+        """
+        if len(weights) != self.no_edges:
+            raise ValueError('Weight array does not match the number of edges.')
+        obj = NetworkCSR.__new__(NetworkCSR)
+        obj.__dict__.update(self.__dict__)
+        obj._weights = weights
+        obj._view = None
+        return obj
+
+    def edge_map(self, previous: 'NetworkCSR') -> np.ndarray:
+        """
+        Returns, for every edge of this CSR, the id of the same connector in a previous CSR
+        of the network (or -1 for a new connector), so that per-edge data can be carried over an edit.
+        """
+        if self._connectors is None or previous.connectors is None:
+            raise ValueError('Both CSRs must keep their connectors.')
+        previous_edge = {id(connector): edge for edge, connector in enumerate(previous.connectors)}
+        return np.fromiter(
+            (previous_edge.get(id(connector), -1) for connector in self._connectors),
+            dtype=np.int64, count=self.no_edges
+        )
+
+    def __len__(self):
+        return len(self._ids)
+
+    @property
+    def no_edges(self) -> int:
+        """
+        Returns the number of edges.
+        """
+        return len(self._heads)
+
+    @property
+    def ids(self) -> np.ndarray:
+        """
+        Returns the mapping from a compact index to its node id.
+        """
+        return self._ids
+
+    @property
+    def index(self) -> dict[int, int]:
+        """
+        Returns the mapping from a node id to its compact index.
+        """
+        return self._index
+
+    @property
+    def offsets(self) -> np.ndarray:
+        """
+        Returns the out-edge offsets array.
+        """
+        return self._offsets
+
+    @property
+    def heads(self) -> np.ndarray:
+        """
+        Returns the edge destination index array.
+        """
+        return self._heads
+
+    @property
+    def tails(self) -> np.ndarray:
+        """
+        Returns the edge source index array.
+        """
+        return self._tails
+
+    @property
+    def weights(self) -> np.ndarray:
+        """
+        Returns the edge weight array.
+        """
+        return self._weights
+
+    @property
+    def offsets_rev(self) -> np.ndarray:
+        """
+        Returns the in-edge offsets array.
+        """
+        return self._offsets_rev
+
+    @property
+    def edges_rev(self) -> np.ndarray:
+        """
+        Returns the edge ids sorted by destination index.
+        """
+        return self._edges_rev
+
+    @property
+    def connectors(self) -> list | None:
+        """
+        Returns the mapping from an edge id to its original connector, if known.
+        """
+        return self._connectors
+
+    @property
+    def view(self) -> NetworkCSRView:
+        """
+        Returns (cached) memoryviews over the CSR arrays.
+        """
+        if self._view is None:
+            self._view = NetworkCSRView(
+                offsets = memoryview(self._offsets),
+                heads = memoryview(self._heads),
+                tails = memoryview(self._tails),
+                weights = memoryview(self._weights),
+                offsets_rev = memoryview(self._offsets_rev),
+                edges_rev = memoryview(self._edges_rev)
+            )
+        return self._view
+
+    def out_edges(self, idx: int) -> range:
+        """
+        Returns the ids of the out-edges of a node index.
+        """
+        return range(int(self._offsets[idx]), int(self._offsets[idx + 1]))
+
+    def in_edges(self, idx: int) -> Iterable[int]:
+        """
+        Returns the ids of the in-edges of a node index.
+        """
+        return self._edges_rev[self._offsets_rev[idx] : self._offsets_rev[idx + 1]].tolist()
+
+    def nbytes(self) -> int:
+        """
+        Returns the memory used by the CSR arrays, in bytes.
+        """
+        return sum(arr.nbytes for arr in (
+            self._ids, self._offsets, self._heads, self._tails,
+            self._weights, self._offsets_rev, self._edges_rev
+        ))
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_view'] = None
+        return state
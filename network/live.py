@@ -0,0 +1,411 @@
+"""
+Module network.live
+"""
+from __future__ import annotations
+import json
+import math
+import socket
+import threading
+from array import array
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+import numpy as np
+
+from network.csr import NetworkCSR
+from network.network import Network, NetworkChange, ReweightedNetwork
+
+@dataclass
+class NetworkPositionRecord:
+    """
+    Defines a vehicle position report.
+    Arguments:
+        - route_ids:        Tuple of RouteId and RouteVarId served by the vehicle
+        - timestamp:        Time of the report, in seconds
+        - position:         Cartesian coordinates of the vehicle (VN2000 CRS)
+        - vehicle:          Optional vehicle identifier; reports without one are tracked per route_ids
+    """
+    route_ids:  tuple[int, int]
+    timestamp:  float
+    position:   tuple[float, float]
+    vehicle:    str | None = None
+
+    @classmethod
+    def from_dict(cls, obj: dict):
+        """
+        Converts from a Python dictionary. The position is read from X/Y, or converted from Lat/Lng.
+        """
+        if 'X' in obj:
+            position = (obj['X'], obj['Y'])
+        else:
+            # pylint: disable=import-outside-toplevel
+            from helper import wgs84_to_vn2000
+            position = wgs84_to_vn2000(obj['Lat'], obj['Lng'])
+
+        return cls(
+            route_ids = (int(obj['RouteId']), int(obj['RouteVarId'])),
+            timestamp = float(obj['Timestamp']),
+            position = tuple(position),
+            vehicle = obj.get('Vehicle')
+        )
+
+    def to_dict(self) -> dict:
+        """
+        Exports to a Python dictionary.
+        """
+        obj = {
+            "RouteId":      self.route_ids[0],
+            "RouteVarId":   self.route_ids[1],
+            "Timestamp":    self.timestamp,
+            "X":            self.position[0],
+            "Y":            self.position[1]
+        }
+        if self.vehicle is not None:
+            obj["Vehicle"] = self.vehicle
+        return obj
+
+def records_from_file(file: str) -> Iterator[NetworkPositionRecord]:
+    """
+    Replays position records from a newline-delimited JSON file.
+    """
+    with open(file, 'r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield NetworkPositionRecord.from_dict(json.loads(line))
+
+def records_from_socket(host: str, port: int) -> Iterator[NetworkPositionRecord]:
+    """
+    Replays position records streamed as newline-delimited JSON over a TCP socket, until the peer closes it.
+    """
+    with socket.create_connection((host, port)) as conn, conn.makefile('r', encoding='utf-8') as f:
+        for line in f:
+            if line.strip():
+                yield NetworkPositionRecord.from_dict(json.loads(line))
+
+class NetworkWeightSnapshot(ReweightedNetwork):
+    """
+    Consistent, immutable set of edge weights published by NetworkLiveTravelTimes.
+    A snapshot is a ReweightedNetwork, so every engine accepts it in place of the network; switching
+    engines to a newer snapshot is a single reference assignment.
+    """
+    _version:       int
+    _created_at:    float
+
+    def __init__(self, base: Network, weights: np.ndarray, version: int, created_at: float):
+        weights.setflags(write=False)
+        super().__init__(base, weights)
+        self._version = version
+        self._created_at = created_at
+
+    @property
+    def version(self) -> int:
+        """
+        Returns the version number of the snapshot.
+        """
+        return self._version
+
+    @property
+    def created_at(self) -> float:
+        """
+        Returns the timestamp of the latest record included in the snapshot.
+        """
+        return self._created_at
+
+    @property
+    def weights(self) -> np.ndarray:
+        """
+        Returns the (read-only) edge weight array, indexed by edge id.
+        """
+        return self.csr().weights
+
+class _RouteReference:
+    """
+    Linear referencing of the connectors of one bus variant.
+    Connectors are chained along the route; a position is snapped to the closest segment of their real paths
+    using a uniform grid, and located by (chain id, offset along the chain).
+    """
+    _chains:    list[list[tuple[int, float, float]]]
+    _segments:  list[tuple[float, float, float, float, float, int]]
+    _grid:      dict[tuple[int, int], list[int]]
+    _cell:      float
+
+    def __init__(self, edges: list[int], connectors: list, cell: float, radius: float):
+        self._cell = cell
+        self._chains, self._segments, self._grid = [], [], defaultdict(list)
+
+        for chain_id, chain in enumerate(self._chain(edges, connectors)):
+            offset, items = 0.0, []
+            for edge in chain:
+                start = offset
+                real_path = connectors[edge].real_path
+                for (x1, y1), (x2, y2) in zip(real_path, real_path[1:]):
+                    length = math.dist((x1, y1), (x2, y2))
+                    self._add_segment((x1, y1, x2, y2, offset, chain_id), radius)
+                    offset += length
+                items.append((edge, start, offset))
+            self._chains.append(items)
+
+    def remap(self, new_edge: dict[int, int]):
+        """
+        Renumbers the edges of the chains after an edit of the network.
+        """
+        self._chains = [[(new_edge[edge], start, end) for edge, start, end in chain] for chain in self._chains]
+
+    @staticmethod
+    def _chain(edges: list[int], connectors: list) -> list[list[int]]:
+        by_src = defaultdict(list)
+        dests = defaultdict(int)
+        for edge in edges:
+            by_src[connectors[edge].src].append(edge)
+            dests[connectors[edge].dest] += 1
+
+        used, chains = set(), []
+        starts = [edge for edge in edges if dests[connectors[edge].src] == 0] + edges
+        for start in starts:
+            if start in used:
+                continue
+            chain, edge = [], start
+            while edge is not None:
+                chain.append(edge)
+                used.add(edge)
+                edge = next((nxt for nxt in by_src[connectors[edge].dest] if nxt not in used), None)
+            chains.append(chain)
+        return chains
+
+    def _add_segment(self, segment: tuple, radius: float):
+        x1, y1, x2, y2, _, _ = segment
+        idx = len(self._segments)
+        self._segments.append(segment)
+        for cx in range(int((min(x1, x2) - radius) // self._cell), int((max(x1, x2) + radius) // self._cell) + 1):
+            for cy in range(int((min(y1, y2) - radius) // self._cell), int((max(y1, y2) + radius) // self._cell) + 1):
+                self._grid[(cx, cy)].append(idx)
+
+    def locate(self, position: tuple[float, float], radius: float) -> tuple[int, float] | None:
+        """
+        Returns the (chain id, offset) of the closest point of the route within radius, or None.
+        """
+        x0, y0 = position
+        best, located = radius * radius, None
+        for idx in self._grid.get((int(x0 // self._cell), int(y0 // self._cell)), ()):
+            x1, y1, x2, y2, offset, chain_id = self._segments[idx]
+            dx, dy = x2 - x1, y2 - y1
+            norm = dx * dx + dy * dy
+            t = 0.0 if norm == 0 else min(1.0, max(0.0, ((x0 - x1) * dx + (y0 - y1) * dy) / norm))
+            px, py = x1 + t * dx - x0, y1 + t * dy - y0
+            if px * px + py * py <= best:
+                best, located = px * px + py * py, (chain_id, offset + t * math.sqrt(norm))
+        return located
+
+    def edges_between(self, chain_id: int, start: float, end: float) -> Iterator[tuple[int, float, float]]:
+        """
+        Yields (edge id, edge length, overlapped length) for the edges of a chain overlapping [start, end].
+        """
+        for edge, lo, hi in self._chains[chain_id]:
+            if hi <= start:
+                continue
+            if lo >= end:
+                break
+            yield edge, hi - lo, min(hi, end) - max(lo, start)
+
+class NetworkLiveTravelTimes:
+    """
+    Ingests a stream of vehicle positions and maintains live travel-time estimates of every edge.
+
+    Consecutive positions of a vehicle are snapped onto the real paths of its variant; the speed observed
+    between them is attributed to every connector travelled, weighted by the travelled fraction.
+    Estimates are exponentially decayed averages kept in flat arrays indexed by CSR edge id.
+    When published, an estimate is shrunk towards the static weight according to its decayed mass,
+    so edges without recent observations fall back to their timetable travelling time.
+    Edits of the network carry the estimates of the kept connectors over, and only re-index edited variants.
+    """
+    # pylint: disable=too-many-instance-attributes
+    _net:           Network
+    _csr:           NetworkCSR
+    _cell:          float
+    _half_life:     float
+    _prior_mass:    float
+    _radius:        float
+    _time_unit:     float
+    _max_speed:     float
+    _routes:        dict[tuple[int, int], _RouteReference]
+    _estimates:     array
+    _masses:        array
+    _updated_at:    array
+    _trackers:      dict
+    _now:           float
+    _lock:          threading.RLock
+    _snapshot:      NetworkWeightSnapshot
+    _stats:         dict[str, int]
+
+    def __init__(
+        self, net: Network, half_life: float = 600.0, prior_mass: float = 1.0, radius: float = 50.0,
+        cell: float = 250.0, time_unit: float = 60.0, max_speed: float = 30.0
+    ):
+        """
+        Arguments:
+            - half_life:        Time (seconds) after which an observation weighs half as much
+            - prior_mass:       Mass of the static weight when blending it with the live estimate
+            - radius:           Largest distance (metres) between a position and the route it is snapped on
+            - cell:             Side of the grid cells used to snap positions
+            - time_unit:        Seconds per unit of edge weight (BusNetwork weights are in minutes)
+            - max_speed:        Observed speeds above this (metres per second) are discarded
+        """
+        # pylint: disable=too-many-arguments
+        self._net = net
+        self._half_life = half_life
+        self._prior_mass = prior_mass
+        self._radius = radius
+        self._time_unit = time_unit
+        self._max_speed = max_speed
+        self._cell = cell
+
+        csr = self._csr = net.csr()
+        self._routes = {
+            route_ids: _RouteReference(edges, csr.connectors, cell, radius)
+            for route_ids, edges in self._edges_of_routes(csr).items()
+        }
+
+        self._estimates = array('d', bytes(8 * csr.no_edges))
+        self._masses = array('d', bytes(8 * csr.no_edges))
+        self._updated_at = array('d', bytes(8 * csr.no_edges))
+        self._trackers = {}
+        self._now = 0.0
+        self._lock = threading.RLock()
+        self._stats = {'records': 0, 'unmatched': 0, 'observations': 0}
+        self._snapshot = NetworkWeightSnapshot(net, csr.weights.copy(), version=0, created_at=0.0)
+        if hasattr(net, 'subscribe'):
+            net.subscribe(self._on_change)
+
+    @staticmethod
+    def _edges_of_routes(csr: NetworkCSR, routes: set = None) -> dict[tuple[int, int], list[int]]:
+        edges_of = defaultdict(list)
+        for edge, connector in enumerate(csr.connectors):
+            route_ids = getattr(connector, 'route_ids', None)
+            if route_ids is not None and (routes is None or route_ids in routes):
+                edges_of[route_ids].append(edge)
+        return edges_of
+
+    def _on_change(self, change: NetworkChange):
+        """
+        Carries the estimates over an edit of the network: kept connectors keep their estimates,
+        edited variants are re-indexed and the others only renumbered. Publishes a new snapshot.
+        """
+        with self._lock:
+            csr = self._net.csr()
+            edge_map = csr.edge_map(self._csr)
+            kept = edge_map >= 0
+            for name in ('_estimates', '_masses', '_updated_at'):
+                old = np.frombuffer(getattr(self, name), dtype=np.float64)
+                new = array('d', bytes(8 * csr.no_edges))
+                np.frombuffer(new, dtype=np.float64)[kept] = old[edge_map[kept]]
+                setattr(self, name, new)
+
+            edited = {
+                getattr(connector, 'route_ids', None) for connector in change.added + change.removed
+            } - {None}
+            new_edge = {int(old): edge for edge, old in enumerate(edge_map.tolist()) if old >= 0}
+            for route_ids in edited:
+                self._routes.pop(route_ids, None)
+            for reference in self._routes.values():
+                reference.remap(new_edge)
+            for route_ids, edges in self._edges_of_routes(csr, edited).items():
+                self._routes[route_ids] = _RouteReference(edges, csr.connectors, self._cell, self._radius)
+
+            self._trackers = {
+                key: tracker for key, tracker in self._trackers.items() if tracker[0] not in edited
+            }
+            self._csr = csr
+            self._publish()
+
+    def _observe(self, edge: int, travel_time: float, mass: float, timestamp: float):
+        decay = 0.5 ** ((timestamp - self._updated_at[edge]) / self._half_life)
+        total = self._masses[edge] * decay + mass
+        self._estimates[edge] += (travel_time - self._estimates[edge]) * mass / total
+        self._masses[edge] = total
+        self._updated_at[edge] = timestamp
+        self._stats['observations'] += 1
+
+    def ingest(self, record: NetworkPositionRecord):
+        """
+        Ingests a single position record.
+        """
+        self._stats['records'] += 1
+        reference = self._routes.get(record.route_ids)
+        located = reference.locate(record.position, self._radius) if reference is not None else None
+        if located is None:
+            self._stats['unmatched'] += 1
+            return
+
+        key = record.vehicle if record.vehicle is not None else record.route_ids
+        previous = self._trackers.get(key)
+        self._trackers[key] = (record.route_ids, located, record.timestamp)
+        self._now = max(self._now, record.timestamp)
+
+        if previous is None or previous[0] != record.route_ids:
+            return
+        (chain_id, start), (chain_id_now, end) = previous[1], located
+        elapsed = record.timestamp - previous[2]
+        if chain_id != chain_id_now or end <= start or elapsed <= 0:
+            return
+
+        speed = (end - start) / elapsed
+        if speed > self._max_speed:
+            return
+
+        for edge, length, overlap in reference.edges_between(chain_id, start, end):
+            if length > 0:
+                self._observe(edge, length / speed / self._time_unit, overlap / length, record.timestamp)
+
+    def ingest_many(self, records: Iterable[NetworkPositionRecord], publish_every: int = None) -> int:
+        """
+        Ingests a stream of records, publishing a snapshot after every publish_every records if given.
+        Returns the number of ingested records.
+        """
+        count = 0
+        with self._lock:
+            for record in records:
+                self.ingest(record)
+                count += 1
+                if publish_every and count % publish_every == 0:
+                    self._publish()
+        return count
+
+    def _publish(self) -> NetworkWeightSnapshot:
+        static = self._csr.weights
+        estimates = np.frombuffer(self._estimates, dtype=np.float64)
+        ages = self._now - np.frombuffer(self._updated_at, dtype=np.float64)
+        masses = np.frombuffer(self._masses, dtype=np.float64) * 0.5 ** (ages / self._half_life)
+
+        weights = (masses * estimates + self._prior_mass * static) / (masses + self._prior_mass)
+        self._snapshot = NetworkWeightSnapshot(
+            self._net, weights, version=self._snapshot.version + 1, created_at=self._now
+        )
+        return self._snapshot
+
+    def publish(self) -> NetworkWeightSnapshot:
+        """
+        Publishes (and returns) a consistent snapshot of the current estimates.
+        """
+        with self._lock:
+            return self._publish()
+
+    @property
+    def snapshot(self) -> NetworkWeightSnapshot:
+        """
+        Returns the latest published snapshot.
+        """
+        return self._snapshot
+
+    @property
+    def stats(self) -> dict[str, int]:
+        """
+        Returns the counts of ingested records, unmatched records and edge observations.
+        """
+        return dict(self._stats)
+
+    def reset_trackers(self):
+        """
+        Forgets the last known position of every vehicle.
+        """
+        self._trackers.clear()
@@ -0,0 +1,336 @@
+"""
+Module network.map_matching
+"""
+from __future__ import annotations
+import heapq
+import math
+import multiprocessing
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Iterable, Iterator
+
+from rtree import Index
+
+from network.csr import NetworkCSR
+from network.network import Network, NetworkConnector
+
+@dataclass
+class NetworkMatchCandidate:
+    """
+    Defines a possible location of a GPS point on the network.
+    Arguments:
+        - edge:             Edge id (in the network CSR) of the connector
+        - offset:           Distance from the start of the connector real path, in metres
+        - distance:         Distance between the GPS point and the real path, in metres
+    """
+    edge:       int
+    offset:     float
+    distance:   float
+
+@dataclass
+class NetworkMatchedEdge:
+    """
+    Defines a connector travelled by a matched trace.
+    Arguments:
+        - connector:        The travelled connector
+        - enter:            Estimated time at which the vehicle entered the connector
+        - leave:            Estimated time at which the vehicle left the connector (or its last known time)
+    """
+    connector:  NetworkConnector
+    enter:      float
+    leave:      float
+
+class _ViterbiState:
+    """
+    Node of the Viterbi back-pointer tree: a candidate chosen for one point of a trace.
+    """
+    __slots__ = ('candidate', 'timestamp', 'parent', 'depth')
+
+    def __init__(self, candidate: NetworkMatchCandidate, timestamp: float, parent: '_ViterbiState' = None):
+        self.candidate = candidate
+        self.timestamp = timestamp
+        self.parent = parent
+        self.depth = 0 if parent is None else parent.depth + 1
+
+    def ancestor(self, depth: int) -> '_ViterbiState':
+        """
+        Returns the ancestor of the state at a given depth.
+        """
+        state = self
+        while state.depth > depth:
+            state = state.parent
+        return state
+
+    def chain(self, stop: '_ViterbiState' = None) -> list['_ViterbiState']:
+        """
+        Returns the states from the root (or after stop) down to this state.
+        """
+        states, state = [], self
+        while state is not None and state is not stop:
+            states.append(state)
+            state = state.parent
+        states.reverse()
+        return states
+
+class NetworkMapMatcher:
+    """
+    Hidden Markov Model map-matcher of GPS traces onto the real paths of a bus network (Newson & Krumm).
+        - Candidates of a point are the connectors whose path segments lie within radius, found through an
+          R-tree over the segments of Path.polysides(), as cut into connectors by the network builder.
+        - Emission scores are Gaussian in the point-to-path distance (standard deviation sigma).
+        - Transition scores are exponential in the difference between the network distance and the
+          straight-line distance of two consecutive points (scale beta). Network distances are computed by
+          bounded Dijkstra searches on connector lengths, one per source stop, kept in an LRU cache.
+    Traces are matched with a streaming, fixed-lag Viterbi algorithm, so memory does not grow with the
+    trace length; a point without any reachable candidate breaks the trace into independent pieces.
+    The index and the cached trees are rebuilt when the network is edited.
+    """
+    # pylint: disable=too-many-instance-attributes
+    _net:           Network
+    _csr:           NetworkCSR
+    _radius:        float
+    _sigma:         float
+    _beta:          float
+    _max_distance:  float
+    _lag:           int
+    _idx_tree:      Index
+    _segments:      list[tuple[int, float, tuple[float, float], tuple[float, float]]]
+    _lengths:       list[float]
+    _trees:         OrderedDict
+    _cache_size:    int
+
+    def __init__(
+        self, net: Network, radius: float = 50.0, sigma: float = 10.0, beta: float = 50.0,
+        max_distance: float = 3000.0, lag: int = 32, cache_size: int = 4096
+    ):
+        # pylint: disable=too-many-arguments
+        self._net = net
+        self._radius = radius
+        self._sigma = sigma
+        self._beta = beta
+        self._max_distance = max_distance
+        self._lag = lag
+        self._cache_size = cache_size
+        self._index(net.csr())
+
+    def _index(self, csr: NetworkCSR):
+        """
+        Indexes the path segments of the connectors of the CSR.
+        """
+        self._csr = csr
+        self._trees = OrderedDict()
+        self._segments, self._lengths = [], []
+        for edge, connector in enumerate(csr.connectors):
+            real_path = connector.real_path
+            offset = 0.0
+            for idx, (p1, p2) in enumerate(zip(real_path, real_path[1:])):
+                # The first and last segments join the stops to their projections on the path.
+                if 0 < idx < len(real_path) - 2 or len(real_path) <= 3:
+                    self._segments.append((edge, offset, tuple(map(float, p1)), tuple(map(float, p2))))
+                offset += math.dist(p1, p2)
+            self._lengths.append(offset)
+
+        # Bulk loading is much faster than inserting the segments one by one.
+        self._idx_tree = Index((
+            (idx, (min(x1, x2), min(y1, y2), max(x1, x2), max(y1, y2)), None)
+            for idx, (_, _, (x1, y1), (x2, y2)) in enumerate(self._segments)
+        ))
+
+    def _refresh(self):
+        csr = self._net.csr()
+        if csr is not self._csr:
+            self._index(csr)
+
+    def candidates(self, position: tuple[float, float]) -> list[NetworkMatchCandidate]:
+        """
+        Returns the best candidate of every connector passing within radius of a position.
+        """
+        self._refresh()
+        x0, y0 = position
+        box = (x0 - self._radius, y0 - self._radius, x0 + self._radius, y0 + self._radius)
+        best = {}
+        for idx in self._idx_tree.intersection(box):
+            edge, offset, (x1, y1), (x2, y2) = self._segments[idx]
+            dx, dy = x2 - x1, y2 - y1
+            norm = dx * dx + dy * dy
+            t = 0.0 if norm == 0 else min(1.0, max(0.0, ((x0 - x1) * dx + (y0 - y1) * dy) / norm))
+            distance = math.hypot(x1 + t * dx - x0, y1 + t * dy - y0)
+            if distance <= self._radius and (edge not in best or distance < best[edge].distance):
+                best[edge] = NetworkMatchCandidate(edge, offset + t * math.sqrt(norm), distance)
+        return list(best.values())
+
+    def _tree(self, source: int) -> dict[int, tuple[float, int]]:
+        """
+        Returns the bounded shortest-path tree (by length) of a node index, as target -> (distance, parent edge).
+        """
+        if source in self._trees:
+            self._trees.move_to_end(source)
+            return self._trees[source]
+
+        view = self._csr.view
+        offsets, heads, lengths = view.offsets, view.heads, self._lengths
+        tree = {source: (0.0, -1)}
+        pq = [(0.0, source)]
+        while pq:
+            dist_u, u = heapq.heappop(pq)
+            if dist_u != tree[u][0]:
+                continue
+            for edge in range(offsets[u], offsets[u + 1]):
+                v, dist_v = heads[edge], dist_u + lengths[edge]
+                if dist_v <= self._max_distance and dist_v < tree.get(v, (math.inf, -1))[0]:
+                    tree[v] = (dist_v, edge)
+                    heapq.heappush(pq, (dist_v, v))
+
+        self._trees[source] = tree
+        if len(self._trees) > self._cache_size:
+            self._trees.popitem(last=False)
+        return tree
+
+    def route_distance(self, c1: NetworkMatchCandidate, c2: NetworkMatchCandidate) -> float:
+        """
+        Returns the network distance travelled from candidate c1 to candidate c2.
+        """
+        if c1.edge == c2.edge and c2.offset >= c1.offset:
+            return c2.offset - c1.offset
+        view = self._csr.view
+        tree = self._tree(view.heads[c1.edge])
+        dist, _ = tree.get(view.tails[c2.edge], (math.inf, -1))
+        return self._lengths[c1.edge] - c1.offset + dist + c2.offset
+
+    def _route_edges(self, c1: NetworkMatchCandidate, c2: NetworkMatchCandidate) -> list[int]:
+        """
+        Returns the edges entered after c1 up to (and including) the edge of c2.
+        """
+        if c1.edge == c2.edge and c2.offset >= c1.offset:
+            return []
+        view = self._csr.view
+        source, node = view.heads[c1.edge], view.tails[c2.edge]
+        tree = self._tree(source)
+        edges = [c2.edge]
+        while node != source:
+            _, edge = tree[node]
+            edges.append(edge)
+            node = view.tails[edge]
+        edges.reverse()
+        return edges
+
+    def _emission(self, candidate: NetworkMatchCandidate) -> float:
+        return -0.5 * (candidate.distance / self._sigma) ** 2
+
+    def _transition(self, c1: NetworkMatchCandidate, c2: NetworkMatchCandidate, straight: float) -> float:
+        return -abs(self.route_distance(c1, c2) - straight) / self._beta
+
+    def _viterbi(self, trace: Iterable[tuple[float, tuple[float, float]]]) -> Iterator[tuple[list, bool]]:
+        """
+        Yields the matched states of a trace piece by piece, as soon as they are decided, together with
+        whether the piece continues the previous one (False after a break).
+        """
+        column, position, committed, continues = [], None, None, False
+        for timestamp, point in trace:
+            candidates = self.candidates(point)
+            if not candidates:
+                continue
+
+            new_column = []
+            if column:
+                straight = math.dist(position, point)
+                for candidate in candidates:
+                    score, parent = max(
+                        ((score + self._transition(state.candidate, candidate, straight), state)
+                         for score, state in column),
+                        key=lambda item: item[0]
+                    )
+                    if score > -math.inf:
+                        new_column.append(
+                            (score + self._emission(candidate), _ViterbiState(candidate, timestamp, parent))
+                        )
+
+            if not new_column:
+                # No transition is possible: the trace is broken, flush the best piece so far.
+                if column:
+                    yield max(column, key=lambda item: item[0])[1].chain(committed), continues
+                committed, continues = None, False
+                new_column = [
+                    (self._emission(candidate), _ViterbiState(candidate, timestamp)) for candidate in candidates
+                ]
+
+            column, position = new_column, point
+
+            # Fixed-lag decision: commit the ancestor of the best state lagging behind.
+            best = max(column, key=lambda item: item[0])[1]
+            if best.depth - (committed.depth if committed is not None else -1) > self._lag:
+                decided = best.ancestor(best.depth - self._lag)
+                yield decided.chain(committed), continues
+                committed, continues = decided, True
+                column = [(score, state) for score, state in column if state.ancestor(decided.depth) is decided]
+                # Forget the decided states, so that they can be freed.
+                decided.parent = None
+
+        if column:
+            yield max(column, key=lambda item: item[0])[1].chain(committed), continues
+
+    def match_edges(self, trace: Iterable[tuple[float, tuple[float, float]]]) -> list[tuple[int, float, float]]:
+        """
+        Returns the matched edges of a trace of (timestamp, position) points, as (edge id, enter, leave) tuples.
+        Times are interpolated linearly in distance between consecutive matched points.
+        """
+        self._refresh()
+        matched, previous = [], None
+        for states, continues in self._viterbi(trace):
+            if not continues:
+                previous = None
+
+            for state in states:
+                candidate, timestamp = state.candidate, state.timestamp
+                if previous is None:
+                    matched.append([candidate.edge, timestamp, timestamp])
+                    previous = (candidate, timestamp)
+                    continue
+
+                prev_candidate, prev_timestamp = previous
+                total = self.route_distance(prev_candidate, candidate)
+                travelled = self._lengths[prev_candidate.edge] - prev_candidate.offset
+                for edge in self._route_edges(prev_candidate, candidate):
+                    ratio = min(1.0, travelled / total) if total > 0 else 1.0
+                    at = prev_timestamp + (timestamp - prev_timestamp) * ratio
+                    matched[-1][2] = at
+                    matched.append([edge, at, at])
+                    travelled += self._lengths[edge]
+
+                matched[-1][2] = timestamp
+                previous = (candidate, timestamp)
+
+        return [tuple(item) for item in matched]
+
+    def match(self, trace: Iterable[tuple[float, tuple[float, float]]]) -> list[NetworkMatchedEdge]:
+        """
+        Returns the connectors travelled by a trace of (timestamp, position) points, with their timings.
+        """
+        connectors = self._csr.connectors
+        return [NetworkMatchedEdge(connectors[edge], enter, leave) for edge, enter, leave in self.match_edges(trace)]
+
+    def match_many(self, traces: Iterable, processes: int = None, chunk_size: int = 16) -> Iterator[tuple]:
+        """
+        Matches (trace id, trace) pairs in parallel worker processes.
+        Yields (trace id, list of NetworkMatchedEdge) in input order, consuming traces lazily.
+        """
+        self._refresh()
+        connectors = self._csr.connectors
+        settings = {
+            'radius': self._radius, 'sigma': self._sigma, 'beta': self._beta, 'max_distance': self._max_distance,
+            'lag': self._lag, 'cache_size': self._cache_size
+        }
+        with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(self._net, settings)) as pool:
+            for trace_id, edges in pool.imap(_match_in_worker, traces, chunksize=chunk_size):
+                yield trace_id, [NetworkMatchedEdge(connectors[edge], enter, leave) for edge, enter, leave in edges]
+
+_worker_matcher: NetworkMapMatcher = None
+
+def _init_worker(net: Network, settings: dict):
+    # pylint: disable=global-statement
+    global _worker_matcher
+    _worker_matcher = NetworkMapMatcher(net, **settings)
+
+def _match_in_worker(item: tuple) -> tuple:
+    trace_id, trace = item
+    return trace_id, _worker_matcher.match_edges(trace)
@@ -2,8 +2,14 @@
 Module network.network
 """
 import copy
-from dataclasses import dataclass
-from typing import TypeVar, Generic, Iterable, Dict
+import weakref
+from collections import deque
+from collections.abc import Mapping
+from dataclasses import dataclass, field
+from typing import TypeVar, Generic, Iterable, Dict, Callable
+
+from network.csr import NetworkCSR
+from network.components import NetworkComponents
 
 @dataclass
 class NetworkConnector:
@@ -44,13 +50,46 @@ class NetworkConnector:
 TNode = TypeVar('TNode', bound=object)
 TConnector = TypeVar('TConnector', bound=NetworkConnector)
 
+@dataclass
+class NetworkChange:
+    """
+    Defines a batch of edits applied to a network, as recorded in its change log.
+    Arguments:
+        - version:          Version of the network after the edits
+        - added:            Connectors added to the network
+        - removed:          Connectors removed from the network
+        - added_nodes:      Ids of the nodes added to the network
+    """
+    version:        int
+    added:          list[NetworkConnector]
+    removed:        list[NetworkConnector]
+    added_nodes:    list[int] = field(default_factory=list)
+
+    @property
+    def nodes(self) -> set[int]:
+        """
+        Returns the set of nodes touched by the change.
+        """
+        nodes = set(self.added_nodes)
+        for connector in self.added + self.removed:
+            nodes.update(connector.ends)
+        return nodes
+
 class Network(Generic[TNode, TConnector]):
     """
     Implementation of a generic weighted network.
+    The change log keeps the latest MAX_CHANGES changes applied through edit().
     """
+    MAX_CHANGES:    int = 256
+
     _nodes:     Dict[int, TNode]
     _adjs:      Dict[int, TConnector]
     _adjs_rev:  Dict[int, TConnector]
+    _csr:       NetworkCSR
+    _components: NetworkComponents
+    _version:   int
+    _changes:   deque[NetworkChange]
+    _listeners: list[Callable[[], Callable[[NetworkChange], None]]]
 
     def __init__(self, nodes = None, adjs = None, adjs_rev = None) -> None:
         if nodes is None:
@@ -68,6 +107,14 @@ class Network(Generic[TNode, TConnector]):
                     if connector.dest not in self._adjs_rev:
                         self._adjs_rev[connector.dest] = []
                     self._adjs_rev[connector.dest].append(connector)
+        else:
+            self._adjs_rev = adjs_rev
+
+        self._csr = None
+        self._components = None
+        self._version = 0
+        self._changes = deque(maxlen=self.MAX_CHANGES)
+        self._listeners = []
 
         for node in self._nodes:
             if node not in self._adjs:
@@ -138,13 +185,123 @@ class Network(Generic[TNode, TConnector]):
         if dest not in self._nodes:
             self._nodes[dest] = None
 
-        if src not in self._adjs:
-            self._adjs[src] = []
-        if dest not in self._adjs_rev:
-            self._adjs_rev[dest] = []
+        for node in (src, dest):
+            if node not in self._adjs:
+                self._adjs[node] = []
+            if node not in self._adjs_rev:
+                self._adjs_rev[node] = []
 
         self._adjs[src].append(connector)
         self._adjs_rev[dest].append(connector)
+        self._csr = None
+
+    def remove_edge(self, connector: NetworkConnector):
+        """
+        Remove an edge (this very connector, not an equal one) from the network.
+        """
+        for adjs, node in ((self._adjs, connector.src), (self._adjs_rev, connector.dest)):
+            connectors = adjs.get(node, [])
+            idx = next((idx for idx, other in enumerate(connectors) if other is connector), None)
+            if idx is None:
+                raise KeyError('Connector {} is not in the network.'.format(connector))
+            del connectors[idx]
+        self._csr = None
+
+    def edit(
+        self, added: Iterable[TConnector] = (), removed: Iterable[TConnector] = (), nodes: Dict[int, TNode] = None
+    ) -> NetworkChange:
+        """
+        Applies a batch of edits in place, then records and broadcasts it as one change.
+        The edits are checked first: if a removed connector is not in the network (or is removed twice),
+        KeyError is raised and the network is left unchanged.
+        Arguments:
+            - added:            Connectors to add
+            - removed:          Connectors to remove
+            - nodes:            Nodes to add (or whose data to replace), by id
+        """
+        removed, added = list(removed), list(added)
+        seen = set()
+        for connector in removed:
+            if id(connector) in seen or not any(other is connector for other in self._adjs.get(connector.src, [])):
+                raise KeyError('Connector {} is not in the network.'.format(connector))
+            seen.add(id(connector))
+
+        added_nodes = []
+        for node, data in (nodes or {}).items():
+            if node not in self._nodes:
+                added_nodes.append(node)
+                self._adjs.setdefault(node, [])
+                self._adjs_rev.setdefault(node, [])
+            self._nodes[node] = data
+
+        for connector in removed:
+            self.remove_edge(connector)
+        for connector in added:
+            self.add_edge(connector)
+
+        self._version += 1
+        change = NetworkChange(version=self._version, added=added, removed=removed, added_nodes=added_nodes)
+        self._changes.append(change)
+
+        alive = []
+        for ref in self._listeners:
+            listener = ref()
+            if listener is not None:
+                listener(change)
+                alive.append(ref)
+        self._listeners = alive
+        return change
+
+    def subscribe(self, listener: Callable[[NetworkChange], None]):
+        """
+        Registers a callback notified of every change applied through edit().
+        Bound methods are held weakly, so that a subscribed cache can still be garbage collected.
+        """
+        if hasattr(listener, '__self__'):
+            self._listeners.append(weakref.WeakMethod(listener))
+        else:
+            self._listeners.append(lambda: listener)
+
+    def changes_since(self, version: int) -> list[NetworkChange]:
+        """
+        Returns the changes applied after a given version, oldest first.
+        Raises ValueError if some of them have been dropped from the change log (see MAX_CHANGES).
+        """
+        if version < self._version - len(self._changes):
+            raise ValueError('The changes after version {} have been dropped from the change log.'.format(version))
+        return [change for change in self._changes if change.version > version]
+
+    @property
+    def version(self) -> int:
+        """
+        Returns the number of changes applied through edit().
+        """
+        return self._version
+
+    def __getstate__(self):
+        # Listeners belong to the live process, and weak references cannot be pickled.
+        state = self.__dict__.copy()
+        state['_listeners'] = []
+        return state
+
+    def csr(self) -> NetworkCSR:
+        """
+        Returns the compressed sparse row (CSR) representation of the network.
+        The representation is built once and cached until the network is modified.
+        """
+        if self._csr is None:
+            self._csr = NetworkCSR.from_net(self)
+        return self._csr
+
+    def components(self) -> NetworkComponents:
+        """
+        Returns the strongly connected components of the network.
+        They are computed once and cached until the network is modified.
+        """
+        csr = self.csr()
+        if self._components is None or self._components.csr is not csr:
+            self._components = NetworkComponents(csr)
+        return self._components
 
     def shallow_copy(self):
         """
@@ -156,133 +313,148 @@ class Network(Generic[TNode, TConnector]):
         )
     
 @dataclass
-class HideableAdjacencyList(Generic[TConnector]):
+class NetworkReweightedConnector(NetworkConnector):
     """
-    Adjacency list with temporary deletion.
+    Defines an edge whose weight overrides the weight of an original connector.
+    Other attributes (route_ids, length, ...) are read from the original connector.
     """
-    obj:        Dict[int, Iterable[TConnector]]
-    hidden:     set[int]
+    connector:      NetworkConnector
+    new_weight:     float
 
-    def __getitem__(self, key):
-        if key not in self.obj:
-            return ()
+    @property
+    def weight(self) -> float:
+        """
+        Returns the overriding weight.
+        """
+        return self.new_weight
 
-        return filter(
-            (lambda connector: (connector.src not in self.hidden) and (connector.dest not in self.hidden)), 
-            self.obj[key]
-        )
+    def __getattr__(self, name):
+        if name == 'connector':
+            raise AttributeError(name)
+        return getattr(self.connector, name)
 
-class RemovableNetwork(Network[TNode, TConnector]):
+    def __hash__(self):
+        return id(self)
+
+class LazyAdjacencyList(Mapping):
     """
-    Implementation of a generic weighted network with node removability / hideability.
+    Read-only adjacency list whose entries are built on first access, then cached.
     """
-    _hidden:    set[int]
+    _keys:      Dict[int, object]
+    _build:     Callable[[int], list]
+    _cache:     Dict[int, list]
 
-    def __init__(self, nodes = None, adjs = None) -> None:
-        super().__init__(nodes, adjs)
-        for node in self._adjs:
-            self._adjs[node] = set(self._adjs[node])
-        for node in self._adjs_rev:
-            self._adjs_rev[node] = set(self._adjs_rev[node])
+    def __init__(self, keys: Dict[int, object], build: Callable[[int], list]):
+        self._keys = keys
+        self._build = build
+        self._cache = {}
 
-        self._hidden = set()
+    def __getitem__(self, key):
+        if key not in self._cache:
+            if key not in self._keys:
+                raise KeyError(key)
+            self._cache[key] = self._build(key)
+        return self._cache[key]
 
-    @classmethod
-    def from_net(cls, net: Network[TNode, TConnector]):
-        """
-        Converts a network to a removable network.
-        """
-        return cls(
-            nodes = copy.copy(net.nodes),
-            adjs = copy.copy(net.adjs)
-        )
-    
-    def add_edge(self, connector: TConnector):
-        """
-        Add an edge to the network.
-        """
-        src, dest = connector.ends
-        if src not in self._nodes:
-            self._nodes[src] = None
-        if dest not in self._nodes:
-            self._nodes[dest] = None
+    def __iter__(self):
+        return iter(self._keys)
 
-        if src not in self._adjs:
-            self._adjs[src] = set()
-        if dest not in self._adjs_rev:
-            self._adjs_rev[dest] = set()
+    def __len__(self):
+        return len(self._keys)
 
-        self._adjs[src].add(connector)
-        self._adjs_rev[dest].add(connector)
+class ReweightedNetwork(Generic[TNode, TConnector]):
+    """
+    Read-only view of a network whose edge weights are replaced by an array indexed by the edge ids of its CSR.
+    Nothing is copied up front: the view shares the CSR structure of the base network, and wraps connectors
+    into NetworkReweightedConnector only for the nodes an algorithm actually visits.
+    """
+    _base:      Network[TNode, TConnector]
+    _csr:       NetworkCSR
+    _components: NetworkComponents | None
+    _wrapped:   Dict[int, NetworkReweightedConnector]
+    _adjs:      LazyAdjacencyList
+    _adjs_rev:  LazyAdjacencyList
+
+    def __init__(self, base: Network[TNode, TConnector], weights):
+        self._base = base
+        self._csr = base.csr().with_weights(weights)
+        self._components = None
+        self._wrapped = {}
+        self._adjs = LazyAdjacencyList(base.adjs, lambda node: [
+            self._wrap(edge) for edge in self._csr.out_edges(self._csr.index[node])
+        ])
+        self._adjs_rev = LazyAdjacencyList(base.adjs_rev, lambda node: [
+            self._wrap(edge) for edge in self._csr.in_edges(self._csr.index[node])
+        ])
+
+    def _wrap(self, edge: int) -> NetworkReweightedConnector:
+        if edge not in self._wrapped:
+            connector = self._csr.connectors[edge]
+            self._wrapped[edge] = NetworkReweightedConnector(
+                src = connector.src, dest = connector.dest,
+                connector = connector, new_weight = float(self._csr.weights[edge])
+            )
+        return self._wrapped[edge]
 
-    def hide_node(self, node: int):
+    def __len__(self):
+        return len(self._base)
+
+    def degree(self, node_id):
         """
-        Temporarily hide a node.
+        Returns the out-degree of a node.
         """
-        self._hidden.add(node)
+        return self._base.degree(node_id)
 
-    def unhide_node(self, node: int):
+    def degree_rev(self, node_id):
         """
-        Temporarily unhide a node.
+        Returns the in-degree of a node.
         """
-        self._hidden.remove(node)
-    
-    def is_hidden(self, node: int):
+        return self._base.degree_rev(node_id)
+
+    def degrees(self):
         """
-        Returns if a node is hidden.
+        Returns the out-degree array.
         """
-        return node in self._hidden
+        return self._base.degrees()
 
-    def remove_node(self, node: int):
+    def components(self) -> NetworkComponents:
         """
-        Permanently remove a node.
+        Returns the strongly connected components of the view.
         """
-        connectors = self._adjs.pop(node, {})
-        connectors_rev = self._adjs_rev.pop(node, {})
-
-        for connector in connectors:
-            self._adjs_rev[connector.dest].remove(connector)
-        for connector_rev in connectors_rev:
-            self._adjs[connector_rev.src].remove(connector_rev)
+        if self._components is None:
+            self._components = NetworkComponents(self._csr)
+        return self._components
 
-        self._nodes.pop(node)
-
-    def is_removed(self, node: int):
+    def csr(self) -> NetworkCSR:
         """
-        Returns if a node is removed.
+        Returns the CSR of the base network, with the overriding weights.
         """
-        return node in self._nodes
+        return self._csr
 
-    def degree(self, node_id: int):
+    @property
+    def base(self) -> Network[TNode, TConnector]:
         """
-        Returns the out-degree of a node, taking hidden nodes into account.
+        Returns the underlying network.
         """
-        return sum(
-            1 
-            for connector in self._adjs.get(node_id, [])
-            if (connector.src not in self._hidden) and (connector.dest not in self._hidden)
-        )
-        
-    def degree_rev(self, node_id: int):
+        return self._base
+
+    @property
+    def nodes(self):
         """
-        Returns the in-degree of a node, taking hidden nodes into account.
+        Returns the set of nodes.
         """
-        return sum(
-            1 
-            for connector in self._adjs_rev.get(node_id, [])
-            if (connector.src not in self._hidden) and (connector.dest not in self._hidden)
-        )
+        return self._base.nodes
 
     @property
-    def adjs(self) -> HideableAdjacencyList:
+    def adjs(self) -> LazyAdjacencyList:
         """
-        Returns the hideable adjacency list.
+        Returns the (lazily reweighted) adjacency list.
         """
-        return HideableAdjacencyList(obj=self._adjs, hidden=self._hidden)
+        return self._adjs
 
     @property
-    def adjs_rev(self) -> HideableAdjacencyList:
+    def adjs_rev(self) -> LazyAdjacencyList:
         """
-        Returns the transposed hideable adjacency list.
+        Returns the (lazily reweighted) transposed adjacency list.
         """
-        return HideableAdjacencyList(obj=self._adjs_rev, hidden=self._hidden)
\ No newline at end of file
+        return self._adjs_rev
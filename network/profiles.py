@@ -0,0 +1,229 @@
+"""
+Module network.profiles
+"""
+from __future__ import annotations
+import bisect
+from typing import Iterable
+
+import numpy as np
+
+from network.csr import NetworkCSR
+
+class NetworkTravelTimeProfiles:
+    """
+    Time-of-day travel-time profiles of the edges of a NetworkCSR.
+
+    A shape is a periodic piecewise-linear function of the time of day, given by its breakpoints
+    (sorted times within [0, period)) and the factors applied to the static weight at those times.
+    Shapes are stored once in shared flat arrays and referenced by any number of edges, so
+    an edge only costs one integer: the travelling time of edge e departing at time t is
+        weights[e] * factor_k(t), where k = shape of edge e,
+    or simply weights[e] if the edge has no shape. Profiles are evaluated (interpolated) lazily
+    when an edge is relaxed, nothing is sampled in advance.
+
+    Times use the unit of the edge weights (minutes for a BusNetwork).
+    """
+    _csr:           NetworkCSR
+    _period:        float
+    _edge_shape:    np.ndarray
+    _offsets:       list[int]
+    _breakpoints:   list[float]
+    _factors:       list[float]
+    _min_factors:   list[float]
+
+    def __init__(self, csr: NetworkCSR, period: float = 24 * 60):
+        self._csr = csr
+        self._period = period
+        self._edge_shape = np.full(csr.no_edges, -1, dtype=np.int32)
+        self._offsets = [0]
+        self._breakpoints = []
+        self._factors = []
+        self._min_factors = []
+
+    @classmethod
+    def from_net(cls, net, **kwargs):
+        """
+        Initialise empty profiles for the CSR of the network.
+        """
+        return cls(net.csr(), **kwargs)
+
+    @classmethod
+    def from_arrays(cls, csr: NetworkCSR, arrays: dict[str, np.ndarray], period: float = 24 * 60):
+        """
+        Rebuilds profiles of a CSR from the arrays returned by arrays() (the edge shapes are not copied).
+        """
+        obj = cls.__new__(cls)
+        obj._csr = csr
+        obj._period = period
+        obj._edge_shape = arrays['profiles_edge_shape']
+        obj._offsets = arrays['profiles_offsets'].tolist()
+        obj._breakpoints = arrays['profiles_breakpoints'].tolist()
+        obj._factors = arrays['profiles_factors'].tolist()
+        obj._min_factors = arrays['profiles_min_factors'].tolist()
+        return obj
+
+    def arrays(self) -> dict[str, np.ndarray]:
+        """
+        Returns the profiles as flat arrays, by name.
+        """
+        return {
+            'profiles_edge_shape':  self._edge_shape,
+            'profiles_offsets':     np.array(self._offsets, dtype=np.int64),
+            'profiles_breakpoints': np.array(self._breakpoints, dtype=np.float64),
+            'profiles_factors':     np.array(self._factors, dtype=np.float64),
+            'profiles_min_factors': np.array(self._min_factors, dtype=np.float64),
+        }
+
+    def rebind(self, csr: NetworkCSR) -> 'NetworkTravelTimeProfiles':
+        """
+        Returns the profiles carried over to a newer CSR of the edited network. Shapes are shared;
+        connectors kept by the edit keep their shape, and new connectors start without one.
+        """
+        obj = NetworkTravelTimeProfiles.__new__(NetworkTravelTimeProfiles)
+        obj.__dict__.update(self.__dict__)
+        obj._csr = csr
+        edge_map = csr.edge_map(self._csr)
+        obj._edge_shape = np.where(edge_map >= 0, self._edge_shape[np.maximum(edge_map, 0)], -1).astype(np.int32)
+        return obj
+
+    def add_shape(self, breakpoints: Iterable[float], factors: Iterable[float]) -> int:
+        """
+        Stores a new shape and returns its id.
+        """
+        breakpoints, factors = list(breakpoints), list(factors)
+        if not breakpoints or len(breakpoints) != len(factors):
+            raise ValueError('A shape needs as many factors as breakpoints, and at least one.')
+        if any(t1 >= t2 for t1, t2 in zip(breakpoints, breakpoints[1:])):
+            raise ValueError('Breakpoints must be strictly increasing.')
+        if breakpoints[0] < 0 or breakpoints[-1] >= self._period:
+            raise ValueError('Breakpoints must lie within [0, period).')
+        if min(factors) <= 0:
+            raise ValueError('Factors must be positive.')
+
+        self._breakpoints.extend(breakpoints)
+        self._factors.extend(factors)
+        self._offsets.append(len(self._breakpoints))
+        self._min_factors.append(min(factors))
+        return len(self._min_factors) - 1
+
+    def assign(self, edges: Iterable[int], shape: int):
+        """
+        Assigns a shape to some edges (by edge id). Use shape = -1 to restore the static weight.
+        """
+        if not -1 <= shape < self.no_shapes:
+            raise ValueError('Unknown shape.')
+        self._edge_shape[list(edges)] = shape
+
+    def assign_route(self, route_ids: tuple[int, int], shape: int):
+        """
+        Assigns a shape to every connector of a bus variant.
+        """
+        self.assign((
+            edge
+            for edge, connector in enumerate(self._csr.connectors)
+            if getattr(connector, 'route_ids', None) == route_ids
+        ), shape)
+
+    def shape_of(self, edge: int) -> tuple[list[float], list[float]] | None:
+        """
+        Returns the (breakpoints, factors) of the shape of an edge, or None for a static edge.
+        """
+        shape = int(self._edge_shape[edge])
+        if shape < 0:
+            return None
+        lo, hi = self._offsets[shape], self._offsets[shape + 1]
+        return self._breakpoints[lo:hi], self._factors[lo:hi]
+
+    def factor(self, shape: int, time: float) -> float:
+        """
+        Returns the factor of a shape at a given time, by linear interpolation between its breakpoints.
+        """
+        lo, hi = self._offsets[shape], self._offsets[shape + 1]
+        breakpoints, factors = self._breakpoints, self._factors
+        time %= self._period
+
+        pos = bisect.bisect_right(breakpoints, time, lo, hi)
+        if pos == lo:
+            t1, f1 = breakpoints[hi - 1] - self._period, factors[hi - 1]
+        else:
+            t1, f1 = breakpoints[pos - 1], factors[pos - 1]
+        if pos == hi:
+            t2, f2 = breakpoints[lo] + self._period, factors[lo]
+        else:
+            t2, f2 = breakpoints[pos], factors[pos]
+
+        if t2 == t1:
+            return f1
+        return f1 + (f2 - f1) * (time - t1) / (t2 - t1)
+
+    def travel_time(self, edge: int, time: float, weight: float = None) -> float:
+        """
+        Returns the travelling time of an edge when departing at a given time.
+        """
+        if weight is None:
+            weight = float(self._csr.weights[edge])
+        shape = self._edge_shape[edge]
+        if shape < 0:
+            return weight
+        return weight * self.factor(shape, time)
+
+    def lower_bounds(self) -> np.ndarray:
+        """
+        Returns, for every edge, a lower bound of its travelling time over the whole period.
+        """
+        min_factors = np.array(self._min_factors + [1.0])
+        return self._csr.weights * min_factors[self._edge_shape]
+
+    def is_fifo(self) -> bool:
+        """
+        Returns if no edge can be overtaken by departing later (the FIFO property),
+        which time-dependent Dijkstra requires to be exact.
+        """
+        for shape in range(self.no_shapes):
+            edges = np.flatnonzero(self._edge_shape == shape)
+            if len(edges) == 0:
+                continue
+            lo, hi = self._offsets[shape], self._offsets[shape + 1]
+            times = self._breakpoints[lo:hi] + [self._breakpoints[lo] + self._period]
+            factors = self._factors[lo:hi] + [self._factors[lo]]
+            steepest = min(
+                (f2 - f1) / (t2 - t1)
+                for (t1, f1), (t2, f2) in zip(zip(times, factors), zip(times[1:], factors[1:]))
+            ) if hi - lo > 1 else 0.0
+            if steepest * float(self._csr.weights[edges].max()) < -1:
+                return False
+        return True
+
+    @property
+    def csr(self) -> NetworkCSR:
+        """
+        Returns the CSR whose edges carry the profiles.
+        """
+        return self._csr
+
+    @property
+    def period(self) -> float:
+        """
+        Returns the period of the profiles.
+        """
+        return self._period
+
+    @property
+    def edge_shape(self) -> np.ndarray:
+        """
+        Returns the mapping from an edge id to its shape id (-1 for a static edge).
+        """
+        return self._edge_shape
+
+    @property
+    def no_shapes(self) -> int:
+        """
+        Returns the number of stored shapes.
+        """
+        return len(self._min_factors)
+
+    def nbytes(self) -> int:
+        """
+        Returns the memory used by the profiles, in bytes (8 bytes per stored number).
+        """
+        return self._edge_shape.nbytes + 8 * (len(self._offsets) + 2 * len(self._breakpoints) + len(self._min_factors))
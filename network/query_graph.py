@@ -0,0 +1,258 @@
+"""
+Module network.query_graph
+"""
+from __future__ import annotations
+from dataclasses import dataclass
+from typing import Dict, Generic
+
+from network.network import Network, NetworkConnector, TNode, TConnector
+
+@dataclass
+class NetworkChainConnector(NetworkConnector):
+    """
+    Defines an edge standing for a chain of consecutive connectors through pass-through nodes.
+    """
+    connectors:     list[NetworkConnector]
+    chain_weight:   float
+
+    @property
+    def weight(self) -> float:
+        """
+        Returns the total weight of the chain.
+        """
+        return self.chain_weight
+
+    @property
+    def stops(self) -> list[int]:
+        """
+        Returns the nodes passed through by the chain, ends included.
+        """
+        return [self.src, *(connector.dest for connector in self.connectors)]
+
+    def unpack(self):
+        """
+        Returns the original connectors of the chain as a generator.
+        """
+        for connector in self.connectors:
+            yield from connector.unpack()
+
+    def __hash__(self):
+        return id(self)
+
+class NetworkQueryGraph(Network[TNode, NetworkConnector]):
+    """
+    Query graph derived from a network, for faster searches.
+    - Parallel edges are deduplicated: only the min-weight connector of every ordered (src, dest) pair is kept;
+      the others are listed in a side table (alternatives(src, dest)).
+    - Pass-through nodes are compressed away: a node whose only neighbours are one predecessor and another
+      successor, or the same two nodes both ways, lies inside a chain, and every chain is replaced by
+      a single NetworkChainConnector, unpacking back to the original connectors.
+    Compressed nodes are not nodes of the query graph; NetworkQueryGraphSearch answers queries from or to them.
+    """
+    _base:          Network[TNode, TConnector]
+    _alternatives:  Dict[tuple[int, int], list[TConnector]]
+    _chains:        list[NetworkChainConnector]
+    _chains_of:     Dict[int, list[tuple[NetworkChainConnector, int]]]
+
+    @classmethod
+    def from_net(cls, net: Network[TNode, TConnector], compress_chains: bool = True) -> 'NetworkQueryGraph':
+        """
+        Builds the query graph of a network.
+        """
+        # pylint: disable=too-many-locals, protected-access
+        best, alternatives = {}, {}
+        for node in net.nodes:
+            for connector in net.adjs[node]:
+                ends = connector.ends
+                if ends not in best:
+                    best[ends] = connector
+                    continue
+                alternatives.setdefault(ends, [best[ends]]).append(connector)
+                if connector.weight < best[ends].weight:
+                    best[ends] = connector
+        for connectors in alternatives.values():
+            connectors.sort(key=lambda connector: connector.weight)
+
+        succs = {node: set() for node in net.nodes}
+        preds = {node: set() for node in net.nodes}
+        for src, dest in best:
+            succs[src].add(dest)
+            preds[dest].add(src)
+
+        def is_interior(node: int) -> bool:
+            if not compress_chains or node in succs[node]:
+                return False
+            return (len(preds[node]) == 1 and len(succs[node]) == 1 and preds[node] != succs[node]) \
+                or (len(preds[node]) == 2 and preds[node] == succs[node])
+        interior = {node for node in net.nodes if is_interior(node)}
+
+        chains, chains_of = [], {}
+        for (src, dest), connector in best.items():
+            if src in interior or dest not in interior:
+                continue
+            connectors, prev, node = [connector], src, dest
+            while node in interior:
+                chains_of.setdefault(node, []).append((len(chains), len(connectors)))
+                (succ,) = succs[node] - {prev}
+                connectors.append(best[node, succ])
+                prev, node = node, succ
+
+            chain_weight = 0.0
+            for connector in connectors:
+                chain_weight += connector.weight
+            chains.append(NetworkChainConnector(
+                src = src, dest = node, connectors = connectors, chain_weight = chain_weight
+            ))
+
+        # Cycles made of interior nodes only are never entered by a chain: their nodes are kept.
+        interior = set(chains_of)
+
+        edges = {ends: connector for ends, connector in best.items() if not interior.intersection(ends)}
+        for chain in chains:
+            if chain.src == chain.dest:
+                continue
+            if chain.ends not in edges or chain.weight < edges[chain.ends].weight:
+                edges[chain.ends] = chain
+
+        nodes = {node: data for node, data in net.nodes.items() if node not in interior}
+        adjs = {node: [] for node in nodes}
+        for connector in edges.values():
+            adjs[connector.src].append(connector)
+
+        graph = cls(nodes, adjs)
+        graph._base = net
+        graph._alternatives = alternatives
+        graph._chains = chains
+        graph._chains_of = {
+            node: [(chains[chain], idx) for chain, idx in positions] for node, positions in chains_of.items()
+        }
+        return graph
+
+    def alternatives(self, src: int, dest: int) -> list[TConnector]:
+        """
+        Returns the connectors of the base network from source src to destination dest, lightest first
+        (one per route for a bus network).
+        """
+        if (src, dest) in self._alternatives:
+            return self._alternatives[src, dest]
+        return [
+            connector for connector in self._base.adjs[src] if connector.dest == dest
+        ] if src in self._base.nodes else []
+
+    def is_compressed(self, node: int) -> bool:
+        """
+        Returns if a node of the base network lies inside a chain.
+        """
+        return node in self._chains_of
+
+    def chains_of(self, node: int) -> list[tuple[NetworkChainConnector, int]]:
+        """
+        Returns the chains passing through a compressed node, with the index of the first connector
+        of each chain leaving the node.
+        """
+        return self._chains_of.get(node, [])
+
+    @staticmethod
+    def expand(connectors: list[NetworkConnector]) -> list[NetworkConnector]:
+        """
+        Returns a path of the query graph as connectors of the base network.
+        """
+        return [original for connector in connectors for original in connector.unpack()]
+
+    @property
+    def base(self) -> Network[TNode, TConnector]:
+        """
+        Returns the base network.
+        """
+        return self._base
+
+    @property
+    def chains(self) -> list[NetworkChainConnector]:
+        """
+        Returns every chain found, including those shadowed by a lighter parallel edge.
+        """
+        return self._chains
+
+    @property
+    def no_parallel_edges(self) -> int:
+        """
+        Returns the number of connectors of the base network dropped as a heavier parallel edge.
+        """
+        return sum(len(connectors) - 1 for connectors in self._alternatives.values())
+
+class NetworkQueryGraphSearch(Generic[TNode, TConnector]):
+    """
+    Shortest paths of a network, searched on its query graph by any engine type exposing
+    from_net(net, **kwargs) and path(src, dest), and answered with the connectors of the network.
+    A query from a compressed node leaves it along each chain passing through it, a query to a compressed
+    node enters it along each chain, and nodes of the same chain are also joined along the chain directly.
+    Lengths are summed along the expanded path in path order, as a Dijkstra search on the network itself does.
+    """
+    _graph:     NetworkQueryGraph[TNode]
+    _engine:    object
+
+    @classmethod
+    def from_net(cls, net: Network[TNode, TConnector], engine_type, **kwargs):
+        """
+        Initialise from a network (its query graph is built) or from a query graph.
+        """
+        obj = cls()
+        obj._graph = net if isinstance(net, NetworkQueryGraph) else NetworkQueryGraph.from_net(net)
+        obj._engine = engine_type.from_net(obj._graph, **kwargs)
+        return obj
+
+    def _exits(self, node: int) -> list[tuple[int, list[NetworkConnector]]]:
+        if node in self._graph.nodes:
+            return [(node, [])]
+        return [(chain.dest, chain.connectors[idx:]) for chain, idx in self._graph.chains_of(node)]
+
+    def _entries(self, node: int) -> list[tuple[int, list[NetworkConnector]]]:
+        if node in self._graph.nodes:
+            return [(node, [])]
+        return [(chain.src, chain.connectors[:idx]) for chain, idx in self._graph.chains_of(node)]
+
+    def path(self, src: int, dest: int) -> tuple[float, list[TConnector]]:
+        """
+        Returns the shortest path from source src to destination dest.
+        """
+        if src == dest:
+            return 0, []
+
+        candidates = [
+            chain.connectors[idx_src:idx_dest]
+            for chain, idx_src in self._graph.chains_of(src)
+            for other, idx_dest in self._graph.chains_of(dest)
+            if chain is other and idx_src < idx_dest
+        ]
+        for exit_node, head in self._exits(src):
+            for entry_node, tail in self._entries(dest):
+                if exit_node == entry_node:
+                    candidates.append(head + tail)
+                    continue
+                dist, connectors = self._engine.path(exit_node, entry_node)
+                if dist != float('inf'):
+                    candidates.append(head + list(connectors) + tail)
+
+        best, best_path = float('inf'), []
+        for connectors in candidates:
+            expanded = self._graph.expand(connectors)
+            dist = 0
+            for connector in expanded:
+                dist += connector.weight
+            if dist < best:
+                best, best_path = dist, expanded
+        return best, best_path
+
+    @property
+    def query_graph(self) -> NetworkQueryGraph[TNode]:
+        """
+        Returns the query graph searched.
+        """
+        return self._graph
+
+    @property
+    def engine(self):
+        """
+        Returns the engine searching the query graph.
+        """
+        return self._engine
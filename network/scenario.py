@@ -0,0 +1,300 @@
+"""
+Module network.scenario
+"""
+from __future__ import annotations
+from collections.abc import Mapping
+from typing import Dict, Generic, Iterable
+
+from network.components import NetworkComponents
+from network.csr import NetworkCSR
+from network.network import Network, NetworkConnector, NetworkReweightedConnector, TNode, TConnector
+
+class ScenarioAdjacencyList(Mapping):
+    """
+    Read-only adjacency list of a scenario. Entries of untouched nodes are the lists of the base network
+    themselves; entries of touched nodes are patched on first access, then cached.
+    """
+    _scenario:  'NetworkScenario'
+    _base:      Mapping
+    _cache:     Dict[int, list]
+
+    def __init__(self, scenario: 'NetworkScenario', base: Mapping):
+        self._scenario = scenario
+        self._base = base
+        self._cache = {}
+
+    def __getitem__(self, key):
+        if key not in self._scenario.touched_nodes:
+            return self._base[key]
+        if key not in self._cache:
+            self._cache[key] = self._scenario.patch(self._base[key])
+        return self._cache[key]
+
+    def __iter__(self):
+        return iter(self._base)
+
+    def __len__(self):
+        return len(self._base)
+
+    def clear(self):
+        """
+        Forgets the patched entries.
+        """
+        self._cache.clear()
+
+class NetworkScenario(Generic[TNode, TConnector]):
+    """
+    Copy-on-write what-if overlay on a shared base network.
+    Node closures, edge removals and weight overrides are recorded as small patches; nothing of the base
+    network is copied. Only the adjacency entries of touched nodes are rebuilt (with NetworkReweightedConnector
+    for overridden edges), and csr() shares the CSR structure of the base network with a patched weight array,
+    removed edges weighing infinity. A scenario can be passed to any engine in place of the base network.
+    Closed nodes stay in the network, without any edge.
+    """
+    _base:          Network[TNode, TConnector]
+    _name:          str
+    _closed:        set[int]
+    _removed:       Dict[int, NetworkConnector]
+    _weights:       Dict[int, tuple[NetworkConnector, float]]
+    _touched:       set[int]
+    _wrapped:       Dict[int, NetworkReweightedConnector]
+    _adjs:          ScenarioAdjacencyList
+    _adjs_rev:      ScenarioAdjacencyList
+    _csr:           NetworkCSR | None
+    _csr_base:      NetworkCSR | None
+    _components:    NetworkComponents | None
+    _version:       int
+
+    def __init__(self, base: Network[TNode, TConnector], name: str = None):
+        self._base = base
+        self._name = name
+        self._closed = set()
+        self._removed = {}
+        self._weights = {}
+        self._touched = set()
+        self._wrapped = {}
+        self._adjs = ScenarioAdjacencyList(self, base.adjs)
+        self._adjs_rev = ScenarioAdjacencyList(self, base.adjs_rev)
+        self._csr, self._csr_base = None, None
+        self._components = None
+        self._version = 0
+        if hasattr(base, 'subscribe'):
+            base.subscribe(self._on_base_change)
+
+    def _on_base_change(self, change):
+        # pylint: disable=unused-argument
+        self._modified(())
+
+    def _modified(self, nodes: Iterable[int]):
+        self._touched.update(nodes)
+        self._adjs.clear()
+        self._adjs_rev.clear()
+        self._wrapped.clear()
+        self._csr = None
+        self._version += 1
+
+    def close_node(self, node: int) -> 'NetworkScenario':
+        """
+        Closes a node: every edge from or to it is removed.
+        """
+        if node not in self._base.nodes:
+            raise KeyError('Node {} is not in the network.'.format(node))
+        self._closed.add(node)
+        neighbours = [connector.dest for connector in self._base.adjs[node]]
+        neighbours += [connector.src for connector in self._base.adjs_rev[node]]
+        self._modified([node, *neighbours])
+        return self
+
+    def remove_edge(self, connector: NetworkConnector) -> 'NetworkScenario':
+        """
+        Removes an edge (a connector of the base network).
+        """
+        self._removed[id(connector)] = connector
+        self._modified(connector.ends)
+        return self
+
+    def override_weight(self, connector: NetworkConnector, weight: float) -> 'NetworkScenario':
+        """
+        Replaces the weight of an edge (a connector of the base network).
+        """
+        self._weights[id(connector)] = (connector, weight)
+        self._modified(connector.ends)
+        return self
+
+    def scale_weight(self, connector: NetworkConnector, factor: float) -> 'NetworkScenario':
+        """
+        Multiplies the (possibly already overridden) weight of an edge by a factor.
+        """
+        return self.override_weight(connector, self.weight_of(connector) * factor)
+
+    def weight_of(self, connector: NetworkConnector) -> float:
+        """
+        Returns the weight of a connector of the base network in the scenario (infinity if removed).
+        """
+        if not self.is_open(connector):
+            return float('inf')
+        if id(connector) in self._weights:
+            return self._weights[id(connector)][1]
+        return connector.weight
+
+    def is_open(self, connector: NetworkConnector) -> bool:
+        """
+        Returns if a connector of the base network is kept in the scenario.
+        """
+        return id(connector) not in self._removed and connector.src not in self._closed \
+            and connector.dest not in self._closed
+
+    def patch(self, connectors: Iterable[NetworkConnector]) -> list[NetworkConnector]:
+        """
+        Returns the connectors of a base adjacency entry as seen in the scenario.
+        """
+        patched = []
+        for connector in connectors:
+            if not self.is_open(connector):
+                continue
+            if id(connector) in self._weights:
+                if id(connector) not in self._wrapped:
+                    self._wrapped[id(connector)] = NetworkReweightedConnector(
+                        src = connector.src, dest = connector.dest,
+                        connector = connector, new_weight = self._weights[id(connector)][1]
+                    )
+                connector = self._wrapped[id(connector)]
+            patched.append(connector)
+        return patched
+
+    def reset(self) -> 'NetworkScenario':
+        """
+        Drops every patch.
+        """
+        self._closed.clear()
+        self._removed.clear()
+        self._weights.clear()
+        self._modified(())
+        self._touched.clear()
+        return self
+
+    def csr(self) -> NetworkCSR:
+        """
+        Returns the CSR of the scenario: the CSR structure of the base network with a patched weight array.
+        """
+        base_csr = self._base.csr()
+        if self._csr is not None and self._csr_base is base_csr:
+            return self._csr
+
+        weights = base_csr.weights.copy()
+        index, connectors = base_csr.index, base_csr.connectors
+        # Every edge of the scenario whose weight differs starts from a touched node.
+        for node in self._touched:
+            for edge in base_csr.out_edges(index[node]):
+                weights[edge] = self.weight_of(connectors[edge])
+
+        self._csr, self._csr_base = base_csr.with_weights(weights), base_csr
+        return self._csr
+
+    def components(self) -> NetworkComponents:
+        """
+        Returns the strongly connected components of the scenario (removed edges ignored).
+        """
+        csr = self.csr()
+        if self._components is None or self._components.csr is not csr:
+            self._components = NetworkComponents(csr)
+        return self._components
+
+    def __len__(self):
+        return len(self._base)
+
+    def degree(self, node_id):
+        """
+        Returns the out-degree of a node.
+        """
+        return len(self._adjs[node_id])
+
+    def degree_rev(self, node_id):
+        """
+        Returns the in-degree of a node.
+        """
+        return len(self._adjs_rev[node_id])
+
+    def degrees(self):
+        """
+        Returns the out-degree array.
+        """
+        return (self.degree(node) for node in self._adjs)
+
+    @property
+    def nodes(self):
+        """
+        Returns the set of nodes (closed nodes included).
+        """
+        return self._base.nodes
+
+    @property
+    def adjs(self) -> ScenarioAdjacencyList:
+        """
+        Returns the adjacency list.
+        """
+        return self._adjs
+
+    @property
+    def adjs_rev(self) -> ScenarioAdjacencyList:
+        """
+        Returns the transposed adjacency list.
+        """
+        return self._adjs_rev
+
+    @property
+    def base(self) -> Network[TNode, TConnector]:
+        """
+        Returns the base network.
+        """
+        return self._base
+
+    @property
+    def name(self) -> str:
+        """
+        Returns the name of the scenario.
+        """
+        return self._name
+
+    @property
+    def version(self) -> int:
+        """
+        Returns the number of patches applied to the scenario (resets included) and changes of its base network.
+        """
+        return self._version
+
+    @property
+    def closed_nodes(self) -> set[int]:
+        """
+        Returns the closed nodes.
+        """
+        return self._closed
+
+    @property
+    def touched_nodes(self) -> set[int]:
+        """
+        Returns the nodes whose adjacency differs from the base network.
+        """
+        return self._touched
+
+    def __repr__(self) -> str:
+        return 'NetworkScenario(name={}, closed={}, removed={}, overridden={})'.format(
+            self._name, len(self._closed), len(self._removed), len(self._weights)
+        )
+
+def evaluate_scenarios(
+    scenarios: Iterable[NetworkScenario], pairs: Iterable[tuple[int, int]], engine_type, **kwargs
+) -> Dict[str, list[float]]:
+    """
+    Evaluates the shortest path lengths of (source, destination) pairs side by side in several scenarios,
+    with an engine type exposing from_net(net, **kwargs) and path(src, dest).
+    Returns the lengths by scenario name (or position, for unnamed scenarios).
+    """
+    pairs = list(pairs)
+    results = {}
+    for idx, scenario in enumerate(scenarios):
+        engine = engine_type.from_net(scenario, **kwargs)
+        results[scenario.name if scenario.name is not None else idx] = [
+            engine.path(src, dest)[0] for src, dest in pairs
+        ]
+    return results
@@ -6,8 +6,13 @@ Contains:
     + Bidirectional Dijkstra
     + Contraction Hierarchies
     + A*
+    + Route-aware Dijkstra and A*, with transfer penalties and boarding costs
+    + Time-dependent Dijkstra and Bidirectional Dijkstra
 - Network analysis algorithms based on shortest paths, including
     + Betweenness Centrality analysis
+    + Stop-closure impact analysis
+- Batch queries answered by a pool of worker processes over shared memory
+- Result cache (LRU, TTL, memory cap, on-disk tier) wrapping any engine
 """
 
 from network.shortest_paths.dijkstra import \
@@ -15,7 +20,8 @@ from network.shortest_paths.dijkstra import \
     NetworkDijkstraLocalSteps, \
     NetworkDijkstraLocalDistance, \
     NetworkDijkstraSingleDestination, \
-    NetworkDijkstraDescendantsCount
+    NetworkDijkstraDescendantsCount, \
+    NetworkDijkstraOneToMany
 
 from network.shortest_paths.a_star import \
     NetworkSpatialAStar
@@ -23,5 +29,31 @@ from network.shortest_paths.a_star import \
 from network.shortest_paths.bidirectional_dijkstra import \
     NetworkBidirectionalDijkstra
 
+from network.shortest_paths.route_aware import \
+    NetworkRouteAwareDijkstra, \
+    NetworkRouteAwareSpatialAStar
+
+from network.shortest_paths.time_dependent import \
+    NetworkTimeDependentDijkstra, \
+    NetworkTimeDependentBidirectionalDijkstra
+
 from network.shortest_paths.betweenness import \
-    NetworkAnalysisBetweenness
\ No newline at end of file
+    NetworkAnalysisBetweenness
+
+from network.shortest_paths.closure_impact import \
+    NetworkAnalysisClosureImpact, \
+    NetworkClosureImpact
+
+from network.shortest_paths.workspace import \
+    NetworkSearchWorkspace
+
+from network.shortest_paths.batch import \
+    NetworkBatchQueries, \
+    NetworkBatchSpec, \
+    NetworkSharedArrays, \
+    NetworkSharedGraph
+
+from network.shortest_paths.cache import \
+    NetworkCachedEngine, \
+    NetworkResultCache, \
+    NetworkResultStore
@@ -1,34 +1,33 @@
 """
 Module network.shortest_paths.a_star
 """
+from __future__ import annotations
+import heapq
 import math
 
-from queue import PriorityQueue
 from typing import Dict
 from network import Network
+from network.components import unreachable
+from network.shortest_paths.workspace import NetworkSearchWorkspace, NetworkSearchContext, NetworkQueryContexts
+from network.shortest_paths.batch import NetworkBatchQueries, NetworkBatchSpec
 
-class NetworkSpatialAStar:
+class NetworkSpatialAStar(NetworkBatchQueries):
     """
     Implementation of the A* algorithm.
+    The search runs on the CSR of the network, in a workspace whose buffers are reused between queries;
+    the node coordinates are read once per CSR. The state of a query is kept in a per-thread context,
+    so that one engine answers concurrent queries.
     """
     _net:       Network
     _INFINITY:  float
-    _f:         Dict[int, float]
-    _g:         Dict[int, float]
-    _pars:      Dict[int, int]
-    _pq:        PriorityQueue
-    _src:       int
-
-    @property
-    def _is_terminated(self):
-        return False
-
-    def _update_per_iteration(self):
-        return
+    _coords:    tuple[object, list]
+    _contexts:  NetworkQueryContexts[NetworkSearchContext]
 
     def _from_net(self, net: Network, INFINITY: float = float('inf')):
         self._net = net
         self._INFINITY = INFINITY
+        self._coords = (None, [])
+        self._contexts = NetworkQueryContexts(NetworkSearchContext)
         return self
 
     @classmethod
@@ -37,56 +36,69 @@ class NetworkSpatialAStar:
         Initialise from the network.
         """
         return cls()._from_net(net, **kwargs)
-    
-    def _reverse_path_from(self, dest: int):
-        if self._g.get(dest) is None:
-            return
 
-        while dest != self._src:
-            connector = self._pars[dest]
-            yield connector
-            dest = connector.src
-
-    def _path_to(self, dest: int):
-        return reversed(list(self._reverse_path_from(dest=dest)))
+    def _coords_of(self, workspace: NetworkSearchWorkspace) -> list:
+        csr, coords = self._coords
+        if csr is not workspace.csr:
+            nodes = self._net.nodes
+            coords = [nodes[node].coord if node in nodes else None for node in workspace.ids]
+            # Swapped as a single tuple, so that concurrent queries never see a mismatching pair.
+            self._coords = (workspace.csr, coords)
+        return coords
 
     def path(self, src: int, dest: int) -> None:
         """
         Returns the shortest path from source src to destination dest.
         """
-        def _h(node: int):
-            return math.dist(self._net.nodes[node].coord, self._net.nodes[dest].coord)
-
-        self._g = {}
-        self._f = {}
-        self._pars = {}
-        self._src = src
-
-        self._g[src] = 0
-        self._f[src] = _h(src)
-
-        self._pq = PriorityQueue()
-        self._pq.put((self._f[src], src))
-
-        while not self._pq.empty():
-            f_u, u = self._pq.get()
-            if f_u != self._f.get(u, self._INFINITY):
+        # pylint: disable=too-many-locals
+        INFINITY = self._INFINITY
+        context = self._contexts.get()
+        workspace = context.workspace(self._net, INFINITY)
+        workspace.reset()
+        context.src, context.dest = src, dest
+
+        if unreachable(self._net, src, dest):
+            return INFINITY, []
+
+        index, coords, dist = workspace.index, self._coords_of(workspace), math.dist
+        s, t = context.s, context.t = index[src], index[dest]
+        coord_t = coords[t]
+        workspace.seed(s, 0)
+        dists, pars, stamps, generation, touched, pq = workspace.buffers
+        # Queue entries are (f, g, node): an entry is stale once the distance g of its node has decreased.
+        pq[0] = (dist(coords[s], coord_t), 0, s)
+        view = workspace.csr.view
+        offsets, heads, weights = view.offsets, view.heads, view.weights
+
+        while pq:
+            _, g_u, u = heapq.heappop(pq)
+            if g_u != dists[u]:
                 continue
 
-            print(u, self._g[u], _h(u))
-
-            if u == dest:
-                return self._g[u], list(self._path_to(dest))
-
-            for connector in self._net.adjs[u]:
-                v, w = connector.dest, connector.weight
-                if self._g.get(v, self._INFINITY) > self._g.get(u, self._INFINITY) + w:
-                    self._g[v] = self._g[u] + w
-                    self._f[v] = self._g[v] + _h(v)
-                    self._pars[v] = connector
-                    self._pq.put((self._f[v], v))
-
-        return self._INFINITY, []
+            if u == t:
+                path = workspace.reverse_path_from(s, t)
+                path.reverse()
+                return g_u, path
+
+            for edge in range(offsets[u], offsets[u + 1]):
+                v = heads[edge]
+                g_v = g_u + weights[edge]
+                if stamps[v] == generation:
+                    if dists[v] <= g_v:
+                        continue
+                elif not g_v < INFINITY:
+                    continue
+                else:
+                    stamps[v] = generation
+                    touched.append(v)
+                dists[v] = g_v
+                pars[v] = edge
+                heapq.heappush(pq, (g_v + dist(coords[v], coord_t), g_v, v))
+
+        return INFINITY, []
+
+    def _batch_spec(self) -> NetworkBatchSpec:
+        return NetworkBatchSpec(self._net, type(self).from_net, {'INFINITY': self._INFINITY})
 
     @property
     def INFINITY(self):
@@ -100,21 +112,28 @@ class NetworkSpatialAStar:
         """
         Returns the source from which the algorithm runs.
         """
-        return self._src
+        return self._contexts.get().src
 
     @property
     def dists(self):
         """
         Returns the distance array after the algorithm execution.
         """
-        return self._f
+        context = self._contexts.get()
+        workspace = context.workspaces[0]
+        coords = self._coords_of(workspace)
+        coord_t = coords[workspace.index[context.dest]]
+        ids, dists = workspace.ids, workspace.buffers[0]
+        return {ids[idx]: dists[idx] + math.dist(coords[idx], coord_t) for idx in workspace.touched}
 
     @property
     def pars(self):
         """
         Returns the parents array after the algorithm execution.
         """
-        return self._pars
+        workspace = self._contexts.get().workspaces[0]
+        ids, pars = workspace.ids, workspace.buffers[1]
+        return {ids[idx]: workspace.connector(pars[idx]) for idx in workspace.touched if pars[idx] != -1}
 
     @property
     def search_space(self) -> Dict[int, float]:
@@ -123,6 +142,6 @@ class NetworkSpatialAStar:
         """
         return {
             node: d_node
-            for (node, d_node) in self._f.items()
+            for (node, d_node) in self.dists.items()
             if d_node != self._INFINITY
-        }
\ No newline at end of file
+        }
@@ -0,0 +1,489 @@
+"""
+Module network.shortest_paths.batch
+"""
+from __future__ import annotations
+import multiprocessing
+from dataclasses import dataclass, field
+from multiprocessing import shared_memory
+from typing import Callable, Dict, Iterable, Iterator
+
+import numpy as np
+
+from network.csr import NetworkCSR
+from network.components import NetworkComponents
+from network.network import NetworkConnector, LazyAdjacencyList
+from network.shortest_paths.workspace import reweighted_connector
+
+class NetworkSharedArrays:
+    """
+    NumPy arrays published in a single block of shared memory, so that worker processes read them in place
+    instead of receiving pickled copies. The spec of the block (its name and the layout of the arrays) is all
+    a worker needs to attach to it; arrays of an attached block are read-only.
+    """
+    _shm:       shared_memory.SharedMemory
+    _layout:    list[tuple[str, str, tuple[int, ...], int]]
+    _arrays:    Dict[str, np.ndarray]
+    _owner:     bool
+
+    ALIGNMENT = 64
+
+    @classmethod
+    def publish(cls, arrays: Dict[str, np.ndarray]):
+        """
+        Copies the arrays into a new block of shared memory, owned (and unlinked on close) by the caller.
+        """
+        layout, size = [], 0
+        for key, arr in arrays.items():
+            arr = np.asarray(arr)
+            layout.append((key, arr.dtype.str, arr.shape, size))
+            size += -(-arr.nbytes // cls.ALIGNMENT) * cls.ALIGNMENT
+
+        obj = cls()
+        obj._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        obj._layout, obj._owner = layout, True
+        obj._bind(writeable=True)
+        for key, arr in arrays.items():
+            obj._arrays[key][...] = arr
+        for arr in obj._arrays.values():
+            arr.flags.writeable = False
+        return obj
+
+    @classmethod
+    def attach(cls, spec: tuple[str, list]):
+        """
+        Attaches to a block published by another process, given its spec.
+        """
+        obj = cls()
+        name, obj._layout = spec
+        obj._shm = shared_memory.SharedMemory(name=name)
+        obj._owner = False
+        return obj._bind(writeable=False)
+
+    def _bind(self, writeable: bool):
+        self._arrays = {}
+        for key, dtype, shape, offset in self._layout:
+            arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=self._shm.buf, offset=offset)
+            arr.flags.writeable = writeable
+            self._arrays[key] = arr
+        return self
+
+    def close(self):
+        """
+        Releases the arrays and detaches from the block; the owner also frees the block.
+        Arrays and views of the block must not be used afterwards.
+        """
+        self._arrays = {}
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def spec(self) -> tuple[str, list]:
+        """
+        Returns the name and layout of the block, to be passed to attach().
+        """
+        return self._shm.name, self._layout
+
+    @property
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Returns the arrays by name.
+        """
+        return self._arrays
+
+    def nbytes(self) -> int:
+        """
+        Returns the size of the block, in bytes.
+        """
+        return self._shm.size
+
+class NetworkSharedConnector(NetworkConnector):
+    """
+    A connector of a NetworkSharedGraph, known by the id of its edge in the shared arrays.
+    """
+    def __init__(self, src: int, dest: int, edge: int, weight: float, route_ids: tuple[int, int] = None):
+        # pylint: disable=too-many-arguments
+        super().__init__(
+            src = src,
+            dest = dest
+        )
+        self._edge = edge
+        self._weight = weight
+        self.route_ids = route_ids
+
+    @property
+    def edge(self) -> int:
+        """
+        Returns the edge id of the connector.
+        """
+        return self._edge
+
+    @property
+    def weight(self) -> float:
+        """
+        Returns the weight of the edge.
+        """
+        return self._weight
+
+    def __hash__(self):
+        return id(self)
+
+@dataclass(frozen=True)
+class NetworkSharedNode:
+    """
+    A node of a NetworkSharedGraph.
+    """
+    coord:      tuple[float, float]
+
+class NetworkSharedGraph:
+    """
+    Read-only stand-in of a network in a worker process, rebuilt from the arrays of its CSR in shared memory.
+    It provides what the search engines read from a network: csr(), components(), the nodes with their coord,
+    and the adjacency lists; its connectors are NetworkSharedConnector, carrying their edge id in the CSR,
+    so that paths found in a worker are sent back as edge ids.
+    The arrays of an engine shared along with the CSR are kept in arrays.
+    """
+    _csr:           NetworkCSR
+    _components:    NetworkComponents | None
+    _nodes:         Dict[int, NetworkSharedNode]
+    _adjs:          LazyAdjacencyList
+    _adjs_rev:      LazyAdjacencyList
+    _arrays:        Dict[str, np.ndarray]
+
+    CSR_ARRAYS = ('ids', 'offsets', 'heads', 'tails', 'weights', 'offsets_rev', 'edges_rev')
+
+    @classmethod
+    def arrays_of(cls, net) -> tuple[Dict[str, np.ndarray], list]:
+        """
+        Returns the arrays describing the CSR of a network (prefixed with 'csr_'), the coordinates of its
+        nodes ('coords', NaN for nodes without coordinates) and the route of its edges ('routes'),
+        along with the table of the routes (route_ids by route index).
+        """
+        csr = net.csr()
+        arrays = {'csr_' + name: getattr(csr, name) for name in cls.CSR_ARRAYS}
+
+        nodes = net.nodes
+        coords = np.full((len(csr), 2), np.nan, dtype=np.float64)
+        for idx, node in enumerate(csr.ids.tolist()):
+            coord = getattr(nodes[node], 'coord', None) if node in nodes else None
+            if coord is not None:
+                coords[idx] = coord
+        arrays['coords'] = coords
+
+        route_index = {}
+        arrays['routes'] = np.fromiter(
+            (route_index.setdefault(getattr(connector, 'route_ids', None), len(route_index))
+             for connector in csr.connectors),
+            dtype=np.int32, count=csr.no_edges
+        )
+        return arrays, list(route_index)
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], route_ids: list):
+        """
+        Rebuilds the graph from the arrays and the route table returned by arrays_of().
+        """
+        obj = cls()
+        ids, tails, heads, weights = (arrays['csr_' + name].tolist() for name in ('ids', 'tails', 'heads', 'weights'))
+        connectors = [
+            NetworkSharedConnector(ids[tail], ids[head], edge, weight, route_ids[route])
+            for edge, (tail, head, weight, route) in enumerate(zip(tails, heads, weights, arrays['routes'].tolist()))
+        ]
+        obj._csr = NetworkCSR(*(arrays['csr_' + name] for name in cls.CSR_ARRAYS), connectors)
+        obj._components = None
+        obj._nodes = {
+            node: NetworkSharedNode((x, y))
+            for node, (x, y) in zip(ids, arrays['coords'].tolist()) if x == x and y == y
+        }
+
+        csr = obj._csr
+        obj._adjs = LazyAdjacencyList(csr.index, lambda node: [
+            connectors[edge] for edge in csr.out_edges(csr.index[node])
+        ])
+        obj._adjs_rev = LazyAdjacencyList(csr.index, lambda node: [
+            connectors[edge] for edge in csr.in_edges(csr.index[node])
+        ])
+        obj._arrays = arrays
+        return obj
+
+    def __len__(self):
+        return len(self._csr)
+
+    def csr(self) -> NetworkCSR:
+        """
+        Returns the shared CSR.
+        """
+        return self._csr
+
+    def components(self) -> NetworkComponents:
+        """
+        Returns the strongly connected components of the graph, computed on first use.
+        """
+        if self._components is None:
+            self._components = NetworkComponents(self._csr)
+        return self._components
+
+    @property
+    def version(self) -> int:
+        """
+        Returns the version of the graph, which is never edited.
+        """
+        return 0
+
+    @property
+    def nodes(self) -> Dict[int, NetworkSharedNode]:
+        """
+        Returns the nodes with coordinates.
+        """
+        return self._nodes
+
+    @property
+    def adjs(self) -> LazyAdjacencyList:
+        """
+        Returns the adjacency list.
+        """
+        return self._adjs
+
+    @property
+    def adjs_rev(self) -> LazyAdjacencyList:
+        """
+        Returns the transposed adjacency list.
+        """
+        return self._adjs_rev
+
+    @property
+    def arrays(self) -> Dict[str, np.ndarray]:
+        """
+        Returns the shared arrays, those of the engine included.
+        """
+        return self._arrays
+
+@dataclass
+class NetworkBatchSpec:
+    """
+    Describes how the worker processes of a batch rebuild an engine.
+    Arguments:
+        - net:              the network whose CSR is shared; paths come back as connectors of its CSR
+        - factory:          picklable callable (graph, **kwargs) -> engine, called in every worker with the
+                            NetworkSharedGraph of the network
+        - kwargs:           the (small) keyword arguments of the factory
+        - arrays:           the arrays of the engine shared along with the CSR, found in graph.arrays
+    """
+    net:        object
+    factory:    Callable
+    kwargs:     dict = field(default_factory=dict)
+    arrays:     Dict[str, np.ndarray] = field(default_factory=dict)
+
+class _BatchWorker:
+    """
+    Answers chunks of queries with an engine rebuilt on shared memory; paths are returned as edge ids.
+    """
+    def __init__(self, shared: NetworkSharedArrays, engine):
+        self._shared = shared
+        self._engine = engine
+
+    def dists(self, queries: list[tuple]) -> list[float]:
+        """
+        Returns the lengths of the shortest paths of the queries.
+        """
+        return [dist for dist, _ in _answer(self._engine, queries, with_paths=False)]
+
+    def paths(self, queries: list[tuple]) -> list[tuple[float, list[int]]]:
+        """
+        Returns the lengths and the edge ids of the shortest paths of the queries.
+        """
+        return [
+            (dist, [connector.edge for connector in path])
+            for dist, path in _answer(self._engine, queries, with_paths=True)
+        ]
+
+def _answer(engine, queries: Iterable[tuple], with_paths: bool) -> Iterator[tuple[float, list]]:
+    """
+    Answers queries (src, dest, *args) with an engine: its path() method, or its dist() method when paths
+    are not needed and it has one.
+    """
+    dist = None if with_paths else getattr(engine, 'dist', None)
+    for query in queries:
+        if dist is not None:
+            yield dist(*query), []
+        else:
+            yield engine.path(*query)
+
+_worker: _BatchWorker = None
+
+def _init_worker(spec: tuple[str, list], route_ids: list, factory: Callable, kwargs: dict):
+    # pylint: disable=global-statement
+    global _worker
+    shared = NetworkSharedArrays.attach(spec)
+    _worker = _BatchWorker(shared, factory(NetworkSharedGraph.from_arrays(shared.arrays, route_ids), **kwargs))
+
+def _dists_in_worker(queries: list[tuple]) -> list[float]:
+    return _worker.dists(queries)
+
+def _paths_in_worker(queries: list[tuple]) -> list[tuple[float, list[int]]]:
+    return _worker.paths(queries)
+
+class NetworkBatchPool:
+    """
+    A pool of worker processes answering batch queries of an engine, kept open for any number of batches:
+    the arrays are published and the engine is rebuilt in the workers once, when the pool is opened, and
+    batches are answered on the state of the engine at that time. With processes = 1, batches are answered
+    by the engine itself, in this process.
+    Batches may be submitted from several threads.
+    """
+    _engine:        object
+    _processes:     int
+    _csr:           NetworkCSR | None
+    _shared:        NetworkSharedArrays | None
+    _pool:          object
+
+    def __init__(self, engine: 'NetworkBatchQueries', processes: int = None):
+        # pylint: disable=protected-access
+        self._engine = engine
+        self._processes = processes or multiprocessing.cpu_count()
+        self._csr, self._shared, self._pool = None, None, None
+        if processes == 1:
+            return
+
+        spec = engine._batch_spec()
+        self._csr = spec.net.csr()
+        arrays, route_ids = NetworkSharedGraph.arrays_of(spec.net)
+        arrays.update(spec.arrays)
+        self._shared = NetworkSharedArrays.publish(arrays)
+        try:
+            self._pool = multiprocessing.Pool(
+                processes, initializer=_init_worker, initargs=(self._shared.spec, route_ids, spec.factory, spec.kwargs)
+            )
+        except BaseException:
+            self._shared.close()
+            raise
+
+    def _chunks(self, queries: Iterable[tuple], chunk_size: int | None) -> list[list[tuple]]:
+        queries = [tuple(query) for query in queries]
+        if chunk_size is None:
+            chunk_size = max(1, -(-len(queries) // self._processes))
+        return [queries[i : i + chunk_size] for i in range(0, len(queries), chunk_size)]
+
+    def paths(
+        self, queries: Iterable[tuple], chunk_size: int = None
+    ) -> Iterator[tuple[float, list[NetworkConnector]]]:
+        """
+        Returns the shortest paths of a batch of queries, as (length, connectors) tuples in the order of
+        the queries, streamed as they are computed.
+        Arguments:
+            - chunk_size:       number of queries per task (default: the batch split evenly between the workers)
+        """
+        chunks = self._chunks(queries, chunk_size)
+        if self._pool is None:
+            for chunk in chunks:
+                yield from _answer(self._engine, chunk, with_paths=True)
+            return
+        csr = self._csr
+        for results in self._pool.imap(_paths_in_worker, chunks):
+            for dist, edges in results:
+                yield dist, [reweighted_connector(csr, edge) for edge in edges]
+
+    def dists(self, queries: Iterable[tuple], chunk_size: int = None) -> Iterator[float]:
+        """
+        Returns the lengths of the shortest paths of a batch of queries, in the order of the queries,
+        streamed as they are computed.
+        Arguments:
+            - chunk_size:       number of queries per task (default: the batch split evenly between the workers)
+        """
+        chunks = self._chunks(queries, chunk_size)
+        if self._pool is None:
+            for chunk in chunks:
+                for dist, _ in _answer(self._engine, chunk, with_paths=False):
+                    yield dist
+            return
+        for dists in self._pool.imap(_dists_in_worker, chunks):
+            yield from dists
+
+    def close(self):
+        """
+        Stops the workers and frees the shared memory.
+        """
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        if self._shared is not None:
+            self._shared.close()
+            self._shared = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    @property
+    def processes(self) -> int:
+        """
+        Returns the number of worker processes (1 when batches are answered in this process).
+        """
+        return 1 if self._pool is None else self._processes
+
+class NetworkBatchQueries:
+    """
+    Batch queries of a search engine, answered by a pool of worker processes.
+    The CSR of the network and the arrays of the engine (hierarchy, labels, profiles) are published once in
+    shared memory; every worker rebuilds a read-only engine on them instead of unpickling a copy, then answers
+    chunks of queries. Results are streamed back in the order of the queries as soon as their chunk is done.
+    Engines describe how to rebuild them in a worker by _batch_spec(). A pool serving several batches is
+    opened by batch_pool().
+
+    A query is a (src, dest) pair, followed by the extra arguments of path() if any (e.g. a departure time).
+    """
+
+    def _batch_spec(self) -> NetworkBatchSpec:
+        raise NotImplementedError()
+
+    def batch_pool(self, processes: int = None) -> NetworkBatchPool:
+        """
+        Opens a pool of worker processes answering batches on the current state of the engine.
+        Arguments:
+            - processes:        number of worker processes (default: one per CPU; 1 runs in this process)
+        """
+        return NetworkBatchPool(self, processes)
+
+    def _batch(
+        self, queries: Iterable[tuple], with_paths: bool, processes: int, chunk_size: int
+    ) -> Iterator[tuple[float, list]]:
+        queries = [tuple(query) for query in queries]
+        if processes == 1 or len(queries) <= chunk_size:
+            yield from _answer(self, queries, with_paths)
+            return
+        with self.batch_pool(processes) as pool:
+            if with_paths:
+                yield from pool.paths(queries, chunk_size)
+            else:
+                yield from ((dist, []) for dist in pool.dists(queries, chunk_size))
+
+    def batch_paths(
+        self, queries: Iterable[tuple], processes: int = None, chunk_size: int = 256
+    ) -> Iterator[tuple[float, list[NetworkConnector]]]:
+        """
+        Returns the shortest paths of a batch of queries, as (length, connectors) tuples in the order of
+        the queries, streamed as they are computed.
+        Arguments:
+            - processes:        number of worker processes (default: one per CPU; 1 runs in this process)
+            - chunk_size:       number of queries per task
+        """
+        return self._batch(queries, True, processes, chunk_size)
+
+    def batch_dists(self, queries: Iterable[tuple], processes: int = None, chunk_size: int = 256) -> Iterator[float]:
+        """
+        Returns the lengths of the shortest paths of a batch of queries, in the order of the queries,
+        streamed as they are computed.
+        Arguments:
+            - processes:        number of worker processes (default: one per CPU; 1 runs in this process)
+            - chunk_size:       number of queries per task
+        """
+        return (dist for dist, _ in self._batch(queries, False, processes, chunk_size))
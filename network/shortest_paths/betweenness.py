@@ -13,6 +13,8 @@ class NetworkAnalysisBetweenness:
     Analyse a network using Betweenness Centrality.
     """
     _scores:     Dict[int, int]
+    _net:        Network
+    _version:    int
     
     def _from_net_brute_force(self, net: Network, dijkstra_engine: NetworkDijkstra = None):
         if dijkstra_engine is None:
@@ -52,6 +54,8 @@ class NetworkAnalysisBetweenness:
             - Otherwise:
                 Run the Naive O(V^2ElogV) algorithm algorithm.
         """
+        self._net = net
+        self._version = getattr(net, 'version', 0)
         if alg == 'tree':
             self._from_net_shortest_tree(net=net, dijkstra_engine=dijkstra_engine)
         else:
@@ -71,6 +75,13 @@ class NetworkAnalysisBetweenness:
         it = iter(self._scores)
         return [next(it) for _ in range(k)]
 
+    @property
+    def is_stale(self) -> bool:
+        """
+        Returns if the network has been edited since the scores were computed.
+        """
+        return getattr(self._net, 'version', 0) != self._version
+
     @property
     def scores(self):
         """
@@ -1,33 +1,39 @@
 """
 Module network.shortest_paths.bidirectional_dijkstra
 """
-from queue import PriorityQueue
+from __future__ import annotations
+import heapq
 from typing import Dict, TypeVar
 from network.network import Network, NetworkConnector
+from network.components import unreachable
+from network.shortest_paths.workspace import NetworkSearchContext, NetworkQueryContexts
+from network.shortest_paths.batch import NetworkBatchQueries, NetworkBatchSpec
 
 TNode = TypeVar('TNode')
 
-class NetworkBidirectionalDijkstra:
+class NetworkBidirectionalDijkstra(NetworkBatchQueries):
     """
     Implementation of the Bidirectional Dijkstra algorithm.
+    Both searches run on the CSR of the network, each in a workspace whose buffers are reused between queries.
+    The state of a query is kept in a per-thread context, so that one engine answers concurrent queries.
     """
     _INFINITY:      float
+    _net:           Network
     _nodes:         Dict[int, TNode]
     _adjs_fwd:      Dict[int, list[NetworkConnector]]
     _adjs_bkd:      Dict[int, list[NetworkConnector]]
 
-    _dists_fwd:     Dict[int, float]
-    _dists_bkd:     Dict[int, float]
-    _pars_fwd:      Dict[int, NetworkConnector]
-    _pars_bkd:      Dict[int, NetworkConnector]
+    _contexts:      NetworkQueryContexts[NetworkSearchContext]
 
     _early_stop:    bool
 
     def __init__(self):
         self._early_stop = False
+        self._contexts = NetworkQueryContexts(NetworkSearchContext)
 
     def _from_net(self, net: Network, INFINITY: float = float('inf'), **kwargs):
         self._INFINITY = INFINITY
+        self._net = net
         self._nodes = net.nodes
         self._adjs_fwd = net.adjs
         self._adjs_bkd = net.adjs_rev
@@ -41,95 +47,119 @@ class NetworkBidirectionalDijkstra:
         """
         return cls()._from_net(net, **kwargs)
 
-    def path(self, src: int, dest: int):
+    def _search(self, context: NetworkSearchContext, src: int, dest: int) -> tuple[float, int]:
         """
-        Returns the shortest path from source src to destination dest.
+        Runs the search in a context, then returns the length of the shortest path and its meeting node
+        (-1 if none).
         """
-        def relax(dists: Dict[int, float], pars: Dict[int, int], pq: PriorityQueue, connector: NetworkConnector, reverse: bool = False):
-            u, v = connector.ends
-            if reverse:
-                u, v = v, u
-            w = connector.weight
-
-            dist_u = dists.get(u, self._INFINITY)       
-            dist_v = dists.get(v, self._INFINITY)       
-
-            if dist_v > dist_u + w:
-                dists[v] = dist_u + w
-                pars[v] = connector
-                pq.put((dists[v], v))
-                return True
-            
-            return False
-        
-        self._dists_fwd, self._pars_fwd = {}, {}
-        self._dists_bkd, self._pars_bkd = {}, {}
-
-        dist, mid = self._INFINITY, -1
-        dist_s = self._dists_fwd[src] = 0
-        dist_t = self._dists_bkd[dest] = 0
-        s, t = src, dest
-
-        pq_fwd, pq_bkd = PriorityQueue(), PriorityQueue()        
-        pq_fwd.put((0, src))
-        pq_bkd.put((0, dest))
+        # pylint: disable=too-many-locals, too-many-branches, too-many-statements
+        INFINITY = self._INFINITY
+        workspace_fwd = context.workspace(self._net, INFINITY, 0)
+        workspace_bkd = context.workspace(self._net, INFINITY, 1)
+        workspace_fwd.reset()
+        workspace_bkd.reset()
+        if unreachable(self._net, src, dest):
+            context.s, context.t = -1, -1
+            return INFINITY, -1
+
+        index = workspace_fwd.index
+        s = context.s = index[src]
+        t = context.t = index[dest]
+        workspace_fwd.seed(s, 0)
+        workspace_bkd.seed(t, 0)
+        dists_fwd, pars_fwd, stamps_fwd, generation_fwd, touched_fwd, pq_fwd = workspace_fwd.buffers
+        dists_bkd, pars_bkd, stamps_bkd, generation_bkd, touched_bkd, pq_bkd = workspace_bkd.buffers
+        view = workspace_fwd.csr.view
+        offsets, heads, tails, weights = view.offsets, view.heads, view.tails, view.weights
+        offsets_rev, edges_rev = view.offsets_rev, view.edges_rev
+
+        dist, mid = INFINITY, -1
+        dist_s = dist_t = 0
 
         is_fwd = False
 
-        while (not pq_fwd.empty()) or (not pq_bkd.empty()):
+        while pq_fwd or pq_bkd:
             is_fwd = not is_fwd
             if is_fwd:
-                if pq_fwd.empty():
+                if not pq_fwd:
                     continue
-                dist_s, s = pq_fwd.get()
+                dist_s, s = heapq.heappop(pq_fwd)
                 if dist_s > dist:
-                    pq_fwd.queue.clear()
+                    pq_fwd.clear()
                     continue
                 
             else:
-                if pq_bkd.empty():
+                if not pq_bkd:
                     continue
-                dist_t, t = pq_bkd.get()
+                dist_t, t = heapq.heappop(pq_bkd)
                 if dist_t > dist:
-                    pq_bkd.queue.clear()
+                    pq_bkd.clear()
                     continue
 
             if self._early_stop:
                 if dist_s + dist_t > dist:
                     break
 
-            (dist, mid) = min(
-                (dist, mid), 
-                (self._dists_fwd[s] + self._dists_bkd.get(s, self._INFINITY), s),
-                (self._dists_bkd[t] + self._dists_fwd.get(t, self._INFINITY), t)
-            )
-
-            if is_fwd and dist_s == self._dists_fwd[s]:
-                for connector in self._adjs_fwd[s]:
-                    relax(self._dists_fwd, self._pars_fwd, pq_fwd, connector)
-
-            if (not is_fwd) and dist_t == self._dists_bkd[t]:
-                for connector in self._adjs_bkd[t]:
-                    relax(self._dists_bkd, self._pars_bkd, pq_bkd, connector, reverse=True)
+            if stamps_bkd[s] == generation_bkd and dists_fwd[s] + dists_bkd[s] < dist:
+                dist, mid = dists_fwd[s] + dists_bkd[s], s
+            if stamps_fwd[t] == generation_fwd and dists_bkd[t] + dists_fwd[t] < dist:
+                dist, mid = dists_bkd[t] + dists_fwd[t], t
+
+            if is_fwd and dist_s == dists_fwd[s]:
+                for edge in range(offsets[s], offsets[s + 1]):
+                    v = heads[edge]
+                    dist_v = dist_s + weights[edge]
+                    if stamps_fwd[v] == generation_fwd:
+                        if dists_fwd[v] <= dist_v:
+                            continue
+                    elif not dist_v < INFINITY:
+                        continue
+                    else:
+                        stamps_fwd[v] = generation_fwd
+                        touched_fwd.append(v)
+                    dists_fwd[v] = dist_v
+                    pars_fwd[v] = edge
+                    heapq.heappush(pq_fwd, (dist_v, v))
+
+            if (not is_fwd) and dist_t == dists_bkd[t]:
+                for idx in range(offsets_rev[t], offsets_rev[t + 1]):
+                    edge = edges_rev[idx]
+                    v = tails[edge]
+                    dist_v = dist_t + weights[edge]
+                    if stamps_bkd[v] == generation_bkd:
+                        if dists_bkd[v] <= dist_v:
+                            continue
+                    elif not dist_v < INFINITY:
+                        continue
+                    else:
+                        stamps_bkd[v] = generation_bkd
+                        touched_bkd.append(v)
+                    dists_bkd[v] = dist_v
+                    pars_bkd[v] = edge
+                    heapq.heappush(pq_bkd, (dist_v, v))
+
+        return dist, (workspace_fwd.ids[mid] if mid != -1 else -1)
 
+    def path(self, src: int, dest: int):
+        """
+        Returns the shortest path from source src to destination dest.
+        """
+        context = self._contexts.get()
+        dist, mid = self._search(context, src, dest)
         if mid == -1:
             return self._INFINITY, []
 
-        path_fwd, path_bkd = [], []
-
-        node = mid
-        while node != src:
-            connector = self._pars_fwd[node]
-            path_fwd.append(connector)
-            node = connector.src
-
-        node = mid
-        while node != dest:
-            connector = self._pars_bkd[node]
-            path_bkd.append(connector)
-            node = connector.dest
+        workspace_fwd, workspace_bkd = context.workspaces
+        mid = workspace_fwd.index[mid]
+        path = workspace_fwd.reverse_path_from(context.s, mid)
+        path.reverse()
+        path.extend(workspace_bkd.path_back_to(mid, context.t))
+        return dist, path
 
-        return dist, [*reversed(path_fwd), *path_bkd]
+    def _batch_spec(self) -> NetworkBatchSpec:
+        return NetworkBatchSpec(
+            self._net, type(self).from_net, {'INFINITY': self._INFINITY, 'early_stop': self._early_stop}
+        )
 
     # --------------- Getters and Setters -------------------
     
@@ -138,11 +168,12 @@ class NetworkBidirectionalDijkstra:
         """
         Returns the search space after the algorithm execution.
         """
-        nodes = set(self._dists_fwd.keys()) | set(self._dists_bkd.keys())
+        workspace_fwd, workspace_bkd = self._contexts.get().workspaces
+        space_fwd, space_bkd = workspace_fwd.search_space(), workspace_bkd.search_space()
         return {
             node: (
-                self._dists_fwd.get(node, self._INFINITY),
-                self._dists_bkd.get(node, self._INFINITY)
+                space_fwd.get(node, self._INFINITY),
+                space_bkd.get(node, self._INFINITY)
             )
-            for node in nodes
-        }
\ No newline at end of file
+            for node in space_fwd.keys() | space_bkd.keys()
+        }
@@ -0,0 +1,473 @@
+"""
+Module network.shortest_paths.cache
+"""
+from __future__ import annotations
+import os
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, Iterable, Iterator
+
+from network.network import NetworkConnector
+
+class NetworkResultStore:
+    """
+    On-disk tier of a result cache: an SQLite file holding distances, shared by every process opening it
+    (e.g. the workers of a server), so that an entry computed by one of them is a hit for the others.
+    Entries expire after ttl seconds (wall clock); beyond max_entries, the oldest entries are dropped.
+    Every thread of every process gets its own connection, opened on first use.
+    """
+    _file:          str
+    _ttl:           float | None
+    _max_entries:   int | None
+    _local:         threading.local
+    _no_puts:       int
+
+    PRUNE_EVERY = 1024
+
+    def __init__(self, file: str, ttl: float = None, max_entries: int = None):
+        self._file = file
+        self._ttl = ttl
+        self._max_entries = max_entries
+        self._local = threading.local()
+        self._no_puts = 0
+        self._connection().execute(
+            'CREATE TABLE IF NOT EXISTS results '
+            '(key TEXT PRIMARY KEY, name TEXT, version TEXT, value REAL, expires REAL)'
+        )
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections are not inherited through fork(): a forked process opens its own.
+        connection, pid = getattr(self._local, 'connection', None), getattr(self._local, 'pid', None)
+        if connection is None or pid != os.getpid():
+            connection = sqlite3.connect(self._file, timeout=30.0, isolation_level=None)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            self._local.connection, self._local.pid = connection, os.getpid()
+        return connection
+
+    def get(self, key: tuple) -> float | None:
+        """
+        Returns the distance stored under a key, or None if missing or expired.
+        """
+        row = self._connection().execute(
+            'SELECT value, expires FROM results WHERE key = ?', (repr(key),)
+        ).fetchone()
+        if row is None or (row[1] is not None and row[1] < time.time()):
+            return None
+        return float('inf') if row[0] is None else row[0]
+
+    def put(self, key: tuple, value: float):
+        """
+        Stores a distance under a key (name, version, ...).
+        """
+        expires = time.time() + self._ttl if self._ttl is not None else None
+        connection = self._connection()
+        # SQLite has no infinity literal in every build: unreachable destinations are stored as NULL.
+        connection.execute(
+            'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?)',
+            (repr(key), str(key[0]), repr(key[1]), value if value != float('inf') else None, expires)
+        )
+        self._no_puts += 1
+        if self._no_puts % self.PRUNE_EVERY == 0:
+            self.prune()
+
+    def prune(self):
+        """
+        Drops the expired entries, then the oldest entries beyond max_entries.
+        """
+        connection = self._connection()
+        connection.execute('DELETE FROM results WHERE expires < ?', (time.time(),))
+        if self._max_entries is not None:
+            connection.execute(
+                'DELETE FROM results WHERE rowid IN '
+                '(SELECT rowid FROM results ORDER BY rowid DESC LIMIT -1 OFFSET ?)', (self._max_entries,)
+            )
+
+    def invalidate(self, name: str, version: Hashable) -> int:
+        """
+        Drops the entries of an engine computed on another version than the given one, then returns their number.
+        """
+        return self._connection().execute(
+            'DELETE FROM results WHERE name = ? AND version != ?', (name, repr(version))
+        ).rowcount
+
+    def clear(self):
+        """
+        Drops every entry.
+        """
+        self._connection().execute('DELETE FROM results')
+
+    def close(self):
+        """
+        Closes the connection of the calling thread.
+        """
+        connection = getattr(self._local, 'connection', None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def __len__(self):
+        return self._connection().execute('SELECT COUNT(*) FROM results').fetchone()[0]
+
+    def __getstate__(self):
+        # Connections belong to the threads of the live process.
+        return {'_file': self._file, '_ttl': self._ttl, '_max_entries': self._max_entries}
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._local = threading.local()
+        self._no_puts = 0
+
+class NetworkResultCache:
+    """
+    In-memory LRU cache of query results, with optional expiry and memory cap, thread-safe.
+    - Keys are tuples (name, version, ...): the name of the engine, the version of the network (or scenario,
+      or weight snapshot) the result was computed on, then the query.
+    - Eviction: the least recently used entries go first once the cache holds max_entries entries, or its
+      estimated size exceeds max_bytes; entries older than ttl seconds are dropped when read.
+    - An optional NetworkResultStore is a second tier for distances: misses are looked up in it, and
+      distances put into the cache are written through to it.
+    Hits, misses and evictions are counted (see stats).
+    """
+    # pylint: disable=too-many-instance-attributes
+    _entries:           OrderedDict
+    _lock:              threading.Lock
+    _max_entries:       int | None
+    _max_bytes:         int | None
+    _ttl:               float | None
+    _store:             NetworkResultStore | None
+    _nbytes:            int
+    _no_hits:           int
+    _no_store_hits:     int
+    _no_misses:         int
+    _no_evictions:      int
+    _no_expirations:    int
+    _no_invalidations:  int
+
+    # Estimated bytes of an entry on top of its key and value: the node of the ordered dict and the entry tuple.
+    ENTRY_OVERHEAD = 160
+
+    def __init__(
+        self, max_entries: int = 100_000, max_bytes: int = None, ttl: float = None, store: NetworkResultStore = None
+    ):
+        """
+        Arguments:
+            - max_entries:  maximum number of entries (None: unbounded)
+            - max_bytes:    maximum estimated size of the entries, in bytes (None: unbounded)
+            - ttl:          lifetime of an entry, in seconds (None: entries do not expire)
+            - store:        on-disk tier shared by several processes, for distances
+        """
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._ttl = ttl
+        self._store = store
+        self._nbytes = 0
+        self.reset_stats()
+
+    @classmethod
+    def _sizeof(cls, key: tuple, value: Any) -> int:
+        size = cls.ENTRY_OVERHEAD + sys.getsizeof(key) + sys.getsizeof(value)
+        if isinstance(value, tuple):
+            # A path: its length and the list of its connectors, which belong to the network.
+            size += sum(sys.getsizeof(item) for item in value)
+        return size
+
+    def get(self, key: tuple, shared: bool = True) -> Any:
+        """
+        Returns the value cached under a key, or None.
+        Arguments:
+            - shared:       look the key up in the store on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires, size = entry
+                if expires is None or expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._no_hits += 1
+                    return value
+                del self._entries[key]
+                self._nbytes -= size
+                self._no_expirations += 1
+
+        value = self._store.get(key) if self._store is not None and shared else None
+        with self._lock:
+            if value is None:
+                self._no_misses += 1
+                return None
+            self._no_store_hits += 1
+        self._insert(key, value)
+        return value
+
+    def put(self, key: tuple, value: Any):
+        """
+        Caches a value under a key; distances (floats) are written through to the store, if any.
+        """
+        self._insert(key, value)
+        if self._store is not None and isinstance(value, float):
+            self._store.put(key, value)
+
+    def _insert(self, key: tuple, value: Any):
+        size = self._sizeof(key, value)
+        expires = time.monotonic() + self._ttl if self._ttl is not None else None
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._nbytes -= previous[2]
+            self._entries[key] = (value, expires, size)
+            self._nbytes += size
+            while self._entries and (
+                (self._max_entries is not None and len(self._entries) > self._max_entries)
+                or (self._max_bytes is not None and self._nbytes > self._max_bytes)
+            ):
+                _, (_, _, size) = self._entries.popitem(last=False)
+                self._nbytes -= size
+                self._no_evictions += 1
+
+    def invalidate(self, name: str, version: Hashable = None) -> int:
+        """
+        Drops the entries of an engine (those computed on another version than the given one, if any),
+        in this cache and in its store, then returns the number of entries dropped from this cache.
+        """
+        with self._lock:
+            keys = [key for key in self._entries if key[0] == name and (version is None or key[1] != version)]
+            for key in keys:
+                self._nbytes -= self._entries.pop(key)[2]
+            self._no_invalidations += len(keys)
+        if self._store is not None and version is not None:
+            self._store.invalidate(name, version)
+        return len(keys)
+
+    def clear(self):
+        """
+        Drops every entry of this cache (the store is left untouched).
+        """
+        with self._lock:
+            self._entries.clear()
+            self._nbytes = 0
+
+    def reset_stats(self):
+        """
+        Resets the counters.
+        """
+        self._no_hits, self._no_store_hits, self._no_misses = 0, 0, 0
+        self._no_evictions, self._no_expirations, self._no_invalidations = 0, 0, 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def nbytes(self) -> int:
+        """
+        Returns the estimated size of the entries, in bytes.
+        """
+        return self._nbytes
+
+    @property
+    def store(self) -> NetworkResultStore | None:
+        """
+        Returns the on-disk tier.
+        """
+        return self._store
+
+    @property
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the counters of the cache: hits (store hits included), store hits, misses, hit rate, evictions,
+        expirations, invalidated entries, then the number of entries and their estimated size in bytes.
+        """
+        lookups = self._no_hits + self._no_store_hits + self._no_misses
+        return {
+            'hits':             self._no_hits + self._no_store_hits,
+            'store_hits':       self._no_store_hits,
+            'misses':           self._no_misses,
+            'hit_rate':         (self._no_hits + self._no_store_hits) / lookups if lookups else 0.0,
+            'evictions':        self._no_evictions,
+            'expirations':      self._no_expirations,
+            'invalidations':    self._no_invalidations,
+            'entries':          len(self._entries),
+            'bytes':            self._nbytes,
+        }
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state: dict):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+def network_of(engine) -> object | None:
+    """
+    Returns the network (or scenario, or weight snapshot) an engine answers on, if it is known.
+    """
+    net = getattr(engine, '_net', None)
+    if net is None and getattr(engine, '_ch', None) is not None:
+        # Hub labels answer on the network of their hierarchy.
+        net = getattr(engine._ch, '_net', None)  # pylint: disable=protected-access
+    return net
+
+class NetworkCachedEngine:
+    """
+    Any search engine behind a result cache: dist() and path() (and their batch versions) answer from the
+    cache when they can, and cache what they compute. Other attributes are those of the engine.
+    A result is cached under (name, version, 'dist' or 'path', src, dest, *args): the name of the engine,
+    then the version of its network (net.version; scenarios and weight snapshots have theirs).
+    Results of older versions are never returned; they are dropped from the cache on the first query after
+    the network changes.
+    Several engines may share one cache under different names; the default name is unique to this wrapper
+    (and to processes forked after creating it). Processes sharing a NetworkResultStore without being forked
+    from one another must give the same name to the same model.
+    """
+    _engine:        object
+    _cache:         NetworkResultCache
+    _name:          str
+    _version_of:    Callable[[], Hashable]
+    _version:       Hashable
+
+    def __init__(
+        self, engine, cache: NetworkResultCache = None, name: str = None,
+        version: Callable[[], Hashable] = None
+    ):
+        """
+        Arguments:
+            - cache:        the cache of the results (default: a new NetworkResultCache with default settings)
+            - name:         the name of the engine in the cache
+            - version:      callable returning the version of what the engine answers on (default: the version
+                            of its network; engines whose network is unknown, or has no version, are never
+                            invalidated)
+        """
+        self._engine = engine
+        self._cache = cache if cache is not None else NetworkResultCache()
+        self._name = name or '{}-{}'.format(type(engine).__name__, uuid.uuid4().hex[:12])
+        if version is None:
+            net = network_of(engine)
+            version = lambda: getattr(net, 'version', 0)  # pylint: disable=unnecessary-lambda-assignment
+        self._version_of = version
+        self._version = version()
+
+    def _key(self, kind: str, src: int, dest: int, args: tuple) -> tuple:
+        version = self._version_of()
+        if version != self._version:
+            self._version = version
+            self._cache.invalidate(self._name, version)
+        return (self._name, version, kind, src, dest, *args)
+
+    def get(self, src: int, dest: int, *args, with_path: bool = False) -> Any:
+        """
+        Returns the cached result of a query (its length, or its (length, connectors) path), or None.
+        """
+        if with_path:
+            return self._cache.get(self._key('path', src, dest, args), shared=False)
+        return self._cache.get(self._key('dist', src, dest, args))
+
+    def put(self, src: int, dest: int, result: Any, *args, with_path: bool = False):
+        """
+        Caches the result of a query computed elsewhere (e.g. by a pool of worker processes).
+        """
+        self._cache.put(self._key('path' if with_path else 'dist', src, dest, args), result)
+
+    def _compute(self, src: int, dest: int, args: tuple, with_path: bool) -> Any:
+        dist = None if with_path else getattr(self._engine, 'dist', None)
+        if callable(dist):
+            return float(dist(src, dest, *args))
+        length, path = self._engine.path(src, dest, *args)
+        return (length, list(path)) if with_path else float(length)
+
+    def dist(self, src: int, dest: int, *args) -> float:
+        """
+        Returns the length of the shortest path from source src to destination dest.
+        """
+        result = self.get(src, dest, *args)
+        if result is None:
+            result = self._compute(src, dest, args, with_path=False)
+            self.put(src, dest, result, *args)
+        return result
+
+    def path(self, src: int, dest: int, *args) -> tuple[float, list[NetworkConnector]]:
+        """
+        Returns the shortest path from source src to destination dest.
+        """
+        result = self.get(src, dest, *args, with_path=True)
+        if result is None:
+            result = self._compute(src, dest, args, with_path=True)
+            self.put(src, dest, result, *args, with_path=True)
+        return result
+
+    def _batch(self, queries: Iterable[tuple], with_paths: bool, kwargs: dict) -> list:
+        queries = [tuple(query) for query in queries]
+        results = [self.get(*query, with_path=with_paths) for query in queries]
+        misses = [idx for idx, result in enumerate(results) if result is None]
+        if misses:
+            batch = getattr(self._engine, 'batch_paths' if with_paths else 'batch_dists', None)
+            if batch is not None:
+                computed = batch([queries[idx] for idx in misses], **kwargs)
+            else:
+                computed = (self._compute(*queries[idx][:2], queries[idx][2:], with_paths) for idx in misses)
+            for idx, result in zip(misses, computed):
+                result = (result[0], list(result[1])) if with_paths else float(result)
+                results[idx] = result
+                src, dest, *args = queries[idx]
+                self.put(src, dest, result, *args, with_path=with_paths)
+        return results
+
+    def batch_dists(self, queries: Iterable[tuple], **kwargs) -> Iterator[float]:
+        """
+        Returns the lengths of the shortest paths of a batch of queries, in the order of the queries.
+        Queries missing from the cache are answered by the batch queries of the engine, if it has them
+        (keyword arguments are passed to them).
+        """
+        return iter(self._batch(queries, False, kwargs))
+
+    def batch_paths(self, queries: Iterable[tuple], **kwargs) -> Iterator[tuple[float, list[NetworkConnector]]]:
+        """
+        Returns the shortest paths of a batch of queries, as (length, connectors) tuples in the order of
+        the queries. Queries missing from the cache are answered by the batch queries of the engine, if it has
+        them (keyword arguments are passed to them).
+        """
+        return iter(self._batch(queries, True, kwargs))
+
+    def invalidate(self):
+        """
+        Drops every cached result of the engine.
+        """
+        self._cache.invalidate(self._name)
+
+    def __getattr__(self, name: str):
+        if name.startswith('__') or name == '_engine':
+            raise AttributeError(name)
+        return getattr(self._engine, name)
+
+    @property
+    def engine(self):
+        """
+        Returns the engine behind the cache.
+        """
+        return self._engine
+
+    @property
+    def cache(self) -> NetworkResultCache:
+        """
+        Returns the cache of the results.
+        """
+        return self._cache
+
+    @property
+    def name(self) -> str:
+        """
+        Returns the name of the engine in the cache.
+        """
+        return self._name
+
+    @property
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the counters of the cache (see NetworkResultCache.stats).
+        """
+        return self._cache.stats
@@ -0,0 +1,268 @@
+"""
+Module network.shortest_paths.closure_impact
+"""
+from __future__ import annotations
+import heapq
+import multiprocessing
+from dataclasses import dataclass
+from typing import Dict, Iterable
+
+import numpy as np
+from tqdm import tqdm
+
+from network.network import Network
+
+@dataclass
+class NetworkClosureImpact:
+    """
+    Defines the impact of closing a node on the shortest paths between the other nodes.
+    Arguments:
+        - node:                 The closed node
+        - pairs:                Number of (source, destination) pairs connected before the closure, the closed
+                                node excluded
+        - affected_pairs:       Number of pairs whose shortest path gets longer
+        - disconnected_pairs:   Number of pairs without any path after the closure
+        - total_increase:       Sum of the increases of the pairs still connected
+    """
+    node:                   int
+    pairs:                  int
+    affected_pairs:         int
+    disconnected_pairs:     int
+    total_increase:         float
+
+    @property
+    def mean_increase(self) -> float:
+        """
+        Returns the increase of the average shortest path length over the pairs still connected.
+        """
+        connected = self.pairs - self.disconnected_pairs
+        return self.total_increase / connected if connected > 0 else 0.0
+
+class _ClosureImpactWorker:
+    """
+    Computes the closure impacts contributed by single sources, on plain lists built from a CSR.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, arrays: dict, candidates: np.ndarray):
+        self._n = len(arrays['offsets']) - 1
+        self._offsets = arrays['offsets'].tolist()
+        self._heads = arrays['heads'].tolist()
+        self._tails = arrays['tails'].tolist()
+        self._weights = arrays['weights'].tolist()
+        self._offsets_rev = arrays['offsets_rev'].tolist()
+        self._edges_rev = arrays['edges_rev'].tolist()
+        self._candidates = candidates.tolist()
+
+    def _tree(self, s: int) -> tuple[list[float], list[int]]:
+        offsets, heads, weights = self._offsets, self._heads, self._weights
+        INFINITY = float('inf')
+        dist, par = [INFINITY] * self._n, [-1] * self._n
+        dist[s] = 0.0
+        pq = [(0.0, s)]
+        while pq:
+            dist_u, u = heapq.heappop(pq)
+            if dist_u != dist[u]:
+                continue
+            for edge in range(offsets[u], offsets[u + 1]):
+                v = heads[edge]
+                dist_v = dist_u + weights[edge]
+                if dist_v < dist[v]:
+                    dist[v], par[v] = dist_v, edge
+                    heapq.heappush(pq, (dist_v, v))
+        return dist, par
+
+    def _euler_tour(self, s: int, par: list[int]) -> tuple[list[int], list[int], list[int]]:
+        """
+        Returns the preorder of the shortest-path tree and the [tin, tout) range of every subtree in it.
+        """
+        children = [[] for _ in range(self._n)]
+        for v, edge in enumerate(par):
+            if edge >= 0:
+                children[self._tails[edge]].append(v)
+
+        order, tin, tout = [], [-1] * self._n, [-1] * self._n
+        stack = [(s, False)]
+        while stack:
+            u, is_exit = stack.pop()
+            if is_exit:
+                tout[u] = len(order)
+                continue
+            tin[u] = len(order)
+            order.append(u)
+            stack.append((u, True))
+            stack.extend((v, False) for v in children[u])
+        return order, tin, tout
+
+    def _repair(self, x: int, dist: list[float], order: list[int], tin: list[int], tout: list[int]) -> dict:
+        """
+        Returns the distances of the descendants of x once x is closed. Nodes outside the subtree of x keep
+        their distance; descendants are seeded from their in-edges leaving the subtree, then settled by
+        a Dijkstra search restricted to the subtree.
+        """
+        lo, hi = tin[x], tout[x]
+        tails, heads, weights = self._tails, self._heads, self._weights
+        offsets, offsets_rev, edges_rev = self._offsets, self._offsets_rev, self._edges_rev
+        INFINITY = float('inf')
+
+        labels, pq = {}, []
+        for v in order[lo + 1 : hi]:
+            best = INFINITY
+            for idx in range(offsets_rev[v], offsets_rev[v + 1]):
+                edge = edges_rev[idx]
+                u = tails[edge]
+                if not lo <= tin[u] < hi and dist[u] + weights[edge] < best:
+                    best = dist[u] + weights[edge]
+            labels[v] = best
+            if best < INFINITY:
+                pq.append((best, v))
+        heapq.heapify(pq)
+
+        while pq:
+            dist_u, u = heapq.heappop(pq)
+            if dist_u != labels[u]:
+                continue
+            for edge in range(offsets[u], offsets[u + 1]):
+                v = heads[edge]
+                if lo < tin[v] < hi and dist_u + weights[edge] < labels[v]:
+                    labels[v] = dist_u + weights[edge]
+                    heapq.heappush(pq, (labels[v], v))
+        return labels
+
+    def from_sources(self, sources: Iterable[int]) -> dict[str, np.ndarray]:
+        """
+        Returns the per-node sums contributed by the given source indices.
+        """
+        n = self._n
+        totals = {
+            'increase':     np.zeros(n, dtype=np.float64),
+            'affected':     np.zeros(n, dtype=np.int64),
+            'disconnected': np.zeros(n, dtype=np.int64),
+            'reached':      np.zeros(n, dtype=np.int64),
+            'reached_by':   np.zeros(n, dtype=np.int64),
+        }
+        increase, affected, disconnected = totals['increase'], totals['affected'], totals['disconnected']
+        INFINITY = float('inf')
+
+        for s in sources:
+            dist, par = self._tree(s)
+            order, tin, tout = self._euler_tour(s, par)
+            totals['reached'][s] += len(order) - 1
+            totals['reached_by'][order[1:]] += 1
+
+            for x in order[1:]:
+                # Leaves carry no other node's shortest path.
+                if not self._candidates[x] or tout[x] - tin[x] <= 1:
+                    continue
+                for v, dist_v in self._repair(x, dist, order, tin, tout).items():
+                    if dist_v == INFINITY:
+                        disconnected[x] += 1
+                    elif dist_v > dist[v]:
+                        affected[x] += 1
+                        increase[x] += dist_v - dist[v]
+
+        return totals
+
+_worker: _ClosureImpactWorker = None
+
+def _init_worker(arrays: dict, candidates: np.ndarray):
+    # pylint: disable=global-statement
+    global _worker
+    _worker = _ClosureImpactWorker(arrays, candidates)
+
+def _from_sources_in_worker(sources: list[int]) -> dict[str, np.ndarray]:
+    return _worker.from_sources(sources)
+
+class NetworkAnalysisClosureImpact:
+    """
+    Analyse a network by the impact of closing each node on the shortest paths between the other nodes.
+
+    For every source, the shortest-path tree is computed once. Closing a node x only changes the distances
+    of its descendants in that tree (the paths to every other node avoid x), so only the subtree of x
+    is repaired, by a Dijkstra search seeded from the edges entering it. Leaves of the tree are skipped.
+    Sources are spread over worker processes.
+    """
+    _impacts:   Dict[int, NetworkClosureImpact]
+
+    def from_net(
+        self, net: Network, candidates: Iterable[int] = None, sources: Iterable[int] = None,
+        processes: int = None, chunk_size: int = 16
+    ):
+        """
+        Compute the closure impact of every candidate node (default: every node).
+        Arguments:
+            - sources:          sources of the shortest-path trees (default: every node); a sample of them
+                                estimates the impacts at a fraction of the cost
+            - processes:        number of worker processes (default: one per CPU; 1 runs in this process)
+            - chunk_size:       number of sources per task
+        """
+        # pylint: disable=too-many-arguments, too-many-locals
+        csr = net.csr()
+        arrays = {
+            name: getattr(csr, name) for name in ('offsets', 'heads', 'tails', 'weights', 'offsets_rev', 'edges_rev')
+        }
+        candidate_mask = np.zeros(len(csr), dtype=np.bool_)
+        candidate_ids = list(net.nodes) if candidates is None else list(candidates)
+        candidate_mask[[csr.index[node] for node in candidate_ids]] = True
+
+        source_ids = list(net.nodes) if sources is None else list(sources)
+        chunks = [
+            [csr.index[node] for node in source_ids[i : i + chunk_size]]
+            for i in range(0, len(source_ids), chunk_size)
+        ]
+
+        totals = None
+        def accumulate(partial: dict[str, np.ndarray]):
+            nonlocal totals
+            if totals is None:
+                totals = partial
+            else:
+                for name, values in partial.items():
+                    totals[name] += values
+
+        if processes == 1:
+            worker = _ClosureImpactWorker(arrays, candidate_mask)
+            for chunk in tqdm(chunks):
+                accumulate(worker.from_sources(chunk))
+        else:
+            with multiprocessing.Pool(processes, initializer=_init_worker, initargs=(arrays, candidate_mask)) as pool:
+                for partial in tqdm(pool.imap_unordered(_from_sources_in_worker, chunks), total=len(chunks)):
+                    accumulate(partial)
+
+        reached_pairs = int(totals['reached'].sum())
+        impacts = {}
+        for node in candidate_ids:
+            x = csr.index[node]
+            impacts[node] = NetworkClosureImpact(
+                node = node,
+                pairs = reached_pairs - int(totals['reached'][x]) - int(totals['reached_by'][x]),
+                affected_pairs = int(totals['affected'][x]),
+                disconnected_pairs = int(totals['disconnected'][x]),
+                total_increase = float(totals['increase'][x])
+            )
+
+        self._impacts = dict(sorted(
+            impacts.items(), key=lambda item: (item[1].disconnected_pairs, item[1].total_increase), reverse=True
+        ))
+        return self
+
+    def top_impacts(self, k: int = 10):
+        """
+        Returns k nodes whose closure has the largest impact: most disconnected pairs first,
+        then largest total increase.
+        Arguments:
+            - k:        the number of returning nodes (default = 10)
+        """
+        if k < 0:
+            raise ValueError('Negative size.')
+        if k > len(self._impacts):
+            raise ValueError('Size larger than original.')
+
+        it = iter(self._impacts)
+        return [next(it) for _ in range(k)]
+
+    @property
+    def impacts(self) -> Dict[int, NetworkClosureImpact]:
+        """
+        Returns the mapping from a node to its closure impact.
+        """
+        return self._impacts
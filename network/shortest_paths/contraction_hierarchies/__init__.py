@@ -3,4 +3,12 @@ from network.shortest_paths.contraction_hierarchies.periodic_ED \
 from network.shortest_paths.contraction_hierarchies.lazy_ED \
     import NetworkContractionHierarchiesLazyED
 from network.shortest_paths.contraction_hierarchies.random \
-    import NetworkContractionHierarchiesRandom
\ No newline at end of file
+    import NetworkContractionHierarchiesRandom
+from network.shortest_paths.contraction_hierarchies.query \
+    import NetworkContractionHierarchiesQuery
+from network.shortest_paths.contraction_hierarchies.neighbour_ED \
+    import NetworkContractionHierarchiesNeighbourED
+from network.shortest_paths.contraction_hierarchies.nested_dissection \
+    import NetworkContractionHierarchiesNestedDissection
+from network.shortest_paths.contraction_hierarchies.hub_labels \
+    import NetworkHubLabels
\ No newline at end of file
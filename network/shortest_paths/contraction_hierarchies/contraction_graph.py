@@ -0,0 +1,206 @@
+"""
+Module network.shortest_paths.contraction_hierarchies.contraction_graph
+"""
+from __future__ import annotations
+import heapq
+from typing import Dict, Iterable, Iterator
+
+from network.network import Network, NetworkConnector
+
+class NetworkContractionGraph:
+    """
+    Workspace of the contraction of a hierarchy: the remaining graph, as flat edge arrays indexed by edge id
+    and per-node lists of in- and out-edge ids.
+    - Contracting a node tombstones its edges and updates the degree counters of its neighbours; the edge lists
+      of a neighbour are compacted once most of their entries are tombstones.
+    - Shortcuts are appended in place.
+    - Witness searches reuse one set of buffers, of which only the touched entries are reset. A witness search
+      stops once it has settled all its targets or passed the largest distance it has to check, and does not
+      expand nodes beyond a hop limit.
+    """
+    # pylint: disable=too-many-instance-attributes
+    _INFINITY:      float
+    _index:         Dict[int, int]
+    _ids:           list[int]
+    _tails:         list[int]
+    _heads:         list[int]
+    _weights:       list[float]
+    _connectors:    list[NetworkConnector]
+    _alive:         bytearray
+    _out_edges:     list[list[int]]
+    _in_edges:      list[list[int]]
+    _out_degree:    list[int]
+    _in_degree:     list[int]
+    _contracted:    bytearray
+    _dists:         list[float]
+    _hops:          list[int]
+    _touched:       list[int]
+    _pq:            list[tuple[float, int]]
+
+    def __init__(self, INFINITY: float = float('inf')):
+        self._INFINITY = INFINITY
+        self._index, self._ids = {}, []
+        self._tails, self._heads, self._weights, self._connectors = [], [], [], []
+        self._alive = bytearray()
+        self._out_edges, self._in_edges = [], []
+        self._out_degree, self._in_degree = [], []
+        self._contracted = bytearray()
+        self._dists, self._hops, self._touched, self._pq = [], [], [], []
+
+    @classmethod
+    def from_net(cls, net: Network, INFINITY: float = float('inf')):
+        """
+        Initialise from the network.
+        """
+        obj = cls(INFINITY)
+        obj._ids = list(net.nodes)
+        obj._index = {node: idx for idx, node in enumerate(obj._ids)}
+        n = len(obj._ids)
+        obj._out_edges, obj._in_edges = [[] for _ in range(n)], [[] for _ in range(n)]
+        obj._out_degree, obj._in_degree = [0] * n, [0] * n
+        obj._contracted = bytearray(n)
+        obj._dists = [INFINITY] * n
+        obj._hops = [0] * n
+        for node in net.nodes:
+            for connector in net.adjs[node]:
+                obj.add_edge(connector)
+        return obj
+
+    def add_edge(self, connector: NetworkConnector):
+        """
+        Add an edge (or a shortcut) to the graph.
+        """
+        u, v = self._index[connector.src], self._index[connector.dest]
+        edge = len(self._connectors)
+        self._tails.append(u)
+        self._heads.append(v)
+        self._weights.append(connector.weight)
+        self._connectors.append(connector)
+        self._alive.append(1)
+        self._out_edges[u].append(edge)
+        self._in_edges[v].append(edge)
+        self._out_degree[u] += 1
+        self._in_degree[v] += 1
+
+    def remove_node(self, node: int):
+        """
+        Contract a node: its edges are tombstoned.
+        """
+        x = self._index[node]
+        self._contracted[x] = 1
+        alive, tails, heads = self._alive, self._tails, self._heads
+        neighbours = set()
+        for edge in self._out_edges[x]:
+            if alive[edge]:
+                alive[edge] = 0
+                self._in_degree[heads[edge]] -= 1
+                neighbours.add(heads[edge])
+        for edge in self._in_edges[x]:
+            if alive[edge]:
+                alive[edge] = 0
+                self._out_degree[tails[edge]] -= 1
+                neighbours.add(tails[edge])
+        self._out_edges[x], self._in_edges[x] = [], []
+        self._out_degree[x], self._in_degree[x] = 0, 0
+
+        for y in neighbours:
+            if len(self._out_edges[y]) > 2 * self._out_degree[y] + 8:
+                self._out_edges[y] = [edge for edge in self._out_edges[y] if alive[edge]]
+            if len(self._in_edges[y]) > 2 * self._in_degree[y] + 8:
+                self._in_edges[y] = [edge for edge in self._in_edges[y] if alive[edge]]
+
+    def out_connectors(self, node: int) -> Iterator[NetworkConnector]:
+        """
+        Returns the connectors leaving a node.
+        """
+        alive, connectors = self._alive, self._connectors
+        return (connectors[edge] for edge in self._out_edges[self._index[node]] if alive[edge])
+
+    def in_connectors(self, node: int) -> Iterator[NetworkConnector]:
+        """
+        Returns the connectors entering a node.
+        """
+        alive, connectors = self._alive, self._connectors
+        return (connectors[edge] for edge in self._in_edges[self._index[node]] if alive[edge])
+
+    def degree(self, node: int) -> int:
+        """
+        Returns the out-degree of a node.
+        """
+        return self._out_degree[self._index[node]]
+
+    def degree_rev(self, node: int) -> int:
+        """
+        Returns the in-degree of a node.
+        """
+        return self._in_degree[self._index[node]]
+
+    def is_contracted(self, node: int) -> bool:
+        """
+        Returns if a node is contracted.
+        """
+        return bool(self._contracted[self._index[node]])
+
+    def witness_search(
+        self, src: int, excluded: int, targets: Iterable[int], max_dist: float,
+        local_steps: int = None, hop_limit: int = None
+    ):
+        """
+        Runs a Dijkstra search from source src avoiding node excluded, until every target is settled
+        or the distance max_dist is passed. The distances are then read with witness_dist(); they are upper bounds
+        of the distances avoiding the excluded node, exact for the settled targets.
+        Arguments:
+            - local_steps:      maximum number of settled nodes (default: no limit)
+            - hop_limit:        maximum number of edges of the paths searched (default: no limit)
+        """
+        # pylint: disable=too-many-arguments, too-many-locals
+        INFINITY = self._INFINITY
+        dists, hops, touched, pq = self._dists, self._hops, self._touched, self._pq
+        for idx in touched:
+            dists[idx] = INFINITY
+        touched.clear()
+        pq.clear()
+
+        s, x = self._index[src], self._index[excluded]
+        index, alive, heads, weights, out_edges = self._index, self._alive, self._heads, self._weights, self._out_edges
+        remaining = {index[target] for target in targets}
+        remaining.discard(s)
+        dists[s], hops[s] = 0, 0
+        touched.append(s)
+        if s != x and remaining:
+            pq.append((0, s))
+
+        settled = 0
+        while pq:
+            dist_u, u = heapq.heappop(pq)
+            if dist_u != dists[u]:
+                continue
+            if dist_u > max_dist:
+                break
+            remaining.discard(u)
+            settled += 1
+            if not remaining or (local_steps is not None and settled >= local_steps):
+                break
+            if hop_limit is not None and hops[u] >= hop_limit:
+                continue
+
+            for edge in out_edges[u]:
+                v = heads[edge]
+                if not alive[edge] or v == x:
+                    continue
+                dist_v = dist_u + weights[edge]
+                if dist_v < dists[v] and dist_v <= max_dist:
+                    if dists[v] == INFINITY:
+                        touched.append(v)
+                    dists[v] = dist_v
+                    hops[v] = hops[u] + 1
+                    heapq.heappush(pq, (dist_v, v))
+
+    def witness_dist(self, node: int) -> float:
+        """
+        Returns the distance of a node found by the latest witness search.
+        """
+        return self._dists[self._index[node]]
+
+    def __len__(self):
+        return len(self._ids) - sum(self._contracted)
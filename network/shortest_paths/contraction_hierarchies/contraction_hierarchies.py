@@ -1,36 +1,60 @@
 """
 Module network.shortest_paths.contraction_hierarchies.contraction_hierarchies
 """
+from __future__ import annotations
+import threading
+from array import array
+from collections import OrderedDict
 from typing import Iterable
-from network.network import Network, NetworkConnector, RemovableNetwork
-from network.shortest_paths import NetworkBidirectionalDijkstra, NetworkDijkstraLocalSteps
 
-class NetworkConnectorTreeNode(NetworkConnector):
+import numpy as np
+
+from network.network import Network, NetworkChange, NetworkConnector
+from network.components import unreachable
+from network.shortest_paths import NetworkBidirectionalDijkstra
+from network.shortest_paths.batch import NetworkBatchSpec, NetworkSharedConnector
+from network.shortest_paths.contraction_hierarchies.contraction_graph import NetworkContractionGraph
+from network.shortest_paths.contraction_hierarchies.query import NetworkContractionHierarchiesQuery
+from network.shortest_paths.contraction_hierarchies.many_to_many import many_to_many
+
+# Guard the lazy query engines and the LRU caches of the shortcut tables against concurrent queries.
+_QUERY_LOCK = threading.Lock()
+_CACHE_LOCK = threading.Lock()
+
+class NetworkShortcutConnector(NetworkConnector):
     """
-    A sequence of network edges stored in a binary-tree style.
+    A shortcut of a contraction hierarchy, standing for two consecutive edges through a contracted middle node.
+    The edges it stands for are stored by id in the shortcut table of the hierarchy.
     """
-    def __init__(self, left, right):
+    def __init__(self, src: int, dest: int, edge: int, weight: float, table: 'NetworkShortcutTable'):
         super().__init__(
-            src = left.src,
-            dest = right.dest
+            src = src,
+            dest = dest
         )
-        self._left = left
-        self._right = right
-        self._weight = left.weight + right.weight
+        self._edge = edge
+        self._weight = weight
+        self._table = table
+
+    @property
+    def edge(self) -> int:
+        """
+        Returns the edge id of the shortcut in its table.
+        """
+        return self._edge
 
     @property
-    def left(self):
+    def middle(self) -> int:
         """
-        Returns the left node of the binary tree.
+        Returns the contracted node the shortcut passes through.
         """
-        return self._left
+        return self._table.middle(self._edge)
 
     @property
-    def right(self):
+    def table(self) -> 'NetworkShortcutTable':
         """
-        Returns the right node of the binary tree.
+        Returns the shortcut table storing the shortcut.
         """
-        return self._right
+        return self._table
 
     @property
     def weight(self):
@@ -38,31 +62,259 @@ class NetworkConnectorTreeNode(NetworkConnector):
         Returns the total weight of the edge sequence.
         """
         return self._weight
-    
+
     def __repr__(self) -> str:
-        return 'NetworkConnectorTreeNode(src={}, dest={}, weight={}, childtypes={}, {})' \
-            .format(self.src, self.dest, self.weight, type(self._left), type(self._right))
-    
+        return 'NetworkShortcutConnector(src={}, dest={}, weight={}, middle={})' \
+            .format(self.src, self.dest, self.weight, self.middle)
+
     def unpack(self) -> Iterable[NetworkConnector]:
         """
-        Unpacking the binary tree into a sequence of edges.
+        Unpacking the shortcut into a sequence of edges.
+        """
+        yield from self._table.unpack(self._edge)
+
+    def __hash__(self):
+        return id(self)
+
+class NetworkShortcutTable:
+    """
+    Flat storage of the edges of a contraction hierarchy, by edge id.
+    Original edges keep their connector; a shortcut stores its middle node and the ids of its two child edges
+    (-1 for original edges), and every edge the number of original edges it stands for. A shortcut is unpacked
+    with an explicit stack, in time linear in its number of original edges. An optional LRU cache keeps the
+    unpacked edge sequences of the most recently used shortcuts.
+    """
+    _connectors:    list[NetworkConnector]
+    _edge_ids:      dict[int, int]
+    _middles:       array
+    _lefts:         array
+    _rights:        array
+    _hops:          array
+    _cache:         OrderedDict | None
+    _cache_size:    int
+
+    def __init__(self, cache_size: int = 0):
+        self._connectors = []
+        self._edge_ids = {}
+        self._middles = array('q')
+        self._lefts = array('q')
+        self._rights = array('q')
+        self._hops = array('q')
+        self._cache = OrderedDict() if cache_size > 0 else None
+        self._cache_size = cache_size
+
+    def _append(self, connector: NetworkConnector, middle: int, left: int, right: int, hops: int = 1) -> int:
+        self._connectors.append(connector)
+        self._middles.append(middle)
+        self._lefts.append(left)
+        self._rights.append(right)
+        self._hops.append(hops)
+        return len(self._connectors) - 1
+
+    def edge_of(self, connector: NetworkConnector) -> int:
+        """
+        Returns the edge id of a connector, registering original connectors on first sight.
+        """
+        if isinstance(connector, NetworkShortcutConnector) and connector.table is self:
+            return connector.edge
+        if id(connector) not in self._edge_ids:
+            self._edge_ids[id(connector)] = self._append(connector, -1, -1, -1)
+        return self._edge_ids[id(connector)]
+
+    def add_shortcut(self, left: NetworkConnector, right: NetworkConnector) -> NetworkShortcutConnector:
+        """
+        Stores the shortcut of two consecutive edges, then returns it as a connector.
+        """
+        left_edge, right_edge = self.edge_of(left), self.edge_of(right)
+        edge = self._append(None, left.dest, left_edge, right_edge, self._hops[left_edge] + self._hops[right_edge])
+        return NetworkShortcutConnector(left.src, right.dest, edge, left.weight + right.weight, self)
+
+    def middle(self, edge: int) -> int:
+        """
+        Returns the middle node of a shortcut (-1 for an original edge).
+        """
+        return self._middles[edge]
+
+    def hops(self, connector: NetworkConnector) -> int:
+        """
+        Returns the number of original edges a connector stands for.
         """
-        for connector in self._left.unpack():
-            yield connector
-        for connector in self._right.unpack():
-            yield connector
+        if isinstance(connector, NetworkShortcutConnector) and connector.table is self:
+            return self._hops[connector.edge]
+        return 1
+
+    def children(self, edge: int) -> tuple[int, int]:
+        """
+        Returns the ids of the two child edges of a shortcut.
+        """
+        return self._lefts[edge], self._rights[edge]
+
+    def unpack(self, edge: int) -> tuple[NetworkConnector, ...]:
+        """
+        Returns the original connectors an edge stands for.
+        """
+        cache = self._cache
+        if cache is not None:
+            with _CACHE_LOCK:
+                unpacked = cache.get(edge)
+                if unpacked is not None:
+                    cache.move_to_end(edge)
+                    return unpacked
+
+        connectors, middles, lefts, rights = self._connectors, self._middles, self._lefts, self._rights
+        unpacked, stack = [], [edge]
+        while stack:
+            top = stack.pop()
+            if middles[top] < 0:
+                unpacked.append(connectors[top])
+            else:
+                stack.append(rights[top])
+                stack.append(lefts[top])
+
+        unpacked = tuple(unpacked)
+        if cache is not None and middles[edge] >= 0:
+            with _CACHE_LOCK:
+                cache[edge] = unpacked
+                if len(cache) > self._cache_size:
+                    cache.popitem(last=False)
+        return unpacked
+
+    def __len__(self):
+        return len(self._connectors)
+
+    def nbytes(self) -> int:
+        """
+        Returns the memory used by the flat arrays, in bytes.
+        """
+        return sum(len(arr) * arr.itemsize for arr in (self._middles, self._lefts, self._rights, self._hops))
+
+class NetworkContractionHierarchiesShared:
+    """
+    Read-only contraction hierarchy rebuilt in a worker process from arrays in shared memory (see batch queries):
+    the upward graphs of its query engine and the flat arrays of its shortcut table.
+    An edge of the upward graphs is coded by its id in the shortcut table if it is a shortcut, or by
+    -1 - its edge id in the CSR of the network otherwise; paths are unpacked into the connectors of the
+    NetworkSharedGraph the hierarchy is rebuilt on.
+    """
+    _graph:         object
+    _query:         NetworkContractionHierarchiesQuery
+    _INFINITY:      float
+    _middles:       list[int]
+    _lefts:         list[int]
+    _rights:        list[int]
+    _table_edges:   list[int]
+
+    @staticmethod
+    def arrays_of(ch: 'NetworkContractionHierarchies') -> dict[str, np.ndarray]:
+        """
+        Returns the arrays of a built hierarchy, by name.
+        """
+        # pylint: disable=protected-access
+        query, table = ch.query, ch._shortcuts
+        csr_edge = {id(connector): edge for edge, connector in enumerate(ch._net.csr().connectors)}
+        def code(connector: NetworkConnector) -> int:
+            if isinstance(connector, NetworkShortcutConnector) and connector.table is table:
+                return connector.edge
+            return -1 - csr_edge[id(connector)]
+
+        arrays = {'ch_ids': np.array(query.ids, dtype=np.int64)}
+        for name, (offsets, heads, weights, connectors) in zip(('fwd', 'bkd'), query.graphs):
+            arrays['ch_offsets_' + name] = np.array(offsets, dtype=np.int64)
+            arrays['ch_heads_' + name] = np.array(heads, dtype=np.int64)
+            arrays['ch_weights_' + name] = np.array(weights, dtype=np.float64)
+            arrays['ch_codes_' + name] = np.fromiter(map(code, connectors), dtype=np.int64, count=len(connectors))
+
+        arrays['ch_middles'] = np.array(table._middles, dtype=np.int64)
+        arrays['ch_lefts'] = np.array(table._lefts, dtype=np.int64)
+        arrays['ch_rights'] = np.array(table._rights, dtype=np.int64)
+        arrays['ch_table_edges'] = np.fromiter(
+            (csr_edge.get(id(connector), -1) if connector is not None else -1 for connector in table._connectors),
+            dtype=np.int64, count=len(table)
+        )
+        return arrays
+
+    @classmethod
+    def from_graph(cls, graph, INFINITY: float = float('inf')):
+        """
+        Initialise from a NetworkSharedGraph holding the arrays returned by arrays_of().
+        """
+        # pylint: disable=too-many-locals
+        obj = cls()
+        arrays = graph.arrays
+        ids = arrays['ch_ids'].tolist()
+        graphs = []
+        for name, reverse in (('fwd', False), ('bkd', True)):
+            offsets, heads, weights, codes = (
+                arrays[prefix + name].tolist() for prefix in ('ch_offsets_', 'ch_heads_', 'ch_weights_', 'ch_codes_')
+            )
+            connectors = []
+            for u in range(len(ids)):
+                for edge in range(offsets[u], offsets[u + 1]):
+                    # The edges u -> v of the backward graph stand for the upward edges v -> u.
+                    src, dest = (heads[edge], u) if reverse else (u, heads[edge])
+                    connectors.append(NetworkSharedConnector(ids[src], ids[dest], codes[edge], weights[edge]))
+            graphs.append((offsets, heads, weights, connectors))
+
+        obj._graph = graph
+        obj._query = NetworkContractionHierarchiesQuery.from_graphs(ids, tuple(graphs), INFINITY)
+        obj._INFINITY = INFINITY
+        obj._middles, obj._lefts, obj._rights, obj._table_edges = (
+            arrays[name].tolist() for name in ('ch_middles', 'ch_lefts', 'ch_rights', 'ch_table_edges')
+        )
+        return obj
+
+    def dist(self, src: int, dest: int) -> float:
+        """
+        Returns the length of the shortest path from source src to destination dest.
+        """
+        if unreachable(self._graph, src, dest):
+            return self._INFINITY
+        return self._query.dist(src, dest)
+
+    def path(self, src: int, dest: int) -> tuple[float, list[NetworkConnector]]:
+        """
+        Returns the shortest path from source src to destination dest, unpacked.
+        """
+        if unreachable(self._graph, src, dest):
+            return self._INFINITY, []
+        dist, raw_path = self._query.path(src, dest)
+
+        connectors = self._graph.csr().connectors
+        middles, lefts, rights, table_edges = self._middles, self._lefts, self._rights, self._table_edges
+        path = []
+        for connector in raw_path:
+            if connector.edge < 0:
+                path.append(connectors[-1 - connector.edge])
+                continue
+            stack = [connector.edge]
+            while stack:
+                top = stack.pop()
+                if middles[top] < 0:
+                    path.append(connectors[table_edges[top]])
+                else:
+                    stack.append(rights[top])
+                    stack.append(lefts[top])
+        return dist, path
 
 class NetworkContractionHierarchies(NetworkBidirectionalDijkstra):
     """
     Generic implementation of the Contraction Hierarchies algorithm.
+    The hierarchy subscribes to the changes of its network. Any edit invalidates the whole hierarchy, wherever
+    it applies (shortcuts may stand for the edited edges anywhere in it): the hierarchy is then stale, and
+    queries fall back to a Bidirectional Dijkstra engine on the edited network until rebuild() is called.
     """
     _level:         dict[int, int]
-    _rem_net:       RemovableNetwork
+    _graph:         NetworkContractionGraph
     _net:           Network
     _overlay_net:   Network
+    _shortcuts:     NetworkShortcutTable
+    _query:         NetworkContractionHierarchiesQuery | None
     _no_shortcuts:  int
+    _build_kwargs:  dict
+    _fallback:      NetworkBidirectionalDijkstra | None
+    _hop_limit:     int | None
 
-    def _shortcuts_added_at(self, node: int, local_steps: int = 50):
+    def _shortcuts_added_at(self, node: int, local_steps: int = None):
         def group_connectors_by_min_weight(node_select, adjs):
             group = {}
             for connector in adjs:
@@ -73,29 +325,33 @@ class NetworkContractionHierarchies(NetworkBidirectionalDijkstra):
                     group[node] = connector
             return group
 
-        lefts  = group_connectors_by_min_weight(lambda connector: connector.src,  self._rem_net.adjs_rev[node])
-        rights = group_connectors_by_min_weight(lambda connector: connector.dest, self._rem_net.adjs[node])
-        
-        shortcuts = []
-        self._rem_net.hide_node(node)
+        lefts  = group_connectors_by_min_weight(lambda connector: connector.src,  self._graph.in_connectors(node))
+        rights = group_connectors_by_min_weight(lambda connector: connector.dest, self._graph.out_connectors(node))
 
+        shortcuts = []
+        if not rights:
+            return shortcuts
+        max_right_weight = max(connector.weight for connector in rights.values())
         for left, left_connector in lefts.items():
-            engine = NetworkDijkstraLocalSteps(limit=local_steps).from_src(net=self._rem_net, src=left)
+            # One witness search per incoming neighbour, bounded by the heaviest candidate shortcut.
+            self._graph.witness_search(
+                left, node, rights, left_connector.weight + max_right_weight, local_steps, self._hop_limit
+            )
             for right, right_connector in rights.items():
-                dist = engine.dists.get(right, self._INFINITY)
+                if right == left:
+                    continue
+                dist = self._graph.witness_dist(right)
                 if dist > left_connector.weight + right_connector.weight:
                     # Contraction (may) leads to change in shortest path
                     shortcuts.append((left_connector, right_connector))
 
-        self._rem_net.unhide_node(node)
-
         return shortcuts
 
     def _contract(self, node: int, shortcuts: list[tuple[int, int]]):
-        self._rem_net.remove_node(node)
-        for shortcut in shortcuts:
-            connector = NetworkConnectorTreeNode(*shortcut)
-            self._rem_net.add_edge(connector)
+        self._graph.remove_node(node)
+        for left, right in shortcuts:
+            connector = self._shortcuts.add_shortcut(left, right)
+            self._graph.add_edge(connector)
             self._overlay_net.add_edge(connector)
         
         self._no_shortcuts += len(shortcuts)
@@ -111,9 +367,12 @@ class NetworkContractionHierarchies(NetworkBidirectionalDijkstra):
                     adjs_list.append(connector)
 
     def _init_vars(self, net: Network, INFINITY: float = float('inf')):
-        self._rem_net = RemovableNetwork.from_net(net=net)
+        self._graph = NetworkContractionGraph.from_net(net, INFINITY)
         self._net = net
         self._overlay_net = Network()
+        build_kwargs = getattr(self, '_build_kwargs', {})
+        self._shortcuts = NetworkShortcutTable(build_kwargs.get('unpack_cache_size', 0))
+        self._hop_limit = build_kwargs.get('hop_limit')
 
         self._INFINITY = INFINITY
         self._nodes = net.nodes
@@ -121,40 +380,141 @@ class NetworkContractionHierarchies(NetworkBidirectionalDijkstra):
         self._no_shortcuts = 0
         
         self._early_stop = False
+        # Dropped on every (re)build: the hierarchy is up to date.
+        self._fallback = None
+        self._query = None
+
+    def _on_change(self, change: NetworkChange):
+        # pylint: disable=unused-argument
+        # One engine answers every query until the next rebuild, so that its workspaces are reused.
+        if self._fallback is None:
+            self._fallback = NetworkBidirectionalDijkstra.from_net(self._net, INFINITY=self._INFINITY)
 
-    def _edge_difference(self, node: int, shortcuts: list[tuple[int, int]] = None, local_steps: int = 50) -> int:
+    def _edge_difference(self, node: int, shortcuts: list[tuple[int, int]] = None, local_steps: int = None) -> int:
         if not shortcuts:
             shortcuts = self._shortcuts_added_at(node, local_steps)
-        return len(shortcuts) - self._rem_net.degree(node) - self._rem_net.degree_rev(node)
+        return len(shortcuts) - self._graph.degree(node) - self._graph.degree_rev(node)
 
     def _build_contraction_net(self, net: Network, **kwargs):
         raise NotImplementedError()
 
     @classmethod
     def from_net(cls, net: Network, **kwargs):
+        """
+        Builds the hierarchy of a network.
+        Arguments:
+            - unpack_cache_size:    number of unpacked shortcuts kept in the LRU cache (default: 0, no cache)
+            - hop_limit:            maximum number of edges of the witness paths (default: no limit)
+            - local_steps:          maximum number of nodes settled by a witness search
+        Other keyword arguments are passed to the contraction heuristic.
+        """
         obj = cls()
+        obj._build_kwargs = kwargs
         obj._build_contraction_net(net, **kwargs)
+        if hasattr(net, 'subscribe'):
+            net.subscribe(obj._on_change)
         return obj
 
+    def rebuild(self):
+        """
+        Rebuilds the hierarchy on the current state of its network.
+        """
+        self._build_contraction_net(self._net, **self._build_kwargs)
+        return self
+
     def dist(self, src: int, dest: int, **kwargs):
         """
         Returns the length of the shortest path from source src to destination dest.
+        The path itself is neither rebuilt nor unpacked.
         """
-        return super().path(src, dest, **kwargs)[0]
+        # pylint: disable=unused-argument
+        if self.is_stale:
+            return self._fallback.path(src, dest)[0]
+        if unreachable(self._net, src, dest):
+            return self._INFINITY
+        return self.query.dist(src, dest)
 
     def raw_path(self, src: int, dest: int, **kwargs):
         """
         Returns the "raw" shortest path from source src to destination dest.
-        Some continuous edges in the path may be compressed into a single NetworkConnectorTreeNode.
+        Some continuous edges in the path may be compressed into a single NetworkShortcutConnector.
         """
-        return super().path(src, dest, **kwargs)
+        # pylint: disable=unused-argument
+        if self.is_stale:
+            return self._fallback.path(src, dest)
+        if unreachable(self._net, src, dest):
+            return self._INFINITY, []
+        return self.query.path(src, dest)
 
     def path(self, src: int, dest: int, **kwargs):
         """
         Returns the shortest path from source src to destination dest.
         """
-        super_path = super().path(src, dest, **kwargs)
-        return super_path[0], sum([list(connector_tree_node.unpack()) for connector_tree_node in super_path[1]], [])
+        dist, raw_path = self.raw_path(src, dest, **kwargs)
+        path = []
+        for connector in raw_path:
+            path.extend(connector.unpack())
+        return dist, path
+
+    def matrix(
+        self, sources: Iterable[int], targets: Iterable[int], processes: int = None, chunk_size: int = 64,
+        progress: bool = True
+    ) -> np.ndarray:
+        """
+        Returns the matrix of the shortest path lengths from every source (rows) to every target (columns),
+        computed by bucket-based many-to-many searches.
+        Arguments:
+            - processes:        number of worker processes (default: one per CPU; 1 runs in this process)
+            - chunk_size:       number of sources per task
+            - progress:         show a progress bar of the chunks
+        """
+        sources, targets = list(sources), list(targets)
+        if self.is_stale:
+            engine = self._fallback
+            return np.array(
+                [[engine.path(src, dest)[0] for dest in targets] for src in sources], dtype=np.float64
+            ).reshape(len(sources), len(targets))
+        return many_to_many(self.query, sources, targets, processes, chunk_size, progress)
+
+    def _batch_spec(self) -> NetworkBatchSpec:
+        if self.is_stale:
+            return self._fallback._batch_spec()  # pylint: disable=protected-access
+        return NetworkBatchSpec(
+            self._net, NetworkContractionHierarchiesShared.from_graph, {'INFINITY': self._INFINITY},
+            NetworkContractionHierarchiesShared.arrays_of(self)
+        )
+
+    @property
+    def query(self) -> NetworkContractionHierarchiesQuery:
+        """
+        Returns the query engine of the hierarchy (stall-on-demand search on the upward graphs).
+        """
+        if self._query is None:
+            with _QUERY_LOCK:
+                if self._query is None:
+                    self._query = NetworkContractionHierarchiesQuery.from_hierarchy(self)
+        return self._query
+
+    @property
+    def search_space(self) -> dict[int, tuple[float, float]]:
+        """
+        Returns the search space of the latest query.
+        """
+        return self.query.search_space
+
+    @property
+    def settled(self) -> int:
+        """
+        Returns the number of nodes settled by the latest query.
+        """
+        return self.query.settled
+
+    @property
+    def is_stale(self) -> bool:
+        """
+        Returns if the network has been edited since the hierarchy was built.
+        """
+        return self._fallback is not None
 
     @property
     def no_shortcuts(self):
@@ -163,6 +523,13 @@ class NetworkContractionHierarchies(NetworkBidirectionalDijkstra):
         """
         return self._no_shortcuts
 
+    @property
+    def shortcuts(self) -> NetworkShortcutTable:
+        """
+        Returns the shortcut table.
+        """
+        return self._shortcuts
+
     @property
     def level(self):
         """
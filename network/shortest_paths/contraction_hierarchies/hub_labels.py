@@ -0,0 +1,268 @@
+"""
+Module network.shortest_paths.contraction_hierarchies.hub_labels
+"""
+from __future__ import annotations
+import os
+import time
+from typing import Dict, Iterable, Iterator
+
+import numpy as np
+from tqdm import tqdm
+
+from network.shortest_paths.batch import NetworkBatchQueries, NetworkBatchSpec
+from network.shortest_paths.contraction_hierarchies.contraction_hierarchies import NetworkContractionHierarchies
+
+class NetworkHubLabels(NetworkBatchQueries):
+    """
+    Hub labeling distance oracle derived from a contraction hierarchy.
+    The forward (backward) label of a node lists the nodes of its upward forward (backward) search space,
+    its hubs, with their distances; the shortest path from s to t passes through a common hub of the
+    forward label of s and the backward label of t, so dist(s, t) is a merge of two sorted lists.
+
+    Labels are computed top-down: the label of a node is derived from the labels of its upward neighbours,
+    then pruned of the hubs whose distance is not the shortest one (checked against the labels of the hub).
+    Labels are stored in flat arrays sorted by hub (numbered by level): offsets, hubs and distances for
+    each direction, which save() writes as .npy files and load() can memory-map.
+    Paths are recovered through the hierarchy.
+    """
+    # pylint: disable=too-many-instance-attributes
+    _ch:            NetworkContractionHierarchies | None
+    _ids:           np.ndarray
+    _index:         Dict[int, int]
+    _hub_ids:       np.ndarray
+    _offsets:       tuple[np.ndarray, np.ndarray]
+    _hubs:          tuple[np.ndarray, np.ndarray]
+    _dists:         tuple[np.ndarray, np.ndarray]
+    _views:         tuple
+    _build_time:    float
+
+    FILES = ('ids', 'hub_ids', 'offsets_fwd', 'hubs_fwd', 'dists_fwd', 'offsets_bkd', 'hubs_bkd', 'dists_bkd')
+
+    def __init__(self):
+        self._ch = None
+        self._build_time = 0.0
+
+    @staticmethod
+    def _labels_of(
+        order: list[int], level: Dict[int, int], adjs: Dict[int, list], reverse: bool
+    ) -> Dict[int, Dict[int, float]]:
+        """
+        Returns the unpruned labels of every node in one direction, computed in decreasing level order.
+        """
+        labels = {}
+        for node in tqdm(order):
+            label = {level[node]: 0.0}
+            for connector in adjs[node]:
+                neighbour, weight = (connector.src if reverse else connector.dest), connector.weight
+                for hub, dist in labels[neighbour].items():
+                    if dist + weight < label.get(hub, float('inf')):
+                        label[hub] = dist + weight
+            labels[node] = label
+        return labels
+
+    @staticmethod
+    def _prune(
+        order: list[int], level: Dict[int, int], labels: Dict[int, Dict[int, float]],
+        labels_other: Dict[int, Dict[int, float]], hub_ids: list[int]
+    ):
+        """
+        Removes the hubs of the labels whose distance is longer than the distance through another hub.
+        """
+        for node in tqdm(order):
+            label = labels[node]
+            pruned = {}
+            for hub, dist in label.items():
+                if hub == level[node]:
+                    pruned[hub] = dist
+                    continue
+                other = labels_other[hub_ids[hub]]
+                if min((label[x] + d for x, d in other.items() if x in label), default=dist) >= dist:
+                    pruned[hub] = dist
+            labels[node] = pruned
+
+    def _flatten(self, labels: Dict[int, Dict[int, float]]) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
+        offsets = np.zeros(len(self._ids) + 1, dtype=np.int64)
+        hubs, dists = [], []
+        for idx, node in enumerate(self._ids.tolist()):
+            label = sorted(labels[node].items())
+            hubs.extend(hub for hub, _ in label)
+            dists.extend(dist for _, dist in label)
+            offsets[idx + 1] = len(hubs)
+        return offsets, np.array(hubs, dtype=np.int32), np.array(dists, dtype=np.float64)
+
+    @classmethod
+    def from_hierarchy(cls, ch: NetworkContractionHierarchies):
+        """
+        Computes the hub labels of a built contraction hierarchy.
+        """
+        # pylint: disable=protected-access
+        start = time.perf_counter()
+        obj = cls()
+        obj._ch = ch
+        level = ch.level
+        order = sorted(level, key=lambda node: -level[node])
+        hub_ids = [0] * len(level)
+        for node, lvl in level.items():
+            hub_ids[lvl] = node
+
+        # Forward labels follow the upward edges u -> v of adjs_fwd[u]; backward labels, the upward edges
+        # v -> u stored in adjs_bkd[u]. Both are complete before pruning, as a hub is only checked against
+        # labels of higher nodes.
+        labels_fwd = cls._labels_of(order, level, ch._adjs_fwd, reverse=False)
+        labels_bkd = cls._labels_of(order, level, ch._adjs_bkd, reverse=True)
+        cls._prune(order, level, labels_fwd, labels_bkd, hub_ids)
+        cls._prune(order, level, labels_bkd, labels_fwd, hub_ids)
+
+        obj._ids = np.array(list(ch._nodes), dtype=np.int64)
+        obj._index = {node: idx for idx, node in enumerate(obj._ids.tolist())}
+        obj._hub_ids = np.array(hub_ids, dtype=np.int64)
+        flat_fwd, flat_bkd = obj._flatten(labels_fwd), obj._flatten(labels_bkd)
+        obj._offsets = (flat_fwd[0], flat_bkd[0])
+        obj._hubs = (flat_fwd[1], flat_bkd[1])
+        obj._dists = (flat_fwd[2], flat_bkd[2])
+        obj._build_time = time.perf_counter() - start
+        return obj._bind()
+
+    def save(self, directory: str):
+        """
+        Writes the label arrays into a directory, one .npy file each.
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name, arr in zip(self.FILES, self._arrays()):
+            np.save(os.path.join(directory, name + '.npy'), arr)
+
+    @classmethod
+    def load(cls, directory: str, ch: NetworkContractionHierarchies = None, mmap: bool = True):
+        """
+        Reads label arrays written by save(), memory-mapped by default.
+        The hierarchy they were computed from is needed to recover paths.
+        """
+        return cls.load_arrays([
+            np.load(os.path.join(directory, name + '.npy'), mmap_mode='r' if mmap else None) for name in cls.FILES
+        ], ch)
+
+    @classmethod
+    def from_graph(cls, graph):
+        """
+        Initialise in a worker process from the label arrays shared along with the CSR (see batch queries).
+        Such labels answer distance queries only.
+        """
+        return cls.load_arrays([graph.arrays['labels_' + name] for name in cls.FILES])
+
+    @classmethod
+    def load_arrays(cls, arrays: list[np.ndarray], ch: NetworkContractionHierarchies = None):
+        """
+        Initialise from label arrays, given in the order of FILES.
+        """
+        obj = cls()
+        obj._ch = ch
+        obj._ids, obj._hub_ids = arrays[0], arrays[1]
+        obj._offsets, obj._hubs, obj._dists = (arrays[2], arrays[5]), (arrays[3], arrays[6]), (arrays[4], arrays[7])
+        obj._index = {node: idx for idx, node in enumerate(obj._ids.tolist())}
+        return obj._bind()
+
+    def _bind(self):
+        # Memoryviews read single items as Python numbers, much faster than NumPy scalars.
+        self._views = tuple(
+            tuple(memoryview(arr) for arr in arrays) for arrays in (self._offsets, self._hubs, self._dists)
+        )
+        return self
+
+    def hub(self, src: int, dest: int) -> tuple[float, int]:
+        """
+        Returns the length of the shortest path from source src to destination dest and the hub it passes
+        through (-1 if there is no path).
+        """
+        (offsets_fwd, offsets_bkd), (hubs_fwd, hubs_bkd), (dists_fwd, dists_bkd) = self._views
+        idx_fwd, idx_bkd = self._index[src], self._index[dest]
+        i, end_fwd = offsets_fwd[idx_fwd], offsets_fwd[idx_fwd + 1]
+        j, end_bkd = offsets_bkd[idx_bkd], offsets_bkd[idx_bkd + 1]
+
+        # Every label holds at least its own node.
+        best, best_hub = float('inf'), -1
+        hub_fwd, hub_bkd = hubs_fwd[i], hubs_bkd[j]
+        while True:
+            if hub_fwd < hub_bkd:
+                i += 1
+                if i == end_fwd:
+                    break
+                hub_fwd = hubs_fwd[i]
+            elif hub_fwd > hub_bkd:
+                j += 1
+                if j == end_bkd:
+                    break
+                hub_bkd = hubs_bkd[j]
+            else:
+                if dists_fwd[i] + dists_bkd[j] < best:
+                    best, best_hub = dists_fwd[i] + dists_bkd[j], hub_fwd
+                i += 1
+                j += 1
+                if i == end_fwd or j == end_bkd:
+                    break
+                hub_fwd, hub_bkd = hubs_fwd[i], hubs_bkd[j]
+
+        return best, (int(self._hub_ids[best_hub]) if best_hub != -1 else -1)
+
+    def dist(self, src: int, dest: int) -> float:
+        """
+        Returns the length of the shortest path from source src to destination dest.
+        Queries of a stale hierarchy fall back to the hierarchy itself.
+        """
+        if self._ch is not None and self._ch.is_stale:
+            return self._ch.dist(src, dest)
+        return self.hub(src, dest)[0]
+
+    def path(self, src: int, dest: int):
+        """
+        Returns the shortest path from source src to destination dest, recovered through the hierarchy.
+        """
+        if self._ch is None:
+            raise ValueError('Paths need the contraction hierarchy the labels were computed from.')
+        return self._ch.path(src, dest)
+
+    def _arrays(self) -> list[np.ndarray]:
+        return [self._ids, self._hub_ids, self._offsets[0], self._hubs[0], self._dists[0],
+                self._offsets[1], self._hubs[1], self._dists[1]]
+
+    def _batch_spec(self) -> NetworkBatchSpec:
+        if self._ch is None:
+            raise ValueError('Batches need the contraction hierarchy the labels were computed from.')
+        if self._ch.is_stale:
+            return self._ch._batch_spec()
+        # pylint: disable=protected-access
+        return NetworkBatchSpec(self._ch._net, NetworkHubLabels.from_graph, arrays={
+            'labels_' + name: arr for name, arr in zip(self.FILES, self._arrays())
+        })
+
+    def batch_paths(
+        self, queries: Iterable[tuple], processes: int = None, chunk_size: int = 256
+    ) -> Iterator[tuple[float, list]]:
+        """
+        Returns the shortest paths of a batch of queries, recovered through the hierarchy.
+        """
+        if self._ch is None:
+            raise ValueError('Paths need the contraction hierarchy the labels were computed from.')
+        return self._ch.batch_paths(queries, processes, chunk_size)
+
+    def label_sizes(self) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Returns the sizes of the forward and backward labels of every node.
+        """
+        return np.diff(self._offsets[0]), np.diff(self._offsets[1])
+
+    def nbytes(self) -> int:
+        """
+        Returns the memory used by the label arrays, in bytes.
+        """
+        return sum(arr.nbytes for arr in self._arrays())
+
+    def report(self) -> str:
+        """
+        Returns a report of the label sizes, the memory used and the build time.
+        """
+        sizes_fwd, sizes_bkd = self.label_sizes()
+        return '\n'.join([
+            'Forward labels: {:.1f} hubs on average, {} at most.'.format(sizes_fwd.mean(), int(sizes_fwd.max())),
+            'Backward labels: {:.1f} hubs on average, {} at most.'.format(sizes_bkd.mean(), int(sizes_bkd.max())),
+            'Memory: {:.1f} KiB; build time: {:.2f}s.'.format(self.nbytes() / 2 ** 10, self._build_time),
+        ])
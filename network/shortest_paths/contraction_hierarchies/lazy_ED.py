@@ -14,7 +14,7 @@ class NetworkContractionHierarchiesLazyED(NetworkContractionHierarchies):
     Builds the network using the lazy edge-difference assignment heuristic.
     """
     
-    def _build_contraction_net(self, net: Network, local_steps: int = 50, INFINITY: float = float('inf'), **kwargs):
+    def _build_contraction_net(self, net: Network, local_steps: int = None, INFINITY: float = float('inf'), **kwargs):
         self._init_vars(net, INFINITY)
         
         costs_of = {}
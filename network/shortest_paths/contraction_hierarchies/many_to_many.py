@@ -0,0 +1,125 @@
+"""
+Module network.shortest_paths.contraction_hierarchies.many_to_many
+"""
+from __future__ import annotations
+import heapq
+import multiprocessing
+from typing import Dict, Iterable
+
+import numpy as np
+from tqdm import tqdm
+
+Graph = tuple[list[int], list[int], list[float]]
+
+def _upward_search(graph: Graph, other: Graph, s: int, INFINITY: float) -> list[tuple[int, float]]:
+    """
+    Returns the nodes settled by an upward search from node s, with their distances, stalled nodes excluded:
+    a node is stalled if a higher neighbour leads to it with a shorter distance (the upward edges of the other
+    direction, read backward, are the edges entering it from higher nodes).
+    """
+    offsets, heads, weights = graph
+    offsets_other, heads_other, weights_other = other
+    dists = {s: 0.0}
+    pq = [(0.0, s)]
+    settled = []
+    while pq:
+        dist_u, u = heapq.heappop(pq)
+        if dist_u != dists[u]:
+            continue
+        if any(
+            dists.get(heads_other[edge], INFINITY) + weights_other[edge] < dist_u
+            for edge in range(offsets_other[u], offsets_other[u + 1])
+        ):
+            continue
+        settled.append((u, dist_u))
+        for edge in range(offsets[u], offsets[u + 1]):
+            v = heads[edge]
+            dist_v = dist_u + weights[edge]
+            if dist_v < dists.get(v, INFINITY):
+                dists[v] = dist_v
+                heapq.heappush(pq, (dist_v, v))
+    return settled
+
+class _MatrixWorker:
+    """
+    Computes rows of a distance matrix: forward upward searches from the sources scan the buckets filled by
+    the backward upward searches from the targets.
+    """
+    def __init__(self, graphs: tuple[Graph, Graph], buckets: Dict[int, tuple[np.ndarray, np.ndarray]],
+                 no_targets: int, INFINITY: float):
+        self._graphs = graphs
+        self._buckets = buckets
+        self._no_targets = no_targets
+        self._INFINITY = INFINITY
+
+    def rows(self, sources: list[int]) -> np.ndarray:
+        """
+        Returns the rows of the sources.
+        """
+        rows = np.full((len(sources), self._no_targets), self._INFINITY, dtype=np.float64)
+        buckets = self._buckets
+        for row, s in zip(rows, sources):
+            for u, dist_u in _upward_search(self._graphs[0], self._graphs[1], s, self._INFINITY):
+                bucket = buckets.get(u)
+                if bucket is not None:
+                    cols, dists = bucket
+                    # Each target fills a bucket at most once, so the columns of a bucket are distinct.
+                    row[cols] = np.minimum(row[cols], dists + dist_u)
+        return rows
+
+_worker: _MatrixWorker = None
+
+def _init_worker(graphs: tuple[Graph, Graph], buckets: Dict[int, tuple[np.ndarray, np.ndarray]],
+                 no_targets: int, INFINITY: float):
+    # pylint: disable=global-statement
+    global _worker
+    _worker = _MatrixWorker(graphs, buckets, no_targets, INFINITY)
+
+def _rows_in_worker(sources: list[int]) -> np.ndarray:
+    return _worker.rows(sources)
+
+def many_to_many(
+    query, sources: Iterable[int], targets: Iterable[int], processes: int = None, chunk_size: int = 64,
+    progress: bool = True
+) -> np.ndarray:
+    """
+    Returns the matrix of the shortest path lengths from every source (rows) to every target (columns)
+    of a contraction hierarchy query engine (NetworkContractionHierarchiesQuery).
+    Backward upward searches from the targets fill a bucket at every node they settle with (target, distance)
+    entries; the forward upward search from a source then only scans the buckets of the nodes it settles.
+    Arguments:
+        - processes:        number of worker processes for the forward searches (default: one per CPU;
+                            1 runs in this process)
+        - chunk_size:       number of sources per task
+        - progress:         show a progress bar of the chunks (disable it when serving requests)
+    """
+    # pylint: disable=protected-access, too-many-locals
+    INFINITY = query._INFINITY
+    index = query._index
+    graphs = tuple(graph[:3] for graph in query._graphs)
+    sources = [index[node] for node in sources]
+    targets = [index[node] for node in targets]
+
+    entries: Dict[int, tuple[list[int], list[float]]] = {}
+    for col, t in enumerate(targets):
+        for u, dist_u in _upward_search(graphs[1], graphs[0], t, INFINITY):
+            cols, dists = entries.setdefault(u, ([], []))
+            cols.append(col)
+            dists.append(dist_u)
+    buckets = {
+        u: (np.array(cols, dtype=np.int64), np.array(dists, dtype=np.float64)) for u, (cols, dists) in entries.items()
+    }
+
+    chunks = [sources[i : i + chunk_size] for i in range(0, len(sources), chunk_size)]
+    if processes == 1 or len(chunks) <= 1:
+        worker = _MatrixWorker(graphs, buckets, len(targets), INFINITY)
+        rows = [worker.rows(chunk) for chunk in tqdm(chunks, disable=not progress)]
+    else:
+        with multiprocessing.Pool(
+            processes, initializer=_init_worker, initargs=(graphs, buckets, len(targets), INFINITY)
+        ) as pool:
+            rows = list(tqdm(pool.imap(_rows_in_worker, chunks), total=len(chunks), disable=not progress))
+
+    if not rows:
+        return np.full((0, len(targets)), INFINITY, dtype=np.float64)
+    return np.vstack(rows)
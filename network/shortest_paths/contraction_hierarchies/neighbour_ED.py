@@ -0,0 +1,77 @@
+"""
+Module network.shortest_paths.contraction_hierarchies.neighbour_ED
+"""
+from __future__ import annotations
+import heapq
+from tqdm import tqdm
+
+from network.network import Network
+from network.shortest_paths.contraction_hierarchies.contraction_hierarchies import NetworkContractionHierarchies
+
+class NetworkContractionHierarchiesNeighbourED(NetworkContractionHierarchies):
+    """
+    Implementation of the NetworkContractionHierarchies class.
+    Builds the network with a priority combining several terms, recomputed only for the neighbours
+    of each contracted node:
+        - edge difference: number of shortcuts added minus number of edges removed by the contraction,
+        - deleted neighbours: number of neighbours already contracted (spreads the contractions evenly),
+        - original edges: number of original edges the added shortcuts stand for, minus those of the removed edges,
+        - depth: an upper bound of the number of levels of the hierarchy below the node.
+    The coefficients of the terms are the keyword arguments edge_difference, deleted_neighbours, original_edges
+    and depth (default: 1 each).
+    """
+
+    def _priority(self, node: int, deleted: int, depth: int, local_steps: int, coefficients: tuple) -> float:
+        shortcuts = self._shortcuts_added_at(node, local_steps)
+        table, graph = self._shortcuts, self._graph
+        hops = sum(table.hops(left) + table.hops(right) for left, right in shortcuts) \
+            - sum(table.hops(connector) for connector in graph.out_connectors(node)) \
+            - sum(table.hops(connector) for connector in graph.in_connectors(node))
+        terms = (self._edge_difference(node, shortcuts, local_steps), deleted, hops, depth)
+        return sum(coefficient * term for coefficient, term in zip(coefficients, terms))
+
+    def _build_contraction_net(
+        self, net: Network, local_steps: int = None, edge_difference: float = 1.0, deleted_neighbours: float = 1.0,
+        original_edges: float = 1.0, depth: float = 1.0, INFINITY: float = float('inf'), **kwargs
+    ):
+        # pylint: disable=too-many-arguments, too-many-locals
+        self._init_vars(net, INFINITY)
+        coefficients = (edge_difference, deleted_neighbours, original_edges, depth)
+
+        deleted_of = dict.fromkeys(net.nodes, 0)
+        depth_of = dict.fromkeys(net.nodes, 0)
+        priority_of = {}
+        pq = []
+        for node in tqdm(net.nodes):
+            priority_of[node] = self._priority(node, 0, 0, local_steps, coefficients)
+            pq.append((priority_of[node], node))
+        heapq.heapify(pq)
+
+        lvl = 0
+        pbar = tqdm(total=len(net.nodes))
+
+        while pq:
+            priority, node = heapq.heappop(pq)
+            if node in self._level or priority != priority_of[node]:
+                continue
+
+            neighbours = {connector.src for connector in self._graph.in_connectors(node)} \
+                | {connector.dest for connector in self._graph.out_connectors(node)}
+            neighbours.discard(node)
+
+            self._level[node] = lvl
+            self._contract(node, self._shortcuts_added_at(node, local_steps))
+
+            for neighbour in neighbours:
+                deleted_of[neighbour] += 1
+                depth_of[neighbour] = max(depth_of[neighbour], depth_of[node] + 1)
+                priority_of[neighbour] = self._priority(
+                    neighbour, deleted_of[neighbour], depth_of[neighbour], local_steps, coefficients
+                )
+                heapq.heappush(pq, (priority_of[neighbour], neighbour))
+
+            lvl += 1
+            pbar.update(1)
+
+        pbar.close()
+        self._to_adjs_fwd_bkd()
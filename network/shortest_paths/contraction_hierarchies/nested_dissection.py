@@ -0,0 +1,194 @@
+"""
+Module network.shortest_paths.contraction_hierarchies.nested_dissection
+"""
+from __future__ import annotations
+import math
+import multiprocessing
+from collections import deque
+from typing import Dict
+from tqdm import tqdm
+
+from network.network import Network
+from network.shortest_paths.contraction_hierarchies.contraction_hierarchies import NetworkContractionHierarchies
+
+def _min_vertex_cut(
+    nodes: list[int], neighbours: Dict[int, set[int]], sources: list[int], sinks: list[int]
+) -> tuple[set[int], set[int]]:
+    """
+    Returns a minimum vertex separator between the sources and the sinks, and the nodes on the side of
+    the sources, by a unit-capacity max-flow on the node-split graph (augmenting paths found by BFS).
+    """
+    # pylint: disable=too-many-locals
+    index = {node: idx for idx, node in enumerate(nodes)}
+    n = len(nodes)
+    INFINITY = n + 1
+    terminals = set(sources) | set(sinks)
+    # Node idx is split into an in-vertex 2 * idx and an out-vertex 2 * idx + 1; the super source is 2n,
+    # the super sink 2n + 1. Arc a and its residual twin a ^ 1 are stored side by side.
+    heads, caps, arcs_of = [], [], [[] for _ in range(2 * n + 2)]
+    def add_arc(u: int, v: int, cap: int):
+        arcs_of[u].append(len(heads))
+        heads.append(v)
+        caps.append(cap)
+        arcs_of[v].append(len(heads))
+        heads.append(u)
+        caps.append(0)
+
+    for node, idx in index.items():
+        add_arc(2 * idx, 2 * idx + 1, INFINITY if node in terminals else 1)
+        for neighbour in neighbours[node]:
+            if neighbour in index:
+                add_arc(2 * idx + 1, 2 * index[neighbour], INFINITY)
+    source, sink = 2 * n, 2 * n + 1
+    for node in sources:
+        add_arc(source, 2 * index[node], INFINITY)
+    for node in sinks:
+        add_arc(2 * index[node] + 1, sink, INFINITY)
+
+    while True:
+        parent = [-1] * (2 * n + 2)
+        parent[source] = -2
+        queue = deque([source])
+        while queue and parent[sink] == -1:
+            u = queue.popleft()
+            for arc in arcs_of[u]:
+                v = heads[arc]
+                if caps[arc] > 0 and parent[v] == -1:
+                    parent[v] = arc
+                    queue.append(v)
+        if parent[sink] == -1:
+            break
+        # Every augmenting path crosses a unit arc, so it carries one unit of flow.
+        v = sink
+        while v != source:
+            arc = parent[v]
+            caps[arc] -= 1
+            caps[arc ^ 1] += 1
+            v = heads[arc ^ 1]
+
+    reached = [parent[2 * idx] != -1 for idx in range(n)], [parent[2 * idx + 1] != -1 for idx in range(n)]
+    separator = {node for node, idx in index.items() if reached[0][idx] and not reached[1][idx]}
+    side = {node for node, idx in index.items() if reached[1][idx]}
+    return separator, side
+
+def _bisect(
+    nodes: list[int], neighbours: Dict[int, set[int]], coords: Dict[int, tuple[float, float]],
+    ratio: float, directions: int
+) -> tuple[list[int], list[int], list[int]]:
+    """
+    Returns the two halves and the separator of the smallest inertial-flow cut: the nodes are sorted along
+    several directions, and the first and last fractions (ratio) of them are separated by a min vertex cut.
+    """
+    # pylint: disable=too-many-arguments
+    k = max(1, int(len(nodes) * ratio))
+    best = None
+    for step in range(directions):
+        angle = math.pi * step / directions
+        dx, dy = math.cos(angle), math.sin(angle)
+        ordered = sorted(nodes, key=lambda node: coords[node][0] * dx + coords[node][1] * dy)
+        separator, side = _min_vertex_cut(nodes, neighbours, ordered[:k], ordered[-k:])
+        # Smallest separator first, then the most balanced halves.
+        key = (len(separator), abs(len(nodes) - len(separator) - 2 * len(side)))
+        if best is None or key < best[0]:
+            best = (key, separator, side)
+
+    _, separator, side = best
+    return [node for node in nodes if node in side], \
+        [node for node in nodes if node not in side and node not in separator], \
+        sorted(separator, key=lambda node: len(neighbours[node]))
+
+def _by_degree(nodes: list[int], neighbours: Dict[int, set[int]]) -> list[int]:
+    members = set(nodes)
+    return sorted(nodes, key=lambda node: len(neighbours[node] & members))
+
+def nested_dissection_order(
+    nodes: list[int], neighbours: Dict[int, set[int]], coords: Dict[int, tuple[float, float]],
+    leaf_size: int = 32, ratio: float = 0.25, directions: int = 4
+) -> list[int]:
+    """
+    Returns a contraction order of the nodes by nested dissection: the nodes are bisected recursively,
+    each separator coming after both of its halves. Nodes of a leaf (at most leaf_size nodes) are ordered
+    by increasing degree.
+    Arguments:
+        - neighbours:       the undirected neighbours of every node
+        - coords:           the projected coordinates of every node
+        - ratio:            fraction of the nodes taken as sources (and as sinks) of each inertial-flow cut
+        - directions:       number of directions tried for each cut
+    """
+    # pylint: disable=too-many-arguments
+    if len(nodes) <= leaf_size:
+        return _by_degree(nodes, neighbours)
+    first, second, separator = _bisect(nodes, neighbours, coords, ratio, directions)
+    return nested_dissection_order(first, neighbours, coords, leaf_size, ratio, directions) \
+        + nested_dissection_order(second, neighbours, coords, leaf_size, ratio, directions) \
+        + separator
+
+def _nested_dissection_order_of_part(args: tuple) -> list[int]:
+    return nested_dissection_order(*args)
+
+class NetworkContractionHierarchiesNestedDissection(NetworkContractionHierarchies):
+    """
+    Implementation of the NetworkContractionHierarchies class.
+    Builds the network using a geometric nested dissection order: the network is bisected recursively by small
+    separators found by inertial-flow cuts on the node coordinates (node.coord), and separators are contracted
+    after the parts they separate, so that the top levels of the hierarchy are the top-level separators.
+    Once the first parallel_depth levels of separators are found, the parts are ordered in parallel.
+    """
+
+    @staticmethod
+    def _undirected_neighbours(net: Network) -> Dict[int, set[int]]:
+        neighbours = {node: set() for node in net.nodes}
+        for node in net.nodes:
+            for connector in net.adjs[node]:
+                if connector.src != connector.dest:
+                    neighbours[connector.src].add(connector.dest)
+                    neighbours[connector.dest].add(connector.src)
+        return neighbours
+
+    def _order(
+        self, net: Network, leaf_size: int, ratio: float, directions: int, parallel_depth: int, processes: int
+    ) -> list[int]:
+        # pylint: disable=too-many-arguments
+        neighbours = self._undirected_neighbours(net)
+        coords = {node: tuple(data.coord) for node, data in net.nodes.items()}
+
+        # Top levels: each item is either a part left to order, or a separator already in order.
+        items = [('part', list(net.nodes))]
+        for _ in range(parallel_depth):
+            split = []
+            for kind, nodes in items:
+                if kind == 'part' and len(nodes) > leaf_size:
+                    first, second, separator = _bisect(nodes, neighbours, coords, ratio, directions)
+                    split += [('part', first), ('part', second), ('separator', separator)]
+                else:
+                    split.append((kind, nodes))
+            items = split
+
+        tasks = [
+            (nodes, {node: neighbours[node] for node in nodes}, {node: coords[node] for node in nodes},
+             leaf_size, ratio, directions)
+            for kind, nodes in items if kind == 'part'
+        ]
+        if processes == 1:
+            orders = [_nested_dissection_order_of_part(task) for task in tqdm(tasks)]
+        else:
+            with multiprocessing.Pool(processes) as pool:
+                orders = list(tqdm(pool.imap(_nested_dissection_order_of_part, tasks), total=len(tasks)))
+
+        orders = iter(orders)
+        return [node for kind, nodes in items for node in (next(orders) if kind == 'part' else nodes)]
+
+    def _build_contraction_net(
+        self, net: Network, local_steps: int = None, leaf_size: int = 32, ratio: float = 0.25, directions: int = 4,
+        parallel_depth: int = 3, processes: int = None, INFINITY: float = float('inf'), **kwargs
+    ):
+        # pylint: disable=too-many-arguments
+        self._init_vars(net, INFINITY)
+        contracted_nodes = self._order(net, leaf_size, ratio, directions, parallel_depth, processes)
+
+        # Contraction
+        for lvl, node in enumerate(tqdm(contracted_nodes)):
+            self._level[node] = lvl
+            self._contract(node, self._shortcuts_added_at(node, local_steps=local_steps))
+
+        self._to_adjs_fwd_bkd()
@@ -11,7 +11,7 @@ class NetworkContractionHierarchiesPeriodicED(NetworkContractionHierarchies):
     Builds the network using the periodic edge-difference assignment heuristic.
     """
     
-    def _build_contraction_net(self, net: Network, update_every_after = 100, local_steps: int = 50, INFINITY: float = float('inf'), **kwargs):
+    def _build_contraction_net(self, net: Network, update_every_after = 100, local_steps: int = None, INFINITY: float = float('inf'), **kwargs):
         self._init_vars(net, INFINITY)
 
         def all_costs_of(nodes):
@@ -0,0 +1,244 @@
+"""
+Module network.shortest_paths.contraction_hierarchies.query
+"""
+from __future__ import annotations
+import heapq
+from array import array
+from typing import Dict
+
+from network.network import NetworkConnector
+from network.shortest_paths.workspace import NetworkQueryContexts
+
+class NetworkContractionHierarchiesQueryContext:
+    """
+    Query context of a contraction hierarchy query engine: the search buffers of both directions,
+    the entries they touched, and the counters and meeting node of the latest query.
+    """
+    dists:          tuple[list[float], list[float]]
+    pars:           tuple[list[int], list[int]]
+    touched:        tuple[list[int], list[int]]
+    settled:        int
+    stalled:        int
+    meeting:        int
+
+    def __init__(self, n: int, INFINITY: float = float('inf')):
+        self.dists = ([INFINITY] * n, [INFINITY] * n)
+        self.pars = ([-1] * n, [-1] * n)
+        self.touched = ([], [])
+        self.settled, self.stalled, self.meeting = 0, 0, -1
+
+class NetworkContractionHierarchiesQuery:
+    """
+    Query engine of a contraction hierarchy: a bidirectional search on its upward graphs.
+    - Stall-on-demand: a node settled by a direction is not expanded if a higher neighbour, already reached
+      by the same direction, leads to it with a shorter distance (it cannot lie on a shortest path).
+    - Per-direction termination: a direction stops once its smallest key reaches the best distance found.
+    - The upward graphs are flattened into arrays once, and the search buffers are reused between queries:
+      only the entries touched by a query are reset.
+    The flattened graphs are read-only; the buffers live in a per-thread context, so that one engine answers
+    concurrent queries. The settled and stalled node counts of the latest query of a thread are reported.
+    """
+    _INFINITY:      float
+    _index:         Dict[int, int]
+    _ids:           list[int]
+    _graphs:        tuple[tuple[list[int], list[int], list[float], list[NetworkConnector]], ...]
+    _contexts:      NetworkQueryContexts[NetworkContractionHierarchiesQueryContext]
+
+    @staticmethod
+    def _flatten(index: Dict[int, int], adjs: Dict[int, list[NetworkConnector]], reverse: bool):
+        offsets, heads, weights, connectors = [0], [], [], []
+        for node in index:
+            for connector in adjs[node]:
+                heads.append(index[connector.src if reverse else connector.dest])
+                weights.append(connector.weight)
+                connectors.append(connector)
+            offsets.append(len(heads))
+        return offsets, heads, weights, connectors
+
+    def _from_adjs(
+        self, adjs_fwd: Dict[int, list[NetworkConnector]], adjs_bkd: Dict[int, list[NetworkConnector]],
+        INFINITY: float = float('inf')
+    ):
+        index = {node: idx for idx, node in enumerate(adjs_fwd)}
+        # Forward search: upward edges u -> v from adjs_fwd[u]; backward search: upward edges v -> u,
+        # stored as the edges u -> v of adjs_bkd[v].
+        return self._from_graphs(list(adjs_fwd), (
+            self._flatten(index, adjs_fwd, reverse=False),
+            self._flatten(index, adjs_bkd, reverse=True),
+        ), INFINITY)
+
+    def _from_graphs(self, ids: list[int], graphs: tuple, INFINITY: float = float('inf')):
+        self._INFINITY = INFINITY
+        self._ids = ids
+        self._index = {node: idx for idx, node in enumerate(ids)}
+        self._graphs = graphs
+        self._contexts = NetworkQueryContexts(self._new_context)
+        return self
+
+    def _new_context(self) -> NetworkContractionHierarchiesQueryContext:
+        return NetworkContractionHierarchiesQueryContext(len(self._ids), self._INFINITY)
+
+    @classmethod
+    def from_hierarchy(cls, ch):
+        """
+        Initialise from a built contraction hierarchy (any NetworkContractionHierarchies).
+        """
+        # pylint: disable=protected-access
+        return cls()._from_adjs(ch._adjs_fwd, ch._adjs_bkd, ch._INFINITY)
+
+    @classmethod
+    def from_graphs(cls, ids: list[int], graphs: tuple, INFINITY: float = float('inf')):
+        """
+        Initialise from upward graphs already flattened: the node ids by index, then for each direction
+        the (offsets, heads, weights, connectors) lists, as returned by graphs.
+        """
+        return cls()._from_graphs(ids, graphs, INFINITY)
+
+    def compact(self):
+        """
+        Stores the offsets, heads and weights of the upward graphs in typed arrays instead of lists,
+        then returns the engine.
+        Reading a typed array creates a new number instead of referencing a stored one: queries then write
+        nothing into the memory of the graphs, which stays shared by processes forked after the compaction.
+        """
+        self._graphs = tuple(
+            (array('q', offsets), array('q', heads), array('d', weights), connectors)
+            for offsets, heads, weights, connectors in self._graphs
+        )
+        return self
+
+    def _reset(self, context: NetworkContractionHierarchiesQueryContext):
+        for dists, pars, touched in zip(context.dists, context.pars, context.touched):
+            for idx in touched:
+                dists[idx] = self._INFINITY
+                pars[idx] = -1
+            touched.clear()
+        context.settled, context.stalled, context.meeting = 0, 0, -1
+
+    def _search(self, context: NetworkContractionHierarchiesQueryContext, src: int, dest: int) -> float:
+        """
+        Runs the search in a context, then returns the length of the shortest path (the meeting node is kept).
+        """
+        # pylint: disable=too-many-locals, too-many-branches
+        self._reset(context)
+        INFINITY = self._INFINITY
+        s, t = self._index[src], self._index[dest]
+
+        dists, pars, touched = context.dists, context.pars, context.touched
+        settled = stalled = 0
+        dists[0][s] = 0.0
+        dists[1][t] = 0.0
+        touched[0].append(s)
+        touched[1].append(t)
+        pqs = ([(0.0, s)], [(0.0, t)])
+        best, meeting = INFINITY, -1
+
+        side = 1
+        while pqs[0] or pqs[1]:
+            side = 1 - side if pqs[1 - side] else side
+            pq = pqs[side]
+            dist_u, u = heapq.heappop(pq)
+            dists_side = dists[side]
+            if dist_u != dists_side[u]:
+                continue
+            if dist_u >= best:
+                # Every key left in this direction is at least the best distance.
+                pq.clear()
+                continue
+
+            settled += 1
+            dist_other = dists[1 - side][u]
+            if dist_u + dist_other < best:
+                best, meeting = dist_u + dist_other, u
+
+            # Stall-on-demand: the upward edges of the other direction, read backward, are the edges
+            # entering u from higher nodes in this direction.
+            offsets, heads, weights, _ = self._graphs[1 - side]
+            if any(dists_side[heads[edge]] + weights[edge] < dist_u for edge in range(offsets[u], offsets[u + 1])):
+                stalled += 1
+                continue
+
+            offsets, heads, weights, _ = self._graphs[side]
+            pars_side, touched_side = pars[side], touched[side]
+            for edge in range(offsets[u], offsets[u + 1]):
+                v = heads[edge]
+                dist_v = dist_u + weights[edge]
+                if dist_v < dists_side[v]:
+                    if dists_side[v] == INFINITY:
+                        touched_side.append(v)
+                    dists_side[v] = dist_v
+                    pars_side[v] = edge
+                    heapq.heappush(pq, (dist_v, v))
+
+        context.settled, context.stalled, context.meeting = settled, stalled, meeting
+        return best
+
+    def dist(self, src: int, dest: int) -> float:
+        """
+        Returns the length of the shortest path from source src to destination dest.
+        """
+        return self._search(self._contexts.get(), src, dest)
+
+    def path(self, src: int, dest: int) -> tuple[float, list[NetworkConnector]]:
+        """
+        Returns the shortest path from source src to destination dest, shortcuts left packed.
+        """
+        context = self._contexts.get()
+        dist = self._search(context, src, dest)
+        if context.meeting == -1:
+            return self._INFINITY, []
+
+        connectors_fwd, connectors_bkd = self._graphs[0][3], self._graphs[1][3]
+        path_fwd, path_bkd = [], []
+        node, pars_fwd = context.meeting, context.pars[0]
+        while pars_fwd[node] != -1:
+            connector = connectors_fwd[pars_fwd[node]]
+            path_fwd.append(connector)
+            node = self._index[connector.src]
+
+        node, pars_bkd = context.meeting, context.pars[1]
+        while pars_bkd[node] != -1:
+            connector = connectors_bkd[pars_bkd[node]]
+            path_bkd.append(connector)
+            node = self._index[connector.dest]
+        return dist, [*reversed(path_fwd), *path_bkd]
+
+    @property
+    def ids(self) -> list[int]:
+        """
+        Returns the mapping from a node index to its node id.
+        """
+        return self._ids
+
+    @property
+    def graphs(self) -> tuple[tuple[list[int], list[int], list[float], list[NetworkConnector]], ...]:
+        """
+        Returns the flattened upward graphs of the forward and backward searches.
+        """
+        return self._graphs
+
+    @property
+    def search_space(self) -> Dict[int, tuple[float, float]]:
+        """
+        Returns the search space of the latest query.
+        """
+        context = self._contexts.get()
+        nodes = set(context.touched[0]) | set(context.touched[1])
+        return {
+            self._ids[idx]: (context.dists[0][idx], context.dists[1][idx])
+            for idx in nodes
+        }
+
+    @property
+    def settled(self) -> int:
+        """
+        Returns the number of nodes settled by the latest query, in both directions (stalled nodes included).
+        """
+        return self._contexts.get().settled
+
+    @property
+    def stalled(self) -> int:
+        """
+        Returns the number of settled nodes the latest query did not expand.
+        """
+        return self._contexts.get().stalled
@@ -27,7 +27,7 @@ class NetworkContractionHierarchiesRandom(NetworkContractionHierarchies):
 
                     adjs_list.append(connector)
 
-    def _build_contraction_net(self, net: Network, local_steps: int = 50, INFINITY: float = float('inf'), **kwargs):
+    def _build_contraction_net(self, net: Network, local_steps: int = None, INFINITY: float = float('inf'), **kwargs):
         self._init_vars(net, INFINITY)
 
         contracted_nodes = list(net.nodes.keys())
@@ -1,123 +1,158 @@
-from queue import PriorityQueue
-from typing import Dict
+import heapq
+from typing import Dict, Iterable
+
+import numpy as np
+
 from network import Network
+from network.components import unreachable
+from network.shortest_paths.workspace import NetworkSearchWorkspace, NetworkSearchContext, NetworkQueryContexts
+from network.shortest_paths.batch import NetworkBatchQueries, NetworkBatchSpec
 
 class NetworkDijkstra:
     """
     Implementation of the Dijkstra algorithm.
+    The search runs on the CSR of the network, in a workspace whose buffers are reused between runs.
+    The state of a run is kept in a per-thread context: the results read after from_src() are those
+    of the latest run of the calling thread.
     """
-    _net:       Network
-    _src:       int
-    _dists:     Dict[int, float]
-    _pars:      Dict[int, int]
-    _INFINITY:  float
-    _pq:        PriorityQueue
+    _contexts:  NetworkQueryContexts[NetworkSearchContext]
 
-    @property
-    def _is_terminated(self):
+    def __init__(self):
+        self._contexts = NetworkQueryContexts(NetworkSearchContext)
+
+    def _is_terminated(self, context: NetworkSearchContext) -> bool:
+        # pylint: disable=unused-argument
         return False
 
-    def _update_per_iteration(self):
+    def _update_per_iteration(self, context: NetworkSearchContext):
         return
 
-    def from_src(self, net: Network, src: int, INITIAL: float = 0, INFINITY: float = float('inf')):
-        """
-        Runs Dijkstra from source src.
-        """
-        self._net = net
-        self._src = src
-        self._INFINITY = INFINITY
-
-        self._dists = {}
-        self._pars = {}
+    def _start(
+        self, context: NetworkSearchContext, net: Network, src: int, INITIAL: float, INFINITY: float
+    ) -> NetworkSearchWorkspace:
+        context.net, context.src, context.INFINITY, context.steps = net, src, INFINITY, 0
+        workspace = context.workspace(net, INFINITY)
+        workspace.reset()
+        context.s = workspace.index[src]
+        workspace.seed(context.s, INITIAL)
+        return workspace
 
-        self._dists[src] = INITIAL
-        self._pq = PriorityQueue()
-        self._pq.put((0, src))
+    def _run(self, context: NetworkSearchContext, net: Network, src: int, INITIAL: float, INFINITY: float):
+        workspace = self._start(context, net, src, INITIAL, INFINITY)
+        dists, pars, stamps, generation, touched, pq = workspace.buffers
+        view = workspace.csr.view
+        offsets, heads, weights = view.offsets, view.heads, view.weights
 
-        while not self._pq.empty():
-            if self._is_terminated:
+        while pq:
+            if self._is_terminated(context):
                 break
-            self._update_per_iteration()
+            self._update_per_iteration(context)
 
-            dist_u, u = self._pq.get()
-            if dist_u != self._dists.get(u, self._INFINITY):
+            dist_u, u = heapq.heappop(pq)
+            if dist_u != dists[u]:
                 continue
 
-            for connector in net.adjs[u]:
-                v, w = connector.dest, connector.weight
-                if self._dists.get(v, self._INFINITY) > dist_u + w:
-                    self._dists[v] = dist_u + w
-                    self._pars[v] = connector
-                    self._pq.put((self._dists[v], v))
+            for edge in range(offsets[u], offsets[u + 1]):
+                v = heads[edge]
+                dist_v = dist_u + weights[edge]
+                if stamps[v] == generation:
+                    if dists[v] <= dist_v:
+                        continue
+                elif not dist_v < INFINITY:
+                    continue
+                else:
+                    stamps[v] = generation
+                    touched.append(v)
+                dists[v] = dist_v
+                pars[v] = edge
+                heapq.heappush(pq, (dist_v, v))
 
         return self
 
+    def from_src(self, net: Network, src: int, INITIAL: float = 0, INFINITY: float = float('inf')):
+        """
+        Runs Dijkstra from source src.
+        """
+        return self._run(self._contexts.get(), net, src, INITIAL, INFINITY)
+
     def reverse_path_from(self, dest: int):
         """
         Returns the reversed shortest path to destination dest.
         """
-        if self._dists.get(dest) is None:
-            return
-
-        while dest != self._src:
-            connector = self._pars[dest]
-            yield connector
-            dest = connector.src
+        context = self._contexts.get()
+        workspace = context.workspaces[0]
+        t = workspace.index.get(dest)
+        if t is None or workspace.dist(t) >= context.INFINITY:
+            return []
+        return workspace.reverse_path_from(context.s, t)
 
     def path_to(self, dest: int):
         """
         Returns the shortest path to destination dest.
         """
-        return reversed(list(self.reverse_path_from(dest=dest)))
+        path = self.reverse_path_from(dest=dest)
+        path.reverse()
+        return path
+
+    @property
+    def net(self) -> Network:
+        """
+        Returns the network of the latest run.
+        """
+        return self._contexts.get().net
 
     @property
     def INFINITY(self):
         """
         Returns the INFINITY constant used in the algorithm.
         """
-        return self._INFINITY
+        return self._contexts.get().INFINITY
 
     @property
     def src(self):
         """
         Returns the source from which the algorithm runs.
         """
-        return self._src
+        return self._contexts.get().src
 
     @property
     def dists(self):
         """
         Returns the distance array after the algorithm execution.
         """
-        return self._dists
+        return self._contexts.get().workspaces[0].search_space()
 
     @property
     def pars(self):
         """
         Returns the parents array after the algorithm execution.
         """
-        return self._pars
+        workspace = self._contexts.get().workspaces[0]
+        ids, pars = workspace.ids, workspace.buffers[1]
+        return {ids[idx]: workspace.connector(pars[idx]) for idx in workspace.touched if pars[idx] != -1}
 
     @property
     def search_space(self) -> Dict[int, float]:
         """
         Returns the search space after the algorithm execution.
         """
+        context = self._contexts.get()
         return {
             node: d_node
-            for (node, d_node) in self._dists.items()
-            if d_node != self._INFINITY
+            for (node, d_node) in context.workspaces[0].search_space().items()
+            if d_node != context.INFINITY
         }
     
-class NetworkDijkstraSingleDestination(NetworkDijkstra):
+class NetworkDijkstraSingleDestination(NetworkDijkstra, NetworkBatchQueries):
     """
     Augmentation of the Dijkstra algorithm.
     Termination after destination reached.
     """
+    _net:               Network
     _dest:              int
 
     def __init__(self, dest: int = None):
+        super().__init__()
         self._dest = dest
 
     @classmethod
@@ -128,44 +163,57 @@ class NetworkDijkstraSingleDestination(NetworkDijkstra):
         obj = cls()
         obj._net = net
         return obj
+
+    def from_src(self, net: Network, src: int, INITIAL: float = 0, INFINITY: float = float('inf')):
+        """
+        Runs Dijkstra from source src, until the destination given at construction is reached.
+        """
+        context = self._contexts.get()
+        context.dest = self._dest
+        return self._run(context, net, src, INITIAL, INFINITY)
     
     def path(self, src: int, dest: int):
         """
         Returns the shortest path from source src to destination dest.
         """
-        self._dest = dest
-        self.from_src(net=self._net, src=src)
+        context = self._contexts.get()
+        if unreachable(self._net, src, dest):
+            self._start(context, self._net, src, 0, float('inf'))
+            return float('inf'), []
 
-        if dest not in self.dists:
-            return self.INFINITY, []
+        context.dest = dest
+        self._run(context, self._net, src, 0, float('inf'))
 
-        return self.dists[dest], self.path_to(dest)
+        workspace = context.workspaces[0]
+        dist = workspace.dist(workspace.index[dest])
+        if dist >= context.INFINITY:
+            return context.INFINITY, []
 
-    @property
-    def _is_terminated(self):
-        return self._pq.queue[0][1] == self._dest
-    
-    def _update_per_iteration(self):
-        return
+        return dist, self.path_to(dest)
+
+    def _batch_spec(self) -> NetworkBatchSpec:
+        return NetworkBatchSpec(self._net, type(self).from_net)
+
+    def _is_terminated(self, context: NetworkSearchContext) -> bool:
+        workspace = context.workspaces[0]
+        return workspace.ids[workspace.pq[0][1]] == context.dest
     
 class NetworkDijkstraLocalSteps(NetworkDijkstra):
     """
     Augmentation of the Dijkstra algorithm.
     Termination after a specified number of iterations reached.
     """
-    _counter:           int
     _steps_limit:       int
 
     def __init__(self, limit: int):
-        self._counter = 0
+        super().__init__()
         self._steps_limit = limit
 
-    @property
-    def _is_terminated(self):
-        return self._counter >= self._steps_limit
+    def _is_terminated(self, context: NetworkSearchContext) -> bool:
+        return context.steps >= self._steps_limit
     
-    def _update_per_iteration(self):
-        self._counter += 1
+    def _update_per_iteration(self, context: NetworkSearchContext):
+        context.steps += 1
     
 class NetworkDijkstraLocalDistance(NetworkDijkstra):
     """
@@ -175,12 +223,123 @@ class NetworkDijkstraLocalDistance(NetworkDijkstra):
     _distance_limit:     int
 
     def __init__(self, limit: float):
+        super().__init__()
         self._distance_limit = limit
 
-    @property
-    def _is_terminated(self):
-        return self._pq.queue[0][0] >= self._distance_limit
+    def _is_terminated(self, context: NetworkSearchContext) -> bool:
+        return context.workspaces[0].pq[0][0] >= self._distance_limit
     
+class NetworkDijkstraOneToMany:
+    """
+    Augmentation of the Dijkstra algorithm.
+    Distances from one source to a set of targets: the search stops once every target is settled, or once it
+    passes an optional distance cap. Targets proven unreachable by the components of the network are skipped.
+    The search runs on the CSR of the network, in a workspace whose buffers are reused between searches;
+    the state of a search is kept in a per-thread context.
+    """
+    _net:           Network
+    _INFINITY:      float
+    _contexts:      NetworkQueryContexts[NetworkSearchContext]
+
+    @classmethod
+    def from_net(cls, net: Network, INFINITY: float = float('inf')):
+        """
+        Initialise from the network.
+        """
+        obj = cls()
+        obj._net = net
+        obj._INFINITY = INFINITY
+        obj._contexts = NetworkQueryContexts(NetworkSearchContext)
+        return obj
+
+    def to_many(
+        self, src: int, targets: Iterable[int], max_dist: float = None, out: np.ndarray = None
+    ) -> np.ndarray:
+        """
+        Returns the lengths of the shortest paths from source src to the targets, aligned with the targets
+        (INFINITY for unreachable targets and targets farther than max_dist).
+        Arguments:
+            - max_dist:     distance cap of the search (default: no cap)
+            - out:          array to write the lengths into (default: a new array)
+        """
+        # pylint: disable=too-many-locals
+        INFINITY = self._INFINITY
+        context = self._contexts.get()
+        workspace = context.workspace(self._net, INFINITY)
+        workspace.reset()
+        if len(context.is_target) != len(workspace.csr):
+            context.is_target = bytearray(len(workspace.csr))
+        is_target, index = context.is_target, workspace.index
+
+        targets = targets if isinstance(targets, list) else list(targets)
+        # Unknown ids raise here, before any target is marked: marks left in the context would corrupt the
+        # next searches of the thread.
+        s = index[src]
+        ts = [index[target] for target in targets]
+        cap = INFINITY if max_dist is None else max_dist
+        remaining = 0
+        for target, t in zip(targets, ts):
+            if not is_target[t] and not unreachable(self._net, src, target):
+                is_target[t] = 1
+                remaining += 1
+
+        context.s = s
+        workspace.seed(context.s, 0.0)
+        dists, pars, stamps, generation, touched, pq = workspace.buffers
+        view = workspace.csr.view
+        offsets, heads, weights = view.offsets, view.heads, view.weights
+        while pq and remaining:
+            dist_u, u = heapq.heappop(pq)
+            if dist_u != dists[u]:
+                continue
+            if is_target[u]:
+                is_target[u] = 0
+                remaining -= 1
+
+            for edge in range(offsets[u], offsets[u + 1]):
+                v = heads[edge]
+                dist_v = dist_u + weights[edge]
+                if stamps[v] == generation:
+                    if dists[v] <= dist_v:
+                        continue
+                elif not dist_v <= cap or not dist_v < INFINITY:
+                    continue
+                else:
+                    stamps[v] = generation
+                    touched.append(v)
+                dists[v] = dist_v
+                pars[v] = edge
+                heapq.heappush(pq, (dist_v, v))
+
+        if out is None:
+            out = np.empty(len(targets), dtype=np.float64)
+        for i, t in enumerate(ts):
+            # Targets left unsettled keep a tentative distance, which is reported as unreached.
+            out[i] = INFINITY if is_target[t] or stamps[t] != generation else dists[t]
+        for t in ts:
+            is_target[t] = 0
+        return out
+
+    def path_to(self, dest: int) -> list:
+        """
+        Returns the shortest path to destination dest found by the latest search of the calling thread.
+        """
+        context = self._contexts.get()
+        workspace = context.workspaces[0]
+        t = workspace.index[dest]
+        if workspace.dist(t) >= self._INFINITY:
+            return []
+        path = workspace.reverse_path_from(context.s, t)
+        path.reverse()
+        return path
+
+    @property
+    def INFINITY(self):
+        """
+        Returns the INFINITY constant used in the algorithm.
+        """
+        return self._INFINITY
+
 class NetworkDijkstraDescendantsCount:
     """
     Implementation of the Shortest-path Tree.
@@ -193,14 +352,16 @@ class NetworkDijkstraDescendantsCount:
         Build the Shortest-path Tree from a precomputed Dijkstra engine.
         """
         self._cnt_c = {}
+        # The properties of the engine rebuild their mappings on every read: read them once.
+        dists, pars, src, INFINITY = engine.dists, engine.pars, engine.src, engine.INFINITY
 
-        for u, dist_u in sorted(engine.dists.items(), key=lambda elem: elem[1], reverse=True):
-            if dist_u >= engine.INFINITY:
+        for u, dist_u in sorted(dists.items(), key=lambda elem: elem[1], reverse=True):
+            if dist_u >= INFINITY:
                 continue
 
             self._cnt_c[u] = self._cnt_c.get(u, 0) + 1
-            if u != engine.src:
-                v = engine.pars[u].src
+            if u != src:
+                v = pars[u].src
                 self._cnt_c[v] = self._cnt_c.get(v, 0) + self._cnt_c[u]
 
         return self
@@ -0,0 +1,361 @@
+"""
+Module network.shortest_paths.route_aware
+"""
+import heapq
+import math
+import threading
+from dataclasses import dataclass
+from typing import Dict, Callable
+
+from network.components import unreachable
+from network.csr import NetworkCSR
+from network.network import Network, NetworkConnector
+from network.shortest_paths.workspace import NetworkQueryContexts
+from network.shortest_paths.batch import NetworkBatchQueries, NetworkBatchSpec
+
+_INDEX_LOCK = threading.Lock()
+
+@dataclass
+class NetworkRouteStateConnector(NetworkConnector):
+    """
+    Defines an edge of the materialised route-expanded network.
+    Arguments:
+        - connector:        The original connector, or None for an alighting edge
+        - cost:             Weight of the edge, including transfer penalties and boarding costs
+    """
+    connector:  NetworkConnector
+    cost:       float
+
+    @property
+    def weight(self) -> float:
+        """
+        Returns the weight of the expanded edge.
+        """
+        return self.cost
+
+    def __hash__(self):
+        return id(self)
+
+class RouteStateLabels:
+    """
+    Compact label store of a route-aware search.
+    A search state (stop index, route index) is encoded as the single integer
+        stop_index * stride + route_index,
+    so only reached states are stored, in two flat dictionaries.
+    """
+    _stride:    int
+    _dists:     Dict[int, float]
+    _pars:      Dict[int, tuple[int, int]]
+
+    def __init__(self, stride: int):
+        self._stride = stride
+        self._dists = {}
+        self._pars = {}
+
+    def clear(self):
+        """
+        Forgets every label.
+        """
+        self._dists.clear()
+        self._pars.clear()
+
+    def encode(self, node_idx: int, route_idx: int) -> int:
+        """
+        Returns the integer key of a state.
+        """
+        return node_idx * self._stride + route_idx
+
+    def decode(self, state: int) -> tuple[int, int]:
+        """
+        Returns the (stop index, route index) tuple of a state key.
+        """
+        return divmod(state, self._stride)
+
+    @property
+    def stride(self) -> int:
+        """
+        Returns the number of route slots per stop.
+        """
+        return self._stride
+
+    @property
+    def dists(self) -> Dict[int, float]:
+        """
+        Returns the mapping from a state to its tentative distance.
+        """
+        return self._dists
+
+    @property
+    def pars(self) -> Dict[int, tuple[int, int]]:
+        """
+        Returns the mapping from a state to its (edge id, parent state) tuple.
+        """
+        return self._pars
+
+    def __len__(self):
+        return len(self._dists)
+
+class RouteStateContext:
+    """
+    Query context of a route-aware search: its labels and the number of states it settled.
+    """
+    labels:         RouteStateLabels | None
+    no_settled:     int
+
+    def __init__(self):
+        self.labels = None
+        self.no_settled = 0
+
+    def labels_of(self, stride: int) -> RouteStateLabels:
+        """
+        Returns the cleared labels of a search, (re)allocated for the stride of the route index.
+        """
+        if self.labels is None or self.labels.stride != stride:
+            self.labels = RouteStateLabels(stride)
+        self.labels.clear()
+        return self.labels
+
+class NetworkRouteAwareDijkstra(NetworkBatchQueries):
+    """
+    Implementation of the Dijkstra algorithm on the route-expanded network.
+    A search state is a pair (stop, current route variant); the expanded network is never
+    materialised: the adjacency of a state is computed on the fly from the CSR of the network.
+    Boarding a vehicle costs boarding_cost, and changing to a connector of another route_ids
+    additionally costs transfer_penalty.
+    Route indices are derived from the CSR of the network, and re-derived when the network is edited.
+    The labels of a query are kept in a per-thread context, so that one engine answers concurrent queries.
+    """
+    _net:               Network
+    _csr:               NetworkCSR
+    _route_of_edge:     list[int]
+    _route_ids:         list[tuple[int, int]]
+    _NO_ROUTE:          int
+    _transfer_penalty:  float
+    _boarding_cost:     float
+    _INFINITY:          float
+    _contexts:          NetworkQueryContexts[RouteStateContext]
+
+    def _from_net(
+        self, net: Network, transfer_penalty: float = 0.0, boarding_cost: float = 0.0, INFINITY: float = float('inf')
+    ):
+        self._net = net
+        self._transfer_penalty = transfer_penalty
+        self._boarding_cost = boarding_cost
+        self._INFINITY = INFINITY
+        self._route_ids = []
+        self._index_routes(net.csr())
+        self._contexts = NetworkQueryContexts(RouteStateContext)
+        return self
+
+    def _index_routes(self, csr: NetworkCSR):
+        """
+        Derives the route index of every edge of the CSR. Known routes keep their index.
+        """
+        route_index = {route_ids: idx for idx, route_ids in enumerate(self._route_ids)}
+        self._route_of_edge = [
+            route_index.setdefault(getattr(connector, 'route_ids', None), len(route_index))
+            for connector in csr.connectors
+        ]
+        self._route_ids = list(route_index)
+        self._csr = csr
+
+        # The extra route slot represents a passenger who has not boarded yet.
+        self._NO_ROUTE = len(self._route_ids)
+
+    def _refresh(self) -> NetworkCSR:
+        """
+        Re-derives the route indices if the network was edited since the last query.
+        """
+        csr = self._net.csr()
+        if csr is not self._csr:
+            with _INDEX_LOCK:
+                if csr is not self._csr:
+                    self._index_routes(csr)
+        return csr
+
+    @classmethod
+    def from_net(cls, net: Network, **kwargs):
+        """
+        Initialise from the network.
+        """
+        return cls()._from_net(net, **kwargs)
+
+    def _potential(self, dest_idx: int) -> Callable[[int], float] | None:
+        # pylint: disable=unused-argument
+        return None
+
+    def _cost(self, route: int, next_route: int) -> float:
+        if route == self._NO_ROUTE:
+            return self._boarding_cost
+        if route != next_route:
+            return self._boarding_cost + self._transfer_penalty
+        return 0.0
+
+    def path(self, src: int, dest: int):
+        """
+        Returns the cheapest path from source src to destination dest,
+        transfer penalties and boarding costs included.
+        """
+        # pylint: disable=too-many-locals
+        csr = self._refresh()
+        view = csr.view
+        offsets, heads, weights = view.offsets, view.heads, view.weights
+        route_of_edge = self._route_of_edge
+        context = self._contexts.get()
+        labels = context.labels_of(self._NO_ROUTE + 1)
+        stride, NO_ROUTE, INFINITY = labels.stride, self._NO_ROUTE, self._INFINITY
+
+        s, t = csr.index[src], csr.index[dest]
+        h = self._potential(t)
+
+        dists, pars = labels.dists, labels.pars
+        context.no_settled = 0
+        if unreachable(self._net, src, dest):
+            return INFINITY, []
+
+        start = labels.encode(s, NO_ROUTE)
+        dists[start] = 0
+        pq = [(h(s) if h else 0, 0, start)]
+
+        while pq:
+            _, dist_u, state = heapq.heappop(pq)
+            if dist_u != dists[state]:
+                continue
+            context.no_settled += 1
+
+            u, route = divmod(state, stride)
+            if u == t:
+                return dist_u, self._path_to(labels, state, start)
+
+            for edge in range(offsets[u], offsets[u + 1]):
+                next_route = route_of_edge[edge]
+                v = heads[edge]
+                next_state = v * stride + next_route
+                dist_v = dist_u + weights[edge] + self._cost(route, next_route)
+
+                if dist_v < dists.get(next_state, INFINITY):
+                    dists[next_state] = dist_v
+                    pars[next_state] = (edge, state)
+                    heapq.heappush(pq, (dist_v + h(v) if h else dist_v, dist_v, next_state))
+
+        return INFINITY, []
+
+    def _path_to(self, labels: RouteStateLabels, state: int, start: int) -> list[NetworkConnector]:
+        connectors = self._net.csr().connectors
+        path = []
+        while state != start:
+            edge, state = labels.pars[state]
+            path.append(connectors[edge])
+        path.reverse()
+        return path
+
+    def _batch_spec(self) -> NetworkBatchSpec:
+        return NetworkBatchSpec(self._net, type(self).from_net, {
+            'transfer_penalty': self._transfer_penalty, 'boarding_cost': self._boarding_cost, 'INFINITY': self._INFINITY
+        })
+
+    def materialise(self) -> tuple[Network, Callable[[int], int], Callable[[int], int]]:
+        """
+        Builds the route-expanded network explicitly (for benchmarking purposes).
+        Returns a tuple of
+            - the expanded network, whose nodes are the encoded states,
+            - a function mapping a stop to its starting state,
+            - a function mapping a stop to its sink state, reached from every route state of the stop at no cost.
+        """
+        csr = self._refresh()
+        stride, NO_ROUTE = self._NO_ROUTE + 1, self._NO_ROUTE
+
+        routes_at = [{NO_ROUTE} for _ in range(len(csr))]
+        for edge, head in enumerate(csr.heads.tolist()):
+            routes_at[head].add(self._route_of_edge[edge])
+
+        expanded = Network()
+        for edge, (tail, head) in enumerate(zip(csr.tails.tolist(), csr.heads.tolist())):
+            next_route = self._route_of_edge[edge]
+            for route in routes_at[tail]:
+                expanded.add_edge(NetworkRouteStateConnector(
+                    src = tail * stride + route,
+                    dest = head * stride + next_route,
+                    connector = csr.connectors[edge],
+                    cost = float(csr.weights[edge]) + self._cost(route, next_route)
+                ))
+
+        sink_offset = len(csr) * stride
+        for node_idx, routes in enumerate(routes_at):
+            for route in routes:
+                expanded.add_edge(NetworkRouteStateConnector(
+                    src = node_idx * stride + route, dest = sink_offset + node_idx, connector = None, cost = 0.0
+                ))
+
+        return (
+            expanded,
+            lambda node: csr.index[node] * stride + NO_ROUTE,
+            lambda node: sink_offset + csr.index[node]
+        )
+
+    @property
+    def INFINITY(self):
+        """
+        Returns the INFINITY constant used in the algorithm.
+        """
+        return self._INFINITY
+
+    @property
+    def route_ids(self) -> list[tuple[int, int]]:
+        """
+        Returns the mapping from a route index to its route_ids.
+        """
+        return self._route_ids
+
+    @property
+    def no_settled(self) -> int:
+        """
+        Returns the number of states settled by the last query.
+        """
+        return self._contexts.get().no_settled
+
+    @property
+    def search_space(self) -> Dict[int, float]:
+        """
+        Returns the search space after the algorithm execution,
+        as the best distance of every reached stop over all of its route states.
+        """
+        ids = self._net.csr().ids
+        labels = self._contexts.get().labels
+        space = {}
+        for state, dist in labels.dists.items():
+            node = int(ids[state // labels.stride])
+            if dist < space.get(node, self._INFINITY):
+                space[node] = dist
+        return space
+
+class NetworkRouteAwareSpatialAStar(NetworkRouteAwareDijkstra):
+    """
+    Implementation of the A* algorithm on the route-expanded network.
+    The potential of a stop is its straight-line distance to the destination divided by the largest
+    straight-line speed found on any edge, which never overestimates the remaining travelling cost.
+    """
+    _coords:        list[tuple[float, float]]
+    _max_speed:     float
+
+    def _index_routes(self, csr: NetworkCSR):
+        super()._index_routes(csr)
+        net = self._net
+        self._coords = [net.nodes[int(node)].coord for node in csr.ids]
+
+        self._max_speed = 0.0
+        for tail, head, weight in zip(csr.tails.tolist(), csr.heads.tolist(), csr.weights.tolist()):
+            length = math.dist(self._coords[tail], self._coords[head])
+            if length == 0:
+                continue
+            if weight <= 0:
+                self._max_speed = self._INFINITY
+                break
+            self._max_speed = max(self._max_speed, length / weight)
+
+    def _potential(self, dest_idx: int) -> Callable[[int], float] | None:
+        if self._max_speed in (0.0, self._INFINITY):
+            return None
+
+        coords, coord_t, max_speed = self._coords, self._coords[dest_idx], self._max_speed
+        return lambda node_idx: math.dist(coords[node_idx], coord_t) / max_speed
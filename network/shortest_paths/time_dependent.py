@@ -0,0 +1,341 @@
+"""
+Module network.shortest_paths.time_dependent
+"""
+import heapq
+import threading
+from typing import Dict
+
+from network.components import unreachable
+from network.network import Network, NetworkConnector
+from network.profiles import NetworkTravelTimeProfiles
+from network.shortest_paths.workspace import NetworkQueryContexts
+from network.shortest_paths.batch import NetworkBatchQueries, NetworkBatchSpec
+
+_REFRESH_LOCK = threading.Lock()
+
+class NetworkTimeDependentContext:
+    """
+    Query context of a time-dependent search: the labels of both directions and the number of nodes settled.
+    """
+    arrivals:       Dict[int, float]
+    pars:           Dict[int, int]
+    dists_bkd:      Dict[int, float]
+    pars_bkd:       Dict[int, int]
+    no_settled:     int
+
+    def __init__(self):
+        self.arrivals, self.pars = {}, {}
+        self.dists_bkd, self.pars_bkd = {}, {}
+        self.no_settled = 0
+
+class NetworkTimeDependentDijkstra(NetworkBatchQueries):
+    """
+    Implementation of the time-dependent Dijkstra algorithm.
+    Labels are arrival times; every edge is weighted by its travel-time profile evaluated at the
+    time the search departs from its source. Exact when the profiles have the FIFO property.
+    When the network is edited, the profiles are carried over to its new CSR before the next query.
+    The labels of a query are kept in a per-thread context, so that one engine answers concurrent queries.
+    """
+    _net:           Network
+    _profiles:      NetworkTravelTimeProfiles
+    _version:       int
+    _INFINITY:      float
+    _contexts:      NetworkQueryContexts[NetworkTimeDependentContext]
+
+    def _from_net(self, net: Network, profiles: NetworkTravelTimeProfiles = None, INFINITY: float = float('inf')):
+        self._net = net
+        if profiles is None:
+            profiles = NetworkTravelTimeProfiles.from_net(net)
+        self._profiles = profiles
+        self._version = getattr(net, 'version', 0)
+        self._INFINITY = INFINITY
+        self._contexts = NetworkQueryContexts(NetworkTimeDependentContext)
+        return self
+
+    def _refresh(self):
+        """
+        Carries the profiles over the edits applied to the network since the last query.
+        """
+        version = getattr(self._net, 'version', 0)
+        if version != self._version:
+            with _REFRESH_LOCK:
+                if version != self._version:
+                    self._rebind(version)
+
+    def _rebind(self, version: int):
+        self._profiles = self._profiles.rebind(self._net.csr())
+        self._version = version
+
+    @classmethod
+    def from_net(cls, net: Network, **kwargs):
+        """
+        Initialise from the network and its travel-time profiles.
+        """
+        return cls()._from_net(net, **kwargs)
+
+    @classmethod
+    def _from_shared_graph(cls, graph, period: float, INFINITY: float):
+        """
+        Initialise in a worker process, from the profiles shared along with the CSR.
+        """
+        profiles = NetworkTravelTimeProfiles.from_arrays(graph.csr(), graph.arrays, period)
+        return cls.from_net(graph, profiles=profiles, INFINITY=INFINITY)
+
+    def _batch_spec(self) -> NetworkBatchSpec:
+        self._refresh()
+        profiles = self._profiles
+        return NetworkBatchSpec(
+            self._net, type(self)._from_shared_graph, {'period': profiles.period, 'INFINITY': self._INFINITY},
+            profiles.arrays()
+        )
+
+    def _edge_costs(self):
+        """
+        Returns the evaluation function (edge id, departure time) -> travelling time.
+        """
+        weights = self._profiles.csr.view.weights
+        shapes = memoryview(self._profiles.edge_shape)
+        factor = self._profiles.factor
+
+        def cost(edge: int, time: float) -> float:
+            shape = shapes[edge]
+            if shape < 0:
+                return weights[edge]
+            return weights[edge] * factor(shape, time)
+
+        return cost
+
+    def _relax_from(
+        self, context: NetworkTimeDependentContext, u: int, arrival_u: float, pq: list, cost,
+        potentials: Dict[int, float] = None
+    ):
+        """
+        Relaxes the out-edges of u. Heap entries are (key, arrival, node) tuples, the key being the arrival
+        plus the potential of the node if potentials are given; nodes without potential are then skipped.
+        """
+        # pylint: disable=too-many-arguments
+        view = self._profiles.csr.view
+        heads = view.heads
+        for edge in range(view.offsets[u], view.offsets[u + 1]):
+            v = heads[edge]
+            if potentials is not None and v not in potentials:
+                continue
+            arrival_v = arrival_u + cost(edge, arrival_u)
+            if arrival_v < context.arrivals.get(v, self._INFINITY):
+                context.arrivals[v] = arrival_v
+                context.pars[v] = edge
+                key_v = arrival_v if potentials is None else arrival_v + potentials[v]
+                heapq.heappush(pq, (key_v, arrival_v, v))
+
+    def _forward_path(self, context: NetworkTimeDependentContext, s: int, node: int) -> list[int]:
+        tails = self._profiles.csr.view.tails
+        edges = []
+        while node != s:
+            edge = context.pars[node]
+            edges.append(edge)
+            node = tails[edge]
+        edges.reverse()
+        return edges
+
+    def _to_connectors(self, edges: list[int]) -> list[NetworkConnector]:
+        connectors = self._profiles.csr.connectors
+        return [connectors[edge] for edge in edges]
+
+    def path(self, src: int, dest: int, departure: float = 0.0):
+        """
+        Returns the quickest path from source src to destination dest when departing at time departure,
+        as a tuple of the travelling time and the list of connectors.
+        """
+        self._refresh()
+        csr = self._profiles.csr
+        s, t = csr.index[src], csr.index[dest]
+        cost = self._edge_costs()
+
+        context = self._contexts.get()
+        context.arrivals, context.pars = {s: departure}, {}
+        context.no_settled = 0
+        if unreachable(self._net, src, dest):
+            return self._INFINITY, []
+        pq = [(departure, departure, s)]
+
+        while pq:
+            _, arrival_u, u = heapq.heappop(pq)
+            if arrival_u != context.arrivals[u]:
+                continue
+            context.no_settled += 1
+            if u == t:
+                return arrival_u - departure, self._to_connectors(self._forward_path(context, s, t))
+            self._relax_from(context, u, arrival_u, pq, cost)
+
+        return self._INFINITY, []
+
+    @property
+    def INFINITY(self):
+        """
+        Returns the INFINITY constant used in the algorithm.
+        """
+        return self._INFINITY
+
+    @property
+    def profiles(self) -> NetworkTravelTimeProfiles:
+        """
+        Returns the travel-time profiles used by the algorithm.
+        """
+        return self._profiles
+
+    @property
+    def no_settled(self) -> int:
+        """
+        Returns the number of nodes settled by the last query.
+        """
+        return self._contexts.get().no_settled
+
+    @property
+    def search_space(self) -> Dict[int, float]:
+        """
+        Returns the search space after the algorithm execution, as arrival times.
+        """
+        ids = self._profiles.csr.ids
+        return {int(ids[node]): arrival for node, arrival in self._contexts.get().arrivals.items()}
+
+class NetworkTimeDependentBidirectionalDijkstra(NetworkTimeDependentDijkstra):
+    """
+    Implementation of a time-dependent Bidirectional Dijkstra algorithm.
+    The arrival time at the destination is unknown, so the backward search runs on the lower bounds
+    of the travelling times instead:
+        1. Both searches alternate until they meet, giving an upper bound mu of the arrival time.
+        2. The backward search continues until its keys exceed mu - departure; every node of
+           a quickest path has then been settled backwards.
+        3. The forward search continues as an A* search, restricted to the nodes settled backwards
+           and guided by their lower-bound distances, until the destination is settled.
+    """
+    _lower_bounds:  list[float]
+
+    def _from_net(self, net: Network, profiles: NetworkTravelTimeProfiles = None, INFINITY: float = float('inf')):
+        super()._from_net(net, profiles, INFINITY)
+        self._lower_bounds = self._profiles.lower_bounds().tolist()
+        return self
+
+    def _rebind(self, version: int):
+        super()._rebind(version)
+        self._lower_bounds = self._profiles.lower_bounds().tolist()
+
+    def _backward_step(self, context: NetworkTimeDependentContext, pq_bkd: list) -> int | None:
+        dist_v, v = heapq.heappop(pq_bkd)
+        if dist_v != context.dists_bkd[v]:
+            return None
+
+        view = self._profiles.csr.view
+        tails, edges_rev, lower_bounds = view.tails, view.edges_rev, self._lower_bounds
+        for idx in range(view.offsets_rev[v], view.offsets_rev[v + 1]):
+            edge = edges_rev[idx]
+            u = tails[edge]
+            dist_u = dist_v + lower_bounds[edge]
+            if dist_u < context.dists_bkd.get(u, self._INFINITY):
+                context.dists_bkd[u] = dist_u
+                context.pars_bkd[u] = edge
+                heapq.heappush(pq_bkd, (dist_u, u))
+        return v
+
+    def _complete(self, context: NetworkTimeDependentContext, node: int, t: int, cost) -> tuple[float, list[int]]:
+        """
+        Evaluates the time-dependent arrival at t following the backward parents from node.
+        """
+        heads = self._profiles.csr.view.heads
+        arrival, edges = context.arrivals[node], []
+        while node != t:
+            edge = context.pars_bkd[node]
+            arrival += cost(edge, arrival)
+            edges.append(edge)
+            node = heads[edge]
+        return arrival, edges
+
+    def path(self, src: int, dest: int, departure: float = 0.0):
+        """
+        Returns the quickest path from source src to destination dest when departing at time departure,
+        as a tuple of the travelling time and the list of connectors.
+        """
+        # pylint: disable=too-many-branches
+        self._refresh()
+        csr = self._profiles.csr
+        s, t = csr.index[src], csr.index[dest]
+        cost = self._edge_costs()
+        INFINITY = self._INFINITY
+
+        context = self._contexts.get()
+        context.arrivals, context.pars = {s: departure}, {}
+        context.dists_bkd, context.pars_bkd = {t: 0.0}, {}
+        context.no_settled = 0
+        if unreachable(self._net, src, dest):
+            return INFINITY, []
+        pq_fwd, pq_bkd = [(departure, departure, s)], [(0.0, t)]
+        settled_bkd = {}
+
+        mu, mid, tail = INFINITY, -1, []
+
+        def meet(node: int):
+            nonlocal mu, mid, tail
+            arrival, edges = self._complete(context, node, t, cost)
+            if arrival < mu:
+                mu, mid, tail = arrival, node, edges
+
+        # Phase 1: alternate until the searches meet.
+        is_fwd = False
+        while mu == INFINITY and (pq_fwd or pq_bkd):
+            is_fwd = not is_fwd
+            if is_fwd and pq_fwd:
+                _, arrival_u, u = heapq.heappop(pq_fwd)
+                if arrival_u != context.arrivals[u]:
+                    continue
+                context.no_settled += 1
+                if u == t:
+                    return arrival_u - departure, self._to_connectors(self._forward_path(context, s, t))
+                if u in settled_bkd:
+                    meet(u)
+                self._relax_from(context, u, arrival_u, pq_fwd, cost)
+            elif not is_fwd and pq_bkd:
+                v = self._backward_step(context, pq_bkd)
+                if v is None:
+                    continue
+                context.no_settled += 1
+                settled_bkd[v] = context.dists_bkd[v]
+                if v in context.arrivals:
+                    meet(v)
+
+        if mu == INFINITY:
+            return INFINITY, []
+
+        # Phase 2: the backward search covers every node that may lie on a quickest path.
+        while pq_bkd and pq_bkd[0][0] <= mu - departure:
+            v = self._backward_step(context, pq_bkd)
+            if v is None:
+                continue
+            context.no_settled += 1
+            settled_bkd[v] = context.dists_bkd[v]
+            if v in context.arrivals:
+                meet(v)
+
+        # Phase 3: the forward search is restricted to those nodes, and turns into an A* search
+        # whose (consistent) potentials are their exact lower-bound distances to the destination.
+        pq_fwd = [
+            (arrival_u + settled_bkd[u], arrival_u, u)
+            for _, arrival_u, u in pq_fwd
+            if u in settled_bkd and arrival_u == context.arrivals[u]
+        ]
+        heapq.heapify(pq_fwd)
+
+        while pq_fwd and pq_fwd[0][0] < mu:
+            _, arrival_u, u = heapq.heappop(pq_fwd)
+            if arrival_u != context.arrivals[u]:
+                continue
+            context.no_settled += 1
+            if u == t:
+                break
+            self._relax_from(context, u, arrival_u, pq_fwd, cost, potentials=settled_bkd)
+
+        if context.arrivals.get(t, INFINITY) <= mu:
+            return context.arrivals[t] - departure, self._to_connectors(self._forward_path(context, s, t))
+
+        # The forward label of mid may have improved during phase 3.
+        mu, tail = self._complete(context, mid, t, cost)
+        return mu - departure, self._to_connectors(self._forward_path(context, s, mid) + tail)
@@ -0,0 +1,243 @@
+"""
+Module network.shortest_paths.workspace
+"""
+from __future__ import annotations
+import threading
+from typing import Callable, Dict, Generic, TypeVar
+
+from network.csr import NetworkCSR
+from network.network import NetworkConnector, NetworkReweightedConnector
+
+TContext = TypeVar('TContext')
+
+def reweighted_connector(csr: NetworkCSR, edge: int) -> NetworkConnector:
+    """
+    Returns the connector of an edge of a CSR, wrapped into a NetworkReweightedConnector if the CSR overrides
+    its weight.
+    """
+    connector, weight = csr.connectors[edge], csr.view.weights[edge]
+    if connector.weight != weight:
+        return NetworkReweightedConnector(
+            src = connector.src, dest = connector.dest, connector = connector, new_weight = weight
+        )
+    return connector
+
+class NetworkSearchWorkspace:
+    """
+    Reusable buffers of a search on the CSR of a network, indexed by compact node index: distances, parents
+    (edge ids, -1 for none) and a priority queue.
+    Every entry carries the generation of the search that wrote it, and only the entries of the current
+    generation are valid, so that reset() costs O(1). The indices touched by the current search are kept
+    in order, so that the search space is read without scanning the buffers.
+    """
+    # pylint: disable=too-many-instance-attributes
+    _csr:           NetworkCSR
+    _INFINITY:      float
+    _ids:           list[int]
+    _dists:         list[float]
+    _pars:          list[int]
+    _stamps:        list[int]
+    _generation:    int
+    _touched:       list[int]
+    _pq:            list[tuple]
+
+    @classmethod
+    def from_csr(cls, csr: NetworkCSR, INFINITY: float = float('inf')):
+        """
+        Allocates the buffers of a CSR.
+        """
+        obj = cls()
+        obj._csr = csr
+        obj._INFINITY = INFINITY
+        obj._ids = csr.ids.tolist()
+        obj._dists = [INFINITY] * len(csr)
+        obj._pars = [-1] * len(csr)
+        obj._stamps = [0] * len(csr)
+        obj._generation = 0
+        obj._touched, obj._pq = [], []
+        return obj
+
+    @classmethod
+    def of(cls, workspace: NetworkSearchWorkspace | None, net, INFINITY: float = float('inf')):
+        """
+        Returns the workspace if it still matches the CSR of the network, or a new workspace otherwise.
+        """
+        csr = net.csr()
+        if workspace is not None and workspace.csr is csr and workspace.INFINITY == INFINITY:
+            return workspace
+        return cls.from_csr(csr, INFINITY)
+
+    def reset(self):
+        """
+        Invalidates every entry and empties the priority queue.
+        """
+        self._generation += 1
+        self._touched.clear()
+        self._pq.clear()
+
+    def seed(self, idx: int, dist: float):
+        """
+        Sets the distance of a source and pushes it into the priority queue.
+        """
+        self._dists[idx] = dist
+        self._pars[idx] = -1
+        self._stamps[idx] = self._generation
+        self._touched.append(idx)
+        self._pq.append((dist, idx))
+
+    def dist(self, idx: int) -> float:
+        """
+        Returns the distance of a node index (INFINITY if not reached).
+        """
+        return self._dists[idx] if self._stamps[idx] == self._generation else self._INFINITY
+
+    def connector(self, edge: int) -> NetworkConnector:
+        """
+        Returns the connector of an edge, wrapped into a NetworkReweightedConnector if the CSR overrides its weight.
+        """
+        return reweighted_connector(self._csr, edge)
+
+    def reverse_path_from(self, src: int, dest: int) -> list[NetworkConnector]:
+        """
+        Returns the reversed path of parents from index dest back to index src.
+        """
+        tails, pars = self._csr.view.tails, self._pars
+        path = []
+        while dest != src:
+            edge = pars[dest]
+            path.append(self.connector(edge))
+            dest = tails[edge]
+        return path
+
+    def path_back_to(self, src: int, dest: int) -> list[NetworkConnector]:
+        """
+        Returns the path of parents of a backward search, from index src forward to index dest.
+        """
+        heads, pars = self._csr.view.heads, self._pars
+        path = []
+        while src != dest:
+            edge = pars[src]
+            path.append(self.connector(edge))
+            src = heads[edge]
+        return path
+
+    def search_space(self) -> Dict[int, float]:
+        """
+        Returns the distances of the nodes reached by the current search, by node id.
+        """
+        ids, dists = self._ids, self._dists
+        return {ids[idx]: dists[idx] for idx in self._touched}
+
+    @property
+    def csr(self) -> NetworkCSR:
+        """
+        Returns the CSR the buffers are allocated for.
+        """
+        return self._csr
+
+    @property
+    def INFINITY(self) -> float:
+        """
+        Returns the INFINITY constant of the buffers.
+        """
+        return self._INFINITY
+
+    @property
+    def index(self) -> Dict[int, int]:
+        """
+        Returns the mapping from a node id to its compact index.
+        """
+        return self._csr.index
+
+    @property
+    def ids(self) -> list[int]:
+        """
+        Returns the mapping from a compact index to its node id.
+        """
+        return self._ids
+
+    @property
+    def buffers(self) -> tuple[list[float], list[int], list[int], int, list[int], list[tuple]]:
+        """
+        Returns the distances, parents, generation stamps, current generation, touched indices and priority
+        queue, to be bound to local variables by search loops.
+        """
+        return self._dists, self._pars, self._stamps, self._generation, self._touched, self._pq
+
+    @property
+    def pq(self) -> list[tuple]:
+        """
+        Returns the priority queue of the current search.
+        """
+        return self._pq
+
+    @property
+    def touched(self) -> list[int]:
+        """
+        Returns the indices reached by the current search, in order.
+        """
+        return self._touched
+
+class NetworkQueryContexts(Generic[TContext]):
+    """
+    Per-thread query contexts of an engine.
+    An engine keeps its preprocessed data (graph, hierarchy, indices) read-only, and the state of a query
+    (buffers, endpoints, counters) in a context. Every thread gets its own context, created on first use,
+    so that concurrent queries share one copy of the preprocessed data.
+    """
+    _factory:   Callable[[], TContext]
+    _local:     threading.local
+
+    def __init__(self, factory: Callable[[], TContext]):
+        self._factory = factory
+        self._local = threading.local()
+
+    def get(self) -> TContext:
+        """
+        Returns the context of the calling thread.
+        """
+        context = getattr(self._local, 'context', None)
+        if context is None:
+            context = self._local.context = self._factory()
+        return context
+
+    def __getstate__(self):
+        # Contexts belong to the threads of the live process.
+        return {'_factory': self._factory}
+
+    def __setstate__(self, state: dict):
+        self._factory = state['_factory']
+        self._local = threading.local()
+
+class NetworkSearchContext:
+    """
+    Query context of the engines searching the CSR of a network: one workspace per search direction,
+    the endpoints of the latest query (node ids and compact indices) and its counters.
+    """
+    # pylint: disable=too-many-instance-attributes
+    workspaces:     list[NetworkSearchWorkspace | None]
+    net:            object
+    INFINITY:       float
+    src:            int
+    dest:           int | None
+    s:              int
+    t:              int
+    steps:          int
+    is_target:      bytearray
+
+    def __init__(self):
+        self.workspaces = [None, None]
+        self.net = None
+        self.INFINITY = float('inf')
+        self.src, self.dest = -1, None
+        self.s, self.t = -1, -1
+        self.steps = 0
+        self.is_target = bytearray()
+
+    def workspace(self, net, INFINITY: float = float('inf'), direction: int = 0) -> NetworkSearchWorkspace:
+        """
+        Returns the workspace of a search direction, (re)allocated for the current CSR of the network.
+        """
+        workspace = NetworkSearchWorkspace.of(self.workspaces[direction], net, INFINITY)
+        self.workspaces[direction] = workspace
+        return workspace
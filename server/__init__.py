@@ -0,0 +1,18 @@
+"""
+Module server
+Contains:
+- BusNetworkServer class, an asyncio HTTP/JSON server answering routing and stop queries.
+- ServerSnapshot class, the network and contraction hierarchy a server loads once.
+- ServerStopIndex class, nearest stop and stop search.
+- ServerMicroBatcher class, grouping the queries of concurrent requests into batches.
+- ServerPrefork class, worker processes forked from a master sharing one copy of the snapshot.
+- process_memory function, the RSS, PSS and unique (USS) memory of a process.
+Run with:
+    python -m server [--snapshot snapshot.pkl] [--host 127.0.0.1] [--port 8080] [--processes 1] [--workers 0]
+"""
+from server.snapshot import ServerSnapshot
+from server.stops import ServerStopIndex
+from server.batcher import ServerMicroBatcher
+from server.server import BusNetworkServer, ServerError
+from server.memory import process_memory
+from server.prefork import ServerPrefork
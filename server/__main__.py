@@ -0,0 +1,55 @@
+"""
+Runs the bus network server:
+    python -m server [--snapshot snapshot.pkl] [--host 127.0.0.1] [--port 8080] [--processes 1] [--workers 0]
+                     [--cache-size 100000] [--cache-ttl SECONDS] [--cache-store FILE]
+The snapshot is built from stops.json, vars.json and paths.json, then saved, if the file does not exist.
+With --workers N, the snapshot is loaded once and N worker processes forked to serve it (see ServerPrefork);
+kill -USR1 <master pid> prints the memory of the processes.
+Path and distance results are cached (--cache-size 0 disables the cache); with --cache-store, distances are
+also kept in an SQLite file shared by the workers.
+"""
+import argparse
+import asyncio
+import os
+
+from network.shortest_paths.cache import NetworkResultCache, NetworkResultStore
+from server import BusNetworkServer, ServerPrefork, ServerSnapshot
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--snapshot', default='snapshot.pkl')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--processes', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=0)
+    parser.add_argument('--no-freeze', action='store_true')
+    parser.add_argument('--max-batch', type=int, default=256)
+    parser.add_argument('--max-delay', type=float, default=0.002)
+    parser.add_argument('--cache-size', type=int, default=100_000)
+    parser.add_argument('--cache-ttl', type=float, default=None)
+    parser.add_argument('--cache-store', default=None)
+    args = parser.parse_args()
+
+    cache = None
+    if args.cache_size > 0:
+        store = NetworkResultStore(args.cache_store, args.cache_ttl) if args.cache_store else None
+        cache = NetworkResultCache(args.cache_size, ttl=args.cache_ttl, store=store)
+
+    if args.workers:
+        prefork = ServerPrefork.load(
+            args.snapshot, args.workers, not args.no_freeze,
+            processes=args.processes, max_batch=args.max_batch, max_delay=args.max_delay, cache=cache
+        )
+        prefork.start(args.host, args.port)
+        print('Master {}: {} workers serving on http://{}:{}'.format(
+            os.getpid(), len(prefork.pids), args.host, args.port
+        ), flush=True)
+        prefork.wait()
+    else:
+        snapshot = ServerSnapshot.load_or_build(args.snapshot)
+        server = BusNetworkServer(snapshot, args.processes, args.max_batch, args.max_delay, cache=cache)
+        print('Snapshot loaded in {:.2f}s; serving on http://{}:{}'.format(snapshot.load_time, args.host, args.port))
+        try:
+            asyncio.run(server.serve(args.host, args.port))
+        except KeyboardInterrupt:
+            pass
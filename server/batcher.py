@@ -0,0 +1,115 @@
+"""
+Module server.batcher
+"""
+from __future__ import annotations
+import asyncio
+from typing import Any, Callable, Iterable
+
+class ServerMicroBatcher:
+    """
+    Groups the queries of concurrent requests into batches for a batch engine.
+    A batch is dispatched once it holds max_batch queries, or once its first query has waited max_delay seconds.
+    One batch runs at a time, in a worker thread so that the event loop keeps accepting requests, while the next
+    batch fills up: the busier the server, the larger the batches.
+    """
+    _run:           Callable[[list], Iterable]
+    _max_batch:     int
+    _max_delay:     float
+    _queue:         asyncio.Queue | None
+    _task:          asyncio.Task | None
+    _no_batches:    int
+    _no_queries:    int
+
+    def __init__(self, run: Callable[[list], Iterable], max_batch: int = 256, max_delay: float = 0.002):
+        """
+        Arguments:
+            - run:          the batch function, mapping a list of queries to their results in order
+                            (called in a worker thread)
+            - max_batch:    maximum number of queries of a batch
+            - max_delay:    maximum time a query waits for its batch to fill up, in seconds
+        """
+        self._run = run
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._queue, self._task = None, None
+        self._no_batches, self._no_queries = 0, 0
+
+    def start(self):
+        """
+        Starts dispatching batches, in the running event loop.
+        """
+        self._queue = asyncio.Queue()
+        self._task = asyncio.get_running_loop().create_task(self._dispatch())
+
+    async def close(self):
+        """
+        Stops dispatching batches; pending queries are cancelled.
+        """
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while self._queue is not None and not self._queue.empty():
+            self._queue.get_nowait()[1].cancel()
+
+    async def submit(self, query: Any) -> Any:
+        """
+        Returns the result of a query, once its batch has run.
+        """
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((query, future))
+        return await future
+
+    async def _collect(self) -> list[tuple[Any, asyncio.Future]]:
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self._max_delay
+        while len(batch) < self._max_batch:
+            if not self._queue.empty():
+                batch.append(self._queue.get_nowait())
+                continue
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._collect()
+            # Requests whose client went away are not computed.
+            batch = [(query, future) for query, future in batch if not future.done()]
+            if not batch:
+                continue
+            queries = [query for query, _ in batch]
+            try:
+                results = await loop.run_in_executor(None, lambda queries=queries: list(self._run(queries)))
+            except Exception as error:  # pylint: disable=broad-exception-caught
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            self._no_batches += 1
+            self._no_queries += len(batch)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+    @property
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the number of batches run, the number of queries answered and the average batch size.
+        """
+        return {
+            'batches':      self._no_batches,
+            'queries':      self._no_queries,
+            'mean_batch':   self._no_queries / self._no_batches if self._no_batches else 0.0,
+        }
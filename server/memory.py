@@ -0,0 +1,30 @@
+"""
+Module server.memory
+"""
+from __future__ import annotations
+import os
+
+def process_memory(pid: int = None) -> dict[str, int] | None:
+    """
+    Returns the memory of a process (default: this one), in bytes, read from /proc/<pid>/smaps_rollup:
+        - rss:      resident memory
+        - pss:      resident memory, pages shared by n processes counted for 1/n
+        - uss:      unique memory, the pages of no other process (what killing the process would free)
+        - shared:   resident memory shared with other processes
+    Returns None where /proc is not available (non-Linux systems).
+    """
+    fields = {}
+    try:
+        with open('/proc/{}/smaps_rollup'.format(pid or os.getpid()), encoding='ascii') as f:
+            for line in f:
+                key, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    fields[key] = 1024 * int(value.split()[0])
+    except OSError:
+        return None
+    return {
+        'rss':      fields.get('Rss', 0),
+        'pss':      fields.get('Pss', 0),
+        'uss':      fields.get('Private_Clean', 0) + fields.get('Private_Dirty', 0),
+        'shared':   fields.get('Shared_Clean', 0) + fields.get('Shared_Dirty', 0),
+    }
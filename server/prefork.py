@@ -0,0 +1,175 @@
+"""
+Module server.prefork
+"""
+from __future__ import annotations
+import asyncio
+import gc
+import os
+import signal
+import socket
+import sys
+import traceback
+from typing import Dict
+
+from server.memory import process_memory
+from server.server import BusNetworkServer
+from server.snapshot import ServerSnapshot
+
+class ServerPrefork:
+    """
+    Pre-fork serving: the snapshot is loaded once, in this (master) process, then worker processes are forked,
+    each running a BusNetworkServer on the listening socket of the master, which the kernel hands every new
+    connection to one of them. The workers share the memory of the snapshot copy-on-write, so that N workers
+    do not hold N copies of the models:
+        - the lazy state of the queries (CSR, query engine of the hierarchy, stop index) is built before
+          forking, instead of once per worker;
+        - the query engine of the hierarchy is compacted into typed arrays, whose reads write no reference
+          counts into the shared pages;
+        - the objects of the snapshot are frozen out of the garbage collector (gc.freeze()), whose collections
+          in the workers would otherwise write into the header of every object they scan.
+    For the objects loaded with the snapshot to be packed together, the garbage collector should be disabled
+    before loading it (see load()); it is enabled again in the workers.
+    Workers that exit unexpectedly are forked again. Requires fork() (POSIX systems).
+    """
+    _server:    BusNetworkServer
+    _workers:   int
+    _freeze:    bool
+    _sock:      socket.socket | None
+    _pids:      set[int]
+
+    def __init__(self, snapshot: ServerSnapshot, workers: int = None, freeze: bool = True, **kwargs):
+        """
+        Arguments:
+            - workers:      number of worker processes (default: one per CPU)
+            - freeze:       compact the query engine and freeze the objects of the snapshot before forking
+        Keyword arguments are passed to the BusNetworkServer of the workers.
+        """
+        snapshot.net.csr()
+        if freeze:
+            snapshot.ch.query.compact()
+        # The stop index is built here, once for every worker.
+        self._server = BusNetworkServer(snapshot, **kwargs)
+        self._workers = workers or os.cpu_count()
+        self._freeze = freeze
+        self._sock = None
+        self._pids = set()
+
+    @classmethod
+    def load(cls, file: str, workers: int = None, freeze: bool = True, **kwargs):
+        """
+        Loads (or builds) a snapshot with the garbage collector disabled, then prepares serving it.
+        """
+        if freeze:
+            gc.disable()
+        return cls(ServerSnapshot.load_or_build(file), workers, freeze, **kwargs)
+
+    def start(self, host: str = '127.0.0.1', port: int = 8080):
+        """
+        Opens the listening socket, then forks the workers; returns once they are forked.
+        """
+        self._sock = socket.create_server((host, port), backlog=1024)
+        if self._freeze:
+            gc.freeze()
+        for _ in range(self._workers):
+            self._fork()
+        # New objects of the master are collected as usual; frozen ones are never scanned.
+        gc.enable()
+
+    def _fork(self):
+        pid = os.fork()
+        if pid:
+            self._pids.add(pid)
+            return
+        # Worker: never returns into the code of the master.
+        code = 0
+        try:
+            gc.enable()
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            signal.signal(signal.SIGUSR1, signal.SIG_DFL)
+            asyncio.run(self._serve())
+        except (KeyboardInterrupt, asyncio.CancelledError):
+            pass
+        except BaseException:  # pylint: disable=broad-exception-caught
+            traceback.print_exc()
+            code = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(code)
+
+    async def _serve(self):
+        task = asyncio.current_task()
+        asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+        await self._server.serve(sock=self._sock)
+
+    def wait(self):
+        """
+        Supervises the workers until interrupted (SIGINT or SIGTERM), forking again the ones that exit,
+        then stops them. SIGUSR1 prints a memory report of the processes.
+        """
+        def interrupt(*_):
+            raise KeyboardInterrupt()
+        signal.signal(signal.SIGTERM, interrupt)
+        signal.signal(signal.SIGUSR1, lambda *_: print(self.report(), flush=True))
+        try:
+            while self._pids:
+                pid, status = os.wait()
+                if pid in self._pids:
+                    self._pids.discard(pid)
+                    print('Worker {} exited with status {}; forking again.'.format(pid, status), flush=True)
+                    self._fork()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.stop()
+
+    def stop(self):
+        """
+        Stops the workers, then closes the listening socket.
+        """
+        for pid in self._pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in self._pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self._pids.clear()
+        if self._sock is not None:
+            self._sock.close()
+            self._sock = None
+
+    def memory(self) -> Dict[int, dict[str, int] | None]:
+        """
+        Returns the memory of the master and of every worker (see process_memory), by pid, master first.
+        """
+        return {pid: process_memory(pid) for pid in [os.getpid(), *sorted(self._pids)]}
+
+    def report(self) -> str:
+        """
+        Returns a table of the memory of the master and of the workers, in MiB. The unique memory (USS) of
+        a worker is what it costs on top of the memory it shares with the master.
+        """
+        lines = ['{:>10} {:>8} {:>10} {:>10} {:>10} {:>10}'.format('process', 'pid', 'rss', 'pss', 'uss', 'shared')]
+        total = 0
+        for pid, memory in self.memory().items():
+            name = 'master' if pid == os.getpid() else 'worker'
+            if memory is None:
+                lines.append('{:>10} {:>8} {:>10}'.format(name, pid, 'n/a'))
+                continue
+            total += memory['pss']
+            lines.append('{:>10} {:>8} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}'.format(
+                name, pid, *(memory[key] / 2 ** 20 for key in ('rss', 'pss', 'uss', 'shared'))
+            ))
+        lines.append('total (sum of pss): {:.1f} MiB'.format(total / 2 ** 20))
+        return '\n'.join(lines)
+
+    @property
+    def pids(self) -> list[int]:
+        """
+        Returns the pids of the workers.
+        """
+        return sorted(self._pids)
@@ -0,0 +1,297 @@
+"""
+Module server.server
+"""
+from __future__ import annotations
+import asyncio
+import json
+import math
+import os
+import socket
+import time
+from typing import Any, Awaitable, Callable, Dict
+from urllib.parse import parse_qsl, urlsplit
+
+from elements import Stop
+from network.network import NetworkConnector
+from network.shortest_paths.batch import NetworkBatchPool
+from network.shortest_paths.cache import NetworkCachedEngine, NetworkResultCache
+from server.batcher import ServerMicroBatcher
+from server.memory import process_memory
+from server.snapshot import ServerSnapshot
+from server.stops import ServerStopIndex
+
+class ServerError(Exception):
+    """
+    An error reported to the client, with its HTTP status.
+    """
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+
+REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+def _int(params: Dict[str, Any], name: str) -> int:
+    if name not in params:
+        raise ServerError(400, 'Missing parameter {}.'.format(name))
+    try:
+        return int(params[name])
+    except (TypeError, ValueError) as error:
+        raise ServerError(400, 'Parameter {} must be an integer.'.format(name)) from error
+
+def _float(params: Dict[str, Any], name: str) -> float:
+    if name not in params:
+        raise ServerError(400, 'Missing parameter {}.'.format(name))
+    try:
+        return float(params[name])
+    except (TypeError, ValueError) as error:
+        raise ServerError(400, 'Parameter {} must be a number.'.format(name)) from error
+
+def _ids(params: Dict[str, Any], name: str) -> list[int]:
+    value = params.get(name)
+    if isinstance(value, str):
+        value = value.split(',') if value else []
+    if not isinstance(value, list):
+        raise ServerError(400, 'Parameter {} must be a list of stop ids.'.format(name))
+    try:
+        return [int(item) for item in value]
+    except (TypeError, ValueError) as error:
+        raise ServerError(400, 'Parameter {} must be a list of stop ids.'.format(name)) from error
+
+def _dist(dist: float) -> float | None:
+    # JSON has no infinity: unreachable destinations are reported as null.
+    return dist if math.isfinite(dist) else None
+
+def _stop(stop: Stop, **extra) -> dict:
+    return {'StopId': stop.stop_id, 'Code': stop.code, 'Name': stop.name, 'Street': stop.street,
+            'Lat': stop.latitude, 'Lng': stop.longtitude, **extra}
+
+def _connector(connector: NetworkConnector, geometry: bool) -> dict:
+    obj = connector.to_dict() if hasattr(connector, 'to_dict') else {'Src': connector.src, 'Dest': connector.dest}
+    if not geometry:
+        obj.pop('Path', None)
+    return obj
+
+class BusNetworkServer:
+    """
+    Asyncio HTTP/JSON server answering routing and stop queries on a snapshot of a bus network
+    (its network and contraction hierarchy, loaded once).
+    Endpoints (GET with query parameters, or POST with a JSON object):
+        - /path?src=&dest=[&geometry=1]     shortest path, as its length and connectors
+        - /distance?src=&dest=              shortest path length
+        - /matrix {sources, targets}        shortest path lengths from every source to every target
+        - /nearest?lat=&lng=[&k=1]          nearest stops of a WGS84 position, with their distances in metres
+        - /stops/search?q=[&limit=10]       stops matching a text query
+        - /health                           state of the server (process, memory) and micro-batching counters
+    Path and distance queries of concurrent requests are micro-batched into the batch queries of the hierarchy,
+    answered by a pool of worker processes kept open for the lifetime of the server (or in this process).
+    With a result cache, repeated path and distance queries are answered from it without being batched.
+    Unreachable destinations have a null length.
+    """
+    # pylint: disable=too-many-instance-attributes
+    _snapshot:      ServerSnapshot
+    _stops:         ServerStopIndex
+    _pool:          NetworkBatchPool | None
+    _processes:     int
+    _max_batch:     int
+    _max_delay:     float
+    _max_matrix:    int
+    _paths:         ServerMicroBatcher
+    _dists:         ServerMicroBatcher
+    _cache:         NetworkCachedEngine | None
+    _routes:        Dict[str, Callable[[Dict[str, Any]], Awaitable[Any]]]
+    _started:       float
+    _no_requests:   int
+
+    def __init__(
+        self, snapshot: ServerSnapshot, processes: int = 1, max_batch: int = 256, max_delay: float = 0.002,
+        max_matrix: int = 10 ** 6, cache: NetworkResultCache = None
+    ):
+        """
+        Arguments:
+            - processes:    number of worker processes answering the batches (1 answers in this process)
+            - max_batch:    maximum number of queries of a batch
+            - max_delay:    maximum time a query waits for its batch to fill up, in seconds
+            - max_matrix:   maximum number of entries of a distance matrix
+            - cache:        cache of the path and distance results (None: no caching)
+        """
+        # pylint: disable=too-many-arguments
+        self._snapshot = snapshot
+        self._stops = ServerStopIndex.from_net(snapshot.net)
+        self._pool = None
+        self._processes = processes
+        self._max_batch = max_batch
+        self._max_delay = max_delay
+        self._max_matrix = max_matrix
+        self._cache = NetworkCachedEngine(snapshot.ch, cache) if cache is not None else None
+        self._routes = {
+            '/path':            self._path,
+            '/distance':        self._distance,
+            '/matrix':          self._matrix,
+            '/nearest':         self._nearest,
+            '/stops/search':    self._search,
+            '/health':          self._health,
+        }
+        self._started = time.time()
+        self._no_requests = 0
+
+    # --------------- Endpoints -------------------
+
+    def _pair(self, params: Dict[str, Any]) -> tuple[int, int]:
+        src, dest = _int(params, 'src'), _int(params, 'dest')
+        for stop_id in (src, dest):
+            if stop_id not in self._stops:
+                raise ServerError(404, 'Unknown stop {}.'.format(stop_id))
+        return src, dest
+
+    async def _query(self, src: int, dest: int, with_path: bool) -> Any:
+        cache = self._cache
+        result = cache.get(src, dest, with_path=with_path) if cache is not None else None
+        if result is None:
+            result = await (self._paths if with_path else self._dists).submit((src, dest))
+            if cache is not None:
+                cache.put(src, dest, result, with_path=with_path)
+        return result
+
+    async def _path(self, params: Dict[str, Any]) -> dict:
+        src, dest = self._pair(params)
+        dist, path = await self._query(src, dest, with_path=True)
+        geometry = str(params.get('geometry', '0')).lower() in ('1', 'true')
+        return {
+            'src': src, 'dest': dest, 'dist': _dist(dist),
+            'stops': [src, *(connector.dest for connector in path)] if path or src == dest else [],
+            'connectors': [_connector(connector, geometry) for connector in path],
+        }
+
+    async def _distance(self, params: Dict[str, Any]) -> dict:
+        src, dest = self._pair(params)
+        return {'src': src, 'dest': dest, 'dist': _dist(await self._query(src, dest, with_path=False))}
+
+    async def _matrix(self, params: Dict[str, Any]) -> dict:
+        sources, targets = _ids(params, 'sources'), _ids(params, 'targets')
+        if len(sources) * len(targets) > self._max_matrix:
+            raise ServerError(400, 'A matrix has at most {} entries.'.format(self._max_matrix))
+        unknown = [stop_id for stop_id in sources + targets if stop_id not in self._stops]
+        if unknown:
+            raise ServerError(404, 'Unknown stops {}.'.format(unknown[:10]))
+        matrix = await asyncio.get_running_loop().run_in_executor(
+            None, lambda: self._snapshot.ch.matrix(sources, targets, processes=1, progress=False)
+        )
+        return {
+            'sources': sources, 'targets': targets,
+            'dists': [[_dist(dist) for dist in row] for row in matrix.tolist()],
+        }
+
+    async def _nearest(self, params: Dict[str, Any]) -> dict:
+        lat, lng = _float(params, 'lat'), _float(params, 'lng')
+        k = _int(params, 'k') if 'k' in params else 1
+        if not 1 <= k <= 100:
+            raise ServerError(400, 'Parameter k must lie within [1, 100].')
+        return {'stops': [_stop(stop, Distance=dist) for stop, dist in self._stops.nearest(lat, lng, k)]}
+
+    async def _search(self, params: Dict[str, Any]) -> dict:
+        query = str(params.get('q', ''))
+        limit = _int(params, 'limit') if 'limit' in params else 10
+        return {'stops': [_stop(stop) for stop in self._stops.search(query, limit)]}
+
+    async def _health(self, params: Dict[str, Any]) -> dict:
+        # pylint: disable=unused-argument
+        return {
+            'stops': len(self._stops),
+            'uptime': time.time() - self._started,
+            'requests': self._no_requests,
+            'processes': self._pool.processes if self._pool is not None else self._processes,
+            'snapshot_load_time': self._snapshot.load_time,
+            'pid': os.getpid(),
+            'memory': process_memory(),
+            'paths': self._paths.stats,
+            'distances': self._dists.stats,
+            'cache': self._cache.stats if self._cache is not None else None,
+        }
+
+    # --------------- HTTP -------------------
+
+    async def _respond(self, method: str, target: str, body: bytes) -> tuple[int, Any]:
+        url = urlsplit(target)
+        route = self._routes.get(url.path.rstrip('/') or '/')
+        if route is None:
+            return 404, {'error': 'Unknown endpoint {}.'.format(url.path)}
+        if method not in ('GET', 'POST'):
+            return 405, {'error': 'Use GET or POST.'}
+
+        params: Dict[str, Any] = dict(parse_qsl(url.query))
+        try:
+            if body:
+                obj = json.loads(body)
+                if not isinstance(obj, dict):
+                    raise ServerError(400, 'The body must be a JSON object.')
+                params.update(obj)
+            return 200, await route(params)
+        except ServerError as error:
+            return error.status, {'error': str(error)}
+        except json.JSONDecodeError:
+            return 400, {'error': 'The body is not valid JSON.'}
+        except Exception as error:  # pylint: disable=broad-exception-caught
+            return 500, {'error': '{}: {}'.format(type(error).__name__, error)}
+
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                method, target, version = request_line.decode('latin-1').split()
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b'\r\n', b'\n', b''):
+                        break
+                    key, _, value = line.decode('latin-1').partition(':')
+                    headers[key.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+                self._no_requests += 1
+                status, obj = await self._respond(method, target, body)
+                keep_alive = headers.get('connection', '').lower() != 'close' and version == 'HTTP/1.1'
+                payload = json.dumps(obj, ensure_ascii=False).encode('utf-8')
+                writer.write((
+                    'HTTP/1.1 {} {}\r\nContent-Type: application/json; charset=utf-8\r\n'
+                    'Content-Length: {}\r\nConnection: {}\r\n\r\n'
+                ).format(status, REASONS.get(status, ''), len(payload), 'keep-alive' if keep_alive else 'close')
+                 .encode('latin-1') + payload)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def serve(
+        self, host: str = '127.0.0.1', port: int = 8080, ready: Callable[[], None] = None,
+        sock: socket.socket = None
+    ):
+        """
+        Serves requests until cancelled, on host:port or on a listening socket (e.g. one shared by several
+        worker processes).
+        """
+        loop = asyncio.get_running_loop()
+        self._pool = await loop.run_in_executor(
+            None, lambda: self._snapshot.ch.batch_pool(self._processes)
+        )
+        self._paths = ServerMicroBatcher(self._pool.paths, self._max_batch, self._max_delay)
+        self._dists = ServerMicroBatcher(self._pool.dists, self._max_batch, self._max_delay)
+        self._paths.start()
+        self._dists.start()
+        try:
+            if sock is not None:
+                server = await asyncio.start_server(self._handle, sock=sock)
+            else:
+                server = await asyncio.start_server(self._handle, host, port)
+            async with server:
+                if ready is not None:
+                    ready()
+                await server.serve_forever()
+        finally:
+            await self._paths.close()
+            await self._dists.close()
+            self._pool.close()
@@ -0,0 +1,71 @@
+"""
+Module server.snapshot
+"""
+from __future__ import annotations
+import os
+import pickle
+import time
+
+from network.bus import BusNetwork
+from network.shortest_paths.contraction_hierarchies import NetworkContractionHierarchiesLazyED
+from network.shortest_paths.contraction_hierarchies.contraction_hierarchies import NetworkContractionHierarchies
+
+class ServerSnapshot:
+    """
+    The models a server loads once at startup: a bus network and its prebuilt contraction hierarchy,
+    pickled together into a single file so that a restart does not rebuild them.
+    """
+    net:            BusNetwork
+    ch:             NetworkContractionHierarchies
+    load_time:      float
+
+    def __init__(self, net: BusNetwork, ch: NetworkContractionHierarchies, load_time: float = 0.0):
+        self.net = net
+        self.ch = ch
+        self.load_time = load_time
+
+    @classmethod
+    def build(
+        cls, stops_json_file: str = 'stops.json', vars_json_file: str = 'vars.json',
+        paths_json_file: str = 'paths.json', **kwargs
+    ):
+        """
+        Builds the network from its JSON files, then its hierarchy (keyword arguments are passed to the build
+        of the hierarchy).
+        """
+        start = time.perf_counter()
+        net = BusNetwork.from_ndjsons(stops_json_file, vars_json_file, paths_json_file)
+        ch = NetworkContractionHierarchiesLazyED.from_net(net, **kwargs)
+        # The query engine is part of the snapshot, so that the first request does not flatten the hierarchy.
+        ch.query  # pylint: disable=pointless-statement
+        return cls(net, ch, time.perf_counter() - start)
+
+    def save(self, file: str):
+        """
+        Writes the snapshot into a file.
+        """
+        with open(file, 'wb') as f:
+            pickle.dump((self.net, self.ch), f, protocol=pickle.HIGHEST_PROTOCOL)
+
+    @classmethod
+    def load(cls, file: str):
+        """
+        Reads a snapshot written by save().
+        """
+        start = time.perf_counter()
+        with open(file, 'rb') as f:
+            net, ch = pickle.load(f)
+        # Listeners are not pickled: the hierarchy subscribes again to the edits of its network.
+        net.subscribe(ch._on_change)  # pylint: disable=protected-access
+        return cls(net, ch, time.perf_counter() - start)
+
+    @classmethod
+    def load_or_build(cls, file: str, **kwargs):
+        """
+        Reads a snapshot if the file exists; otherwise builds it (see build()) and writes it into the file.
+        """
+        if os.path.exists(file):
+            return cls.load(file)
+        snapshot = cls.build(**kwargs)
+        snapshot.save(file)
+        return snapshot
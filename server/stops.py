@@ -0,0 +1,120 @@
+"""
+Module server.stops
+"""
+from __future__ import annotations
+import math
+import unicodedata
+from array import array
+from bisect import bisect_right
+from itertools import accumulate
+from typing import Dict
+
+from rtree import Index
+
+from elements import Stop
+from helper import wgs84_to_vn2000
+
+def normalise(text: str) -> str:
+    """
+    Returns a text in lower case, without Vietnamese diacritics, so that 'Bến Thành' matches 'ben thanh'.
+    """
+    text = unicodedata.normalize('NFD', text.lower().replace('đ', 'd'))
+    return ''.join(char for char in text if not unicodedata.combining(char))
+
+class ServerStopIndex:
+    """
+    Spatial and text index of the stops of a network.
+    - Nearest stops: an R-tree over the Cartesian (VN2000) coordinates of the stops; positions are given
+      in WGS84 (lat, lng) and distances returned in metres.
+    - Stop search: the words of a query are matched against the name, street, code and search tokens of every
+      stop, diacritics ignored. Stops whose name matches the whole query come first, then stops matching every
+      word, by the number of words starting a word of the name, then found in the name.
+    The texts of the stops are joined into two strings (names, other texts) searched with str.find, and the
+    ids kept in a typed array: a query reads no stored Python object but the stops it returns, so that the
+    index stays shared by the processes forked after building it.
+    """
+    _stops:     Dict[int, Stop]
+    _ids:       array
+    _tree:      Index
+    _names:     str
+    _others:    str
+    _starts:    tuple[array, array]
+
+    def __init__(self, stops: Dict[int, Stop]):
+        self._stops = stops
+        self._ids = array('q', stops)
+        # Bulk loading is much faster than inserting the stops one by one.
+        self._tree = Index((
+            (idx, (x, y, x, y), None)
+            for idx, (x, y) in enumerate(map(float, stops[stop_id].coord) for stop_id in self._ids)
+        ))
+        names, others = [], []
+        for stop in map(stops.get, self._ids):
+            names.append(normalise(stop.name or ''))
+            others.append(normalise(' '.join(filter(None, [stop.street, stop.address_no, stop.code, *stop.search]))))
+        # Text idx spans [starts[idx], starts[idx + 1] - 1) of its joined string; words never contain '\n'.
+        self._names, self._others = ('\n'.join(texts) + '\n' for texts in (names, others))
+        self._starts = tuple(
+            array('q', accumulate((len(text) + 1 for text in texts), initial=0)) for texts in (names, others)
+        )
+
+    @classmethod
+    def from_net(cls, net):
+        """
+        Indexes the stops of a bus network.
+        """
+        return cls(net.nodes)
+
+    def nearest(self, lat: float, lng: float, k: int = 1) -> list[tuple[Stop, float]]:
+        """
+        Returns the k stops nearest to a WGS84 position, with their distances in metres.
+        """
+        x, y = map(float, wgs84_to_vn2000(lat, lng))
+        stops = [self._stops[self._ids[idx]] for idx in self._tree.nearest((x, y, x, y), k)]
+        # Ties may return more than k stops.
+        return sorted(
+            ((stop, math.dist((x, y), tuple(map(float, stop.coord)))) for stop in stops),
+            key=lambda item: item[1]
+        )[:k]
+
+    def search(self, query: str, limit: int = 10) -> list[Stop]:
+        """
+        Returns the stops best matching a text query, at most limit of them.
+        """
+        query = normalise(query).strip()
+        words = query.split()
+        if not words:
+            return []
+
+        in_names = {word: self._find(self._names, self._starts[0], word) for word in {query, *words}}
+        candidates = set.intersection(*(
+            in_names[word] | self._find(self._others, self._starts[1], word) for word in words
+        )) | in_names[query]
+
+        scored = []
+        names, starts = self._names, self._starts[0]
+        for idx in candidates:
+            name = names[starts[idx] : starts[idx + 1] - 1]
+            in_name = sum(idx in in_names[word] for word in words)
+            at_start = sum(any(token.startswith(word) for token in name.split()) for word in words)
+            scored.append((-(query in name), -name.startswith(query), -at_start, -in_name, len(name), idx))
+        scored.sort()
+        return [self._stops[self._ids[item[-1]]] for item in scored[:limit]]
+
+    @staticmethod
+    def _find(texts: str, starts: array, word: str) -> set[int]:
+        """
+        Returns the indices of the texts of a joined string containing a word.
+        """
+        found, pos = set(), texts.find(word)
+        while pos != -1:
+            idx = bisect_right(starts, pos) - 1
+            found.add(idx)
+            pos = texts.find(word, starts[idx + 1])
+        return found
+
+    def __contains__(self, stop_id: int) -> bool:
+        return stop_id in self._stops
+
+    def __len__(self):
+        return len(self._ids)